@@ -0,0 +1,175 @@
+"""
+Admission control for the SymptoCheck services.
+
+Requests are admitted into per-app pools by endpoint: "expensive" endpoints
+(those calling Gemini or Deepgram) and everything else ("cheap"), so health
+checks and static endpoints keep their own capacity when the heavy ones are
+saturated. A pool runs at most `max_in_flight` requests and lets at most
+`max_queue` more wait up to `queue_timeout` seconds for a slot. Anything
+beyond that is rejected at once with a 503 and a Retry-After computed from
+the pool's recent service times and backlog.
+
+Upstream rate limits surface as UpstreamRateLimited, a 429 carrying the
+upstream's Retry-After.
+
+Environment variables (per pool, e.g. ADMISSION_EXPENSIVE_MAX):
+    ADMISSION_<POOL>_MAX       requests in flight (expensive 8, cheap 32, voice 16)
+    ADMISSION_<POOL>_QUEUE     requests waiting (expensive 16, cheap 64, voice 0)
+    ADMISSION_QUEUE_TIMEOUT    seconds a request may wait for a slot (5)
+"""
+import math
+import os
+import threading
+import time
+
+from flask import g, jsonify, request
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+from metrics import counter, gauge
+
+POOL_DEFAULTS = {
+    "expensive": (8, 16),
+    "cheap": (32, 64),
+    "voice": (16, 0),
+}
+
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+
+ADMISSION_IN_FLIGHT = gauge(
+    "symptocheck_admission_in_flight",
+    "Requests admitted and running, by pool.",
+    ("service", "pool"),
+)
+ADMISSION_QUEUED = gauge(
+    "symptocheck_admission_queued",
+    "Requests waiting for a slot, by pool.",
+    ("service", "pool"),
+)
+ADMISSION_REJECTED = counter(
+    "symptocheck_admission_rejected_total",
+    "Requests rejected by admission control or upstream rate limits.",
+    ("service", "pool", "status"),
+)
+
+
+class UpstreamRateLimited(TooManyRequests):
+    """An upstream API answered 429; callers should back off for `retry_after` seconds."""
+
+    def __init__(self, upstream, retry_after=None):
+        self.upstream = upstream
+        super().__init__(description=f"{upstream} rate limit exceeded", retry_after=retry_after or MIN_RETRY_AFTER)
+
+
+def retry_after_from(response, default=MIN_RETRY_AFTER):
+    """Seconds from an upstream response's Retry-After header, if it is numeric."""
+    value = getattr(response, "headers", {}).get("Retry-After")
+    try:
+        return max(MIN_RETRY_AFTER, min(MAX_RETRY_AFTER, int(float(value))))
+    except (TypeError, ValueError):
+        return default
+
+
+class PoolFull(ServiceUnavailable):
+    def __init__(self, pool, retry_after):
+        super().__init__(description=f"Server busy ({pool} capacity reached), please retry", retry_after=retry_after)
+
+
+class AdmissionPool:
+    """Bounded concurrency with a bounded, time-limited wait queue."""
+
+    def __init__(self, name, max_in_flight, max_queue, queue_timeout):
+        self.name = name
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        # Exponentially weighted mean service time, seeded with a guess
+        self._service_time = 1.0
+        self._condition = threading.Condition()
+
+    def retry_after(self):
+        """Seconds until the current backlog should have drained."""
+        backlog = self.queued + 1
+        estimate = self._service_time * backlog / self.max_in_flight
+        return max(MIN_RETRY_AFTER, min(MAX_RETRY_AFTER, math.ceil(estimate)))
+
+    def acquire(self):
+        """Take a slot, waiting in the queue if allowed; raises PoolFull otherwise."""
+        with self._condition:
+            if self.in_flight < self.max_in_flight and not self.queued:
+                self.in_flight += 1
+                return
+            if self.queued >= self.max_queue:
+                raise PoolFull(self.name, self.retry_after())
+
+            self.queued += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._condition.wait(remaining):
+                        if self.in_flight >= self.max_in_flight:
+                            raise PoolFull(self.name, self.retry_after())
+                self.in_flight += 1
+            finally:
+                self.queued -= 1
+
+    def release(self, service_time):
+        with self._condition:
+            self.in_flight -= 1
+            self._service_time += 0.2 * (service_time - self._service_time)
+            self._condition.notify()
+
+
+def _pool_settings(name):
+    max_in_flight, max_queue = POOL_DEFAULTS.get(name, POOL_DEFAULTS["cheap"])
+    prefix = f"ADMISSION_{name.upper()}"
+    return (
+        int(os.getenv(f"{prefix}_MAX", max_in_flight)),
+        int(os.getenv(f"{prefix}_QUEUE", max_queue)),
+        float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 5)),
+    )
+
+
+def instrument_admission(app, service, pools_by_endpoint):
+    """
+    Admit every request of `app` through the pool named for its endpoint in
+    `pools_by_endpoint` (default "cheap"). Returns the pools by name.
+    """
+    names = {"cheap", *pools_by_endpoint.values()}
+    pools = {name: AdmissionPool(name, *_pool_settings(name)) for name in names}
+
+    ADMISSION_IN_FLIGHT.set_function(lambda: {(service, p.name): p.in_flight for p in pools.values()})
+    ADMISSION_QUEUED.set_function(lambda: {(service, p.name): p.queued for p in pools.values()})
+
+    @app.before_request
+    def _admit():
+        pool = pools[pools_by_endpoint.get(request.endpoint, "cheap")]
+        try:
+            pool.acquire()
+        except PoolFull:
+            ADMISSION_REJECTED.inc(service=service, pool=pool.name, status=503)
+            raise
+        g._admission = (pool, time.perf_counter())
+
+    @app.teardown_request
+    def _release(error=None):
+        admitted = g.pop("_admission", None)
+        if admitted is not None:
+            pool, start = admitted
+            pool.release(time.perf_counter() - start)
+
+    @app.errorhandler(TooManyRequests)
+    @app.errorhandler(ServiceUnavailable)
+    def _overloaded(error):
+        if isinstance(error, UpstreamRateLimited):
+            pool = pools_by_endpoint.get(request.endpoint, "cheap")
+            ADMISSION_REJECTED.inc(service=service, pool=pool, status=429)
+        response = jsonify({"error": error.description, "retry_after": error.retry_after})
+        response.status_code = error.code
+        response.headers["Retry-After"] = str(error.retry_after)
+        return response
+
+    return pools
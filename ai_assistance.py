@@ -1,44 +1,43 @@
-from flask import Flask, request, jsonify, render_template
-import logging
+from flask import Blueprint, current_app, request, jsonify, render_template
 from datetime import datetime, timedelta
 import os
 import json
 import re
 from typing import List, Dict, Optional, Tuple, Any
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from collections import defaultdict
-import google.generativeai as genai
 from functools import lru_cache
 import hashlib
+import threading
 from dotenv import load_dotenv
 from uuid import uuid4
 import asyncio
 from enum import Enum
+from app_logging import get_logger
+from metrics import (ACTIVE_CONVERSATIONS, record_cache_lookup, record_upstream_error,
+                     time_stage, track_cache, upstream_status)
+from tracing import span
+from compression import gzipped
+from gemini_client import generative_model
+from app_factory import Service, build_app
 
 load_dotenv()
 
 # Enhanced configuration
 GEMINI_API_KEY = os.environ.get("Gemini_API", "")
-genai.configure(api_key=GEMINI_API_KEY)
 
-app = Flask(__name__, template_folder="templates")
-from flask_cors import CORS
-CORS(app)
+# Routes are served by the standalone app below, or mounted under /assistant by app_factory
+bp = Blueprint("medical_assistant", __name__, template_folder="templates")
 
-# Enhanced logging configuration
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("medical_assistant.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger("medical_assistant")
+# Enhanced logging configuration: structured JSON records, written to
+# medical_assistant.log by a background thread (see app_logging)
+logger = get_logger("medical_assistant")
 
 # In-memory conversation state
 CONVERSATIONS = {}
 
+SERVICE = "medical_assistant"
+
 class ConversationStage(Enum):
     GREETING = "greeting"
     SYMPTOM_COLLECTION = "symptom_collection"
@@ -91,13 +90,44 @@ class ConversationState:
     follow_up_questions: List[str]
     created_at: datetime
     last_updated: datetime
+    # Sync cursor, bumped on every change: history entries carry the revision
+    # they were added at ("seq") and field_revisions the last change of each
+    # field, so /conversation/<id>?since=<revision> can send only what changed.
+    # A reset starts a new conversation whose revisions count from 0 again;
+    # the epoch tells its cursors apart from those of the old one.
+    revision: int = 0
+    field_revisions: Dict[str, int] = field(default_factory=dict)
+    epoch: str = field(default_factory=lambda: uuid4().hex[:16])
+
+    def add_message(self, role: str, content: str):
+        self.revision += 1
+        self.conversation_history.append({
+            "role": role,
+            "content": content,
+            "timestamp": datetime.now().isoformat(),
+            "seq": self.revision
+        })
+
+    def mark_changed(self, *fields: str):
+        self.revision += 1
+        for name in fields:
+            self.field_revisions[name] = self.revision
 
 class EnhancedMedicalChatbot:
     def __init__(self):
-        self.model = genai.GenerativeModel('gemini-pro')
+        self.model = generative_model('gemini-pro')
         self.symptom_extraction_prompt = self._build_symptom_extraction_prompt()
         self.analysis_prompt = self._build_analysis_prompt()
         
+    def _generate_content(self, prompt: str):
+        """Call Gemini, recording latency and upstream errors"""
+        try:
+            with time_stage(SERVICE, "llm"):
+                return self.model.generate_content(prompt)
+        except Exception as e:
+            record_upstream_error(SERVICE, "gemini", upstream_status(e))
+            raise
+        
     def _build_symptom_extraction_prompt(self) -> str:
         return """
         You are an expert medical triage assistant. Your task is to extract structured information from patient conversations.
@@ -170,11 +200,7 @@ class EnhancedMedicalChatbot:
         conversation = self._get_or_create_conversation(session_id)
         
         # Add user message to history
-        conversation.conversation_history.append({
-            "role": "user", 
-            "content": user_message,
-            "timestamp": datetime.now().isoformat()
-        })
+        conversation.add_message("user", user_message)
         
         # Extract information from user message
         extracted_info = await self._extract_information(user_message, conversation)
@@ -184,11 +210,7 @@ class EnhancedMedicalChatbot:
         response = await self._generate_response(conversation, user_message)
         
         # Add assistant response to history
-        conversation.conversation_history.append({
-            "role": "assistant",
-            "content": response["message"],
-            "timestamp": datetime.now().isoformat()
-        })
+        conversation.add_message("assistant", response["message"])
         
         conversation.last_updated = datetime.now()
         CONVERSATIONS[session_id] = conversation
@@ -200,11 +222,7 @@ class EnhancedMedicalChatbot:
         conversation = self._get_or_create_conversation(session_id)
         
         # Add user message to history
-        conversation.conversation_history.append({
-            "role": "user", 
-            "content": user_message,
-            "timestamp": datetime.now().isoformat()
-        })
+        conversation.add_message("user", user_message)
         
         # Extract information from user message
         extracted_info = self._extract_information_sync(user_message, conversation)
@@ -214,19 +232,21 @@ class EnhancedMedicalChatbot:
         response = self._generate_response_sync(conversation, user_message)
         
         # Add assistant response to history
-        conversation.conversation_history.append({
-            "role": "assistant",
-            "content": response["message"],
-            "timestamp": datetime.now().isoformat()
-        })
+        conversation.add_message("assistant", response["message"])
         
         conversation.last_updated = datetime.now()
         CONVERSATIONS[session_id] = conversation
         
         return response
     
+    def _generate_response_sync(self, conversation: ConversationState, user_message: str) -> Dict[str, Any]:
+        """Synchronous version of _generate_response"""
+        # The stage handlers never await anything, so a private event loop is cheap
+        return asyncio.run(self._generate_response(conversation, user_message))
+    
     def _get_or_create_conversation(self, session_id: str) -> ConversationState:
         """Get existing conversation or create new one"""
+        record_cache_lookup("conversations", session_id in CONVERSATIONS)
         if session_id not in CONVERSATIONS:
             CONVERSATIONS[session_id] = ConversationState(
                 session_id=session_id,
@@ -258,7 +278,7 @@ class EnhancedMedicalChatbot:
             Extract and return structured information in JSON format:
             """
             
-            response = self.model.generate_content(prompt)
+            response = self._generate_content(prompt)
             
             # Parse JSON response
             try:
@@ -275,8 +295,9 @@ class EnhancedMedicalChatbot:
     def _extract_information_sync(self, message: str, conversation: ConversationState) -> Dict[str, Any]:
         """Synchronous version of information extraction"""
         try:
-            context = self._build_conversation_context(conversation)
-            prompt = f"""
+            with span("prompt"):
+                context = self._build_conversation_context(conversation)
+                prompt = f"""
             {self.symptom_extraction_prompt}
             
             CONVERSATION CONTEXT:
@@ -288,7 +309,7 @@ class EnhancedMedicalChatbot:
             Extract and return structured information in JSON format:
             """
             
-            response = self.model.generate_content(prompt)
+            response = self._generate_content(prompt)
             
             # Parse JSON response
             try:
@@ -347,6 +368,7 @@ class EnhancedMedicalChatbot:
     def _update_conversation_state(self, conversation: ConversationState, extracted_info: Dict[str, Any]):
         """Update conversation state with extracted information"""
         # Update symptoms
+        symptom_count = len(conversation.symptoms)
         for symptom_data in extracted_info.get("symptoms", []):
             symptom_detail = SymptomDetail(
                 symptom=symptom_data.get("symptom", ""),
@@ -357,6 +379,8 @@ class EnhancedMedicalChatbot:
                 alleviating_factors=symptom_data.get("alleviating_factors", [])
             )
             conversation.symptoms.append(symptom_detail)
+        if len(conversation.symptoms) != symptom_count:
+            conversation.mark_changed("symptoms")
         
         # Update patient profile
         patient_info = extracted_info.get("patient_info", {})
@@ -368,6 +392,8 @@ class EnhancedMedicalChatbot:
             conversation.patient_profile.medical_history.extend(patient_info["medical_history"])
         if patient_info.get("medications"):
             conversation.patient_profile.current_medications.extend(patient_info["medications"])
+        if any(patient_info.get(key) for key in ("age", "gender", "medical_history", "medications")):
+            conversation.mark_changed("patient_profile")
         
         # Update extracted info
         conversation.extracted_info.update(extracted_info)
@@ -377,6 +403,7 @@ class EnhancedMedicalChatbot:
     
     def _update_conversation_stage(self, conversation: ConversationState):
         """Update conversation stage based on collected information"""
+        previous_stage = conversation.stage
         if len(conversation.symptoms) == 0:
             conversation.stage = ConversationStage.SYMPTOM_COLLECTION
         elif len(conversation.symptoms) < 3:
@@ -387,6 +414,8 @@ class EnhancedMedicalChatbot:
             conversation.stage = ConversationStage.ANALYSIS
         else:
             conversation.stage = ConversationStage.FOLLOW_UP
+        if conversation.stage != previous_stage:
+            conversation.mark_changed("stage")
     
     async def _generate_response(self, conversation: ConversationState, user_message: str) -> Dict[str, Any]:
         """Generate appropriate response based on conversation stage"""
@@ -429,7 +458,7 @@ class EnhancedMedicalChatbot:
             Keep the response conversational and supportive.
             """
             
-            response = self.model.generate_content(prompt)
+            response = self._generate_content(prompt)
             
             return {
                 "message": response.text,
@@ -463,7 +492,7 @@ class EnhancedMedicalChatbot:
             Be specific and medically relevant in your questioning.
             """
             
-            response = self.model.generate_content(prompt)
+            response = self._generate_content(prompt)
             
             return {
                 "message": response.text,
@@ -496,7 +525,7 @@ class EnhancedMedicalChatbot:
             Keep it friendly and explain why this information helps with assessment.
             """
             
-            response = self.model.generate_content(prompt)
+            response = self._generate_content(prompt)
             
             return {
                 "message": response.text,
@@ -562,7 +591,7 @@ class EnhancedMedicalChatbot:
             Make your explanation educational and easy to understand while being medically accurate.
             """
             
-            response = self.model.generate_content(prompt)
+            response = self._generate_content(prompt)
             
             # Determine urgency level
             urgency = self._assess_urgency(conversation.symptoms)
@@ -596,7 +625,7 @@ class EnhancedMedicalChatbot:
             Keep it brief and focused on their needs.
             """
             
-            response = self.model.generate_content(prompt)
+            response = self._generate_content(prompt)
             
             return {
                 "message": response.text,
@@ -707,10 +736,29 @@ class EnhancedMedicalChatbot:
         
         return "low"
 
-# Global chatbot instance
-medical_chatbot = EnhancedMedicalChatbot()
+# Global chatbot instance, created on first use so importing the service stays cheap
+_medical_chatbot = None
+_medical_chatbot_lock = threading.Lock()
 
-@app.route("/", methods=["GET"])
+def get_medical_chatbot() -> EnhancedMedicalChatbot:
+    global _medical_chatbot
+    if _medical_chatbot is None:
+        with _medical_chatbot_lock:
+            if _medical_chatbot is None:
+                _medical_chatbot = EnhancedMedicalChatbot()
+    return _medical_chatbot
+
+def _conversations_by_stage():
+    counts = {(stage.value,): 0 for stage in ConversationStage}
+    for conversation in list(CONVERSATIONS.values()):
+        counts[(conversation.stage.value,)] += 1
+    return counts
+
+# Conversation counts, served at /metrics
+track_cache("conversations", CONVERSATIONS)
+ACTIVE_CONVERSATIONS.set_function(_conversations_by_stage)
+
+@bp.route("/", methods=["GET"])
 def home():
     return jsonify({
         "message": "Enhanced AI Medical Chatbot with Explainable AI v4.0",
@@ -725,7 +773,7 @@ def home():
         "status": "active"
     })
 
-@app.route("/chat", methods=["POST"])
+@bp.route("/chat", methods=["POST"])
 def enhanced_chat():
     try:
         data = request.json
@@ -741,7 +789,7 @@ def enhanced_chat():
         logger.info(f"Processing message for session {session_id}: {user_message[:100]}...")
         
         # Process message with enhanced chatbot (synchronous version)
-        response = medical_chatbot.process_message_sync(session_id, user_message)
+        response = get_medical_chatbot().process_message_sync(session_id, user_message)
         
         # Get conversation state
         conversation = CONVERSATIONS.get(session_id)
@@ -756,6 +804,8 @@ def enhanced_chat():
         
         # Add additional context based on stage
         if conversation:
+            response_data["revision"] = conversation.revision
+            response_data["epoch"] = conversation.epoch
             response_data["conversation_summary"] = {
                 "symptoms_count": len(conversation.symptoms),
                 "has_patient_info": bool(conversation.patient_profile.age),
@@ -766,36 +816,87 @@ def enhanced_chat():
                 response_data["analysis_complete"] = True
                 response_data["patient_summary"] = response.get("patient_summary", "")
         
-        return jsonify(response_data)
+        with span("serialize"):
+            return jsonify(response_data)
         
     except Exception as e:
         logger.error(f"Enhanced chat error: {str(e)}")
         return jsonify({
             "error": "I'm having trouble processing your message right now. Could you please try again?",
             "session_id": session_id,
-            "technical_error": str(e) if app.debug else None
+            "technical_error": str(e) if current_app.debug else None
         }), 500
 
-@app.route("/conversation/<session_id>", methods=["GET"])
+# Fields sent by /conversation/<session_id> when they changed after the cursor
+CONVERSATION_FIELDS = {
+    "stage": lambda c: c.stage.value,
+    "symptoms": lambda c: [asdict(s) for s in c.symptoms],
+    "patient_profile": lambda c: asdict(c.patient_profile),
+    "diagnosis_results": lambda c: c.diagnosis_results,
+}
+
+def _conversation_delta(conversation: ConversationState, since: int) -> Dict[str, Any]:
+    """History entries and fields changed after revision `since`"""
+    history = conversation.conversation_history
+    # History is append-only in revision order: walk back to the cursor
+    start = len(history)
+    while start > 0 and history[start - 1].get("seq", 0) > since:
+        start -= 1
+    delta = {
+        "session_id": conversation.session_id,
+        "revision": conversation.revision,
+        "epoch": conversation.epoch,
+        "since": since,
+        "full": False,
+        "created_at": conversation.created_at.isoformat(),
+        "last_updated": conversation.last_updated.isoformat(),
+        "history_offset": start,
+        "conversation_history": history[start:]
+    }
+    for name, serialize in CONVERSATION_FIELDS.items():
+        if conversation.field_revisions.get(name, 0) > since:
+            delta[name] = serialize(conversation)
+    return delta
+
+@bp.route("/conversation/<session_id>", methods=["GET"])
+@gzipped
 def get_conversation(session_id: str):
-    """Get conversation history"""
+    """
+    Get conversation history. With ?since=<revision>&epoch=<epoch> (the
+    "revision" and "epoch" of an earlier response) only history entries and
+    fields changed since then are returned. A cursor from another epoch
+    (i.e. from before a reset), without an epoch or ahead of the
+    conversation gets the full state, which the client must replace its
+    own with.
+    """
     conversation = CONVERSATIONS.get(session_id)
+    record_cache_lookup("conversations", conversation is not None)
     
     if not conversation:
         return jsonify({"error": "Conversation not found"}), 404
     
-    return jsonify({
-        "session_id": session_id,
-        "stage": conversation.stage.value,
-        "created_at": conversation.created_at.isoformat(),
-        "last_updated": conversation.last_updated.isoformat(),
-        "conversation_history": conversation.conversation_history,
-        "symptoms": [asdict(s) for s in conversation.symptoms],
-        "patient_profile": asdict(conversation.patient_profile),
-        "diagnosis_results": conversation.diagnosis_results
-    })
+    since = request.args.get("since", type=int)
+    if (since is not None and request.args.get("epoch") == conversation.epoch
+            and 0 <= since <= conversation.revision):
+        with span("serialize"):
+            return jsonify(_conversation_delta(conversation, since))
+    
+    with span("serialize"):
+        return jsonify({
+            "session_id": session_id,
+            "revision": conversation.revision,
+            "epoch": conversation.epoch,
+            "full": True,
+            "stage": conversation.stage.value,
+            "created_at": conversation.created_at.isoformat(),
+            "last_updated": conversation.last_updated.isoformat(),
+            "conversation_history": conversation.conversation_history,
+            "symptoms": [asdict(s) for s in conversation.symptoms],
+            "patient_profile": asdict(conversation.patient_profile),
+            "diagnosis_results": conversation.diagnosis_results
+        })
 
-@app.route("/conversation/<session_id>/reset", methods=["POST"])
+@bp.route("/conversation/<session_id>/reset", methods=["POST"])
 def reset_conversation(session_id: str):
     """Reset conversation"""
     if session_id in CONVERSATIONS:
@@ -806,7 +907,7 @@ def reset_conversation(session_id: str):
         "session_id": session_id
     })
 
-@app.route("/health-check", methods=["GET"])
+@bp.route("/health-check", methods=["GET"])
 def health_check():
     return jsonify({
         "status": "healthy",
@@ -816,7 +917,7 @@ def health_check():
         "ai_enabled": bool(GEMINI_API_KEY)
     })
 
-@app.route("/chat-ui", methods=["GET"])
+@bp.route("/chat-ui", methods=["GET"])
 def chat_ui():
     return render_template("enhanced_chat.html")
 
@@ -835,7 +936,7 @@ def cleanup_old_conversations():
     logger.info(f"Cleaned up {len(sessions_to_remove)} old conversations")
 
 # Add cleanup middleware
-@app.before_request
+@bp.before_request
 def before_request():
     """Cleanup old conversations before each request"""
     import random
@@ -843,7 +944,17 @@ def before_request():
     if random.random() < 0.05:
         cleanup_old_conversations()
 
+service = Service(
+    "assistant", bp, "/assistant",
+    # Chat turns call Gemini; history, reset and health checks keep their own capacity
+    admission_pools={"enhanced_chat": "expensive"},
+    warmup=get_medical_chatbot,
+)
+
 if __name__ == "__main__":
+    # Standalone app serving only this service at the root
+    app = build_app([service], prefixed=False, name=SERVICE, import_name=__name__)
+
     port = int(os.environ.get("PORT", 8000))
     logger.info(f"Starting Enhanced Medical Chatbot v4.0 on port {port}")
     app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,201 @@
+"""
+One Flask app serving any subset of the SymptoCheck services.
+
+Each service module defines a Blueprint and a `service` (a Service
+describing it). create_app() registers the selected services under their
+URL prefixes on one app with the shared per-request instrumentation
+(metrics, tracing, profiling, admission control), upload limits and error
+handlers, so one pooled process per core can serve everything. Clients and
+caches are shared through the modules they live in (gemini_client,
+deepgram_client, stt_cache, metrics).
+
+Running a service module (`python medical_chatbot.py`) still serves that
+service alone without a prefix; importing one builds no app, so only
+create_app() or build_app() do.
+
+Upstream SDKs and clients are loaded on first use, so workers start fast.
+GET /ready runs each service's warmup hook in the background and answers
+503 until it has finished, so a readiness probe keeps traffic away until
+the first request will not pay for the imports. Set WARMUP_ON_START=1 to
+begin warming up with the first request of any kind instead.
+
+Run all services:  python app_factory.py
+                   gunicorn 'app_factory:create_app()'
+
+Environment variables:
+    SERVICES   comma-separated services to serve: medical, wellness,
+               assistant (all)
+    PORT       port for `python app_factory.py` (8080)
+    WARMUP_ON_START   start the warmup on the first request, not the first
+                      /ready probe (0)
+"""
+import importlib
+import logging
+import os
+import threading
+import time
+
+from flask import Flask, jsonify
+
+from admission import instrument_admission
+from app_logging import configure_logging
+from metrics import instrument_app
+from profiling import instrument_profiling
+from tracing import instrument_tracing
+from uploads import configure_uploads
+
+logger = logging.getLogger(__name__)
+
+# Service name -> module defining it
+SERVICE_MODULES = {
+    "medical": "medical_chatbot",
+    "wellness": "healty_lifestyle",
+    "assistant": "ai_assistance",
+}
+
+DEFAULT_MAX_UPLOAD = 10 * 1024 * 1024  # 10MB
+
+# create_app() logs to symptocheck.log; standalone services to their own file
+LOG_SERVICE = "symptocheck"
+
+
+class Service:
+    """
+    What create_app needs to mount one service: its blueprint, URL prefix,
+    admission pools by endpoint (endpoint names without the blueprint), the
+    largest upload it accepts and a warmup hook that loads its upstream
+    clients.
+    """
+
+    def __init__(self, name, blueprint, prefix, admission_pools=None, max_upload=None, warmup=None):
+        self.name = name
+        self.blueprint = blueprint
+        self.prefix = prefix
+        self.admission_pools = admission_pools or {}
+        self.max_upload = max_upload
+        self.warmup = warmup
+
+
+class Warmup:
+    """Runs the services' warmup hooks once, in a background thread."""
+
+    def __init__(self, services):
+        self.services = services
+        self.status = "cold"  # cold, warming, ready, failed
+        self.error = None
+        self.seconds = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start warming up unless that is under way or done (a failed warmup is retried)."""
+        with self._lock:
+            if self.status in ("warming", "ready"):
+                return
+            self.status = "warming"
+        threading.Thread(target=self.run, name="warmup", daemon=True).start()
+
+    def run(self):
+        start = time.perf_counter()
+        self.status = "warming"
+        try:
+            for service in self.services:
+                if service.warmup is not None:
+                    service.warmup()
+        except Exception as e:
+            logger.exception("❌ Warmup failed: %s", e)
+            self.error = str(e)
+            self.status = "failed"
+            return
+        self.seconds = time.perf_counter() - start
+        self.error = None
+        self.status = "ready"
+        logger.info("🔥 Warmed up %s in %.2fs", ", ".join(s.name for s in self.services), self.seconds)
+
+    def to_dict(self):
+        data = {"status": self.status}
+        if self.seconds is not None:
+            data["warmup_seconds"] = round(self.seconds, 3)
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+def build_app(services, prefixed=True, name="symptocheck", import_name=__name__):
+    """
+    A Flask app serving `services`, each under its prefix when `prefixed`.
+    Request metrics are labelled with `name`.
+    """
+    app = Flask(import_name, template_folder="templates")
+    from flask_cors import CORS
+    CORS(app)
+
+    # Cap request bodies while they are read and spool large uploads to disk
+    max_upload = max((s.max_upload for s in services if s.max_upload), default=DEFAULT_MAX_UPLOAD)
+    configure_uploads(app, max_upload)
+
+    pools = {}
+    for service in services:
+        app.register_blueprint(service.blueprint, url_prefix=service.prefix if prefixed else None)
+        pools.update({f"{service.blueprint.name}.{endpoint}": pool
+                      for endpoint, pool in service.admission_pools.items()})
+
+    # Request latency, in-flight requests and cache sizes, served at /metrics
+    instrument_app(app, name)
+    instrument_tracing(app, name)
+    instrument_profiling(app, name)
+    # Gemini/Deepgram endpoints get their own bounded capacity; the rest stays responsive
+    instrument_admission(app, name, pools)
+
+    warmup = Warmup(services)
+    app.extensions["warmup"] = warmup
+
+    if os.getenv("WARMUP_ON_START", "0") == "1":
+        @app.before_request
+        def _start_warmup():
+            if warmup.status == "cold":
+                warmup.start()
+
+    @app.route("/ready", methods=["GET"])
+    def ready():
+        """Readiness probe: 200 once the upstream clients are loaded, else 503."""
+        warmup.start()
+        return jsonify(warmup.to_dict()), 200 if warmup.status == "ready" else 503
+
+    @app.errorhandler(400)
+    def bad_request(error):
+        return jsonify({"error": error.description}), 400
+
+    @app.errorhandler(404)
+    def not_found(error):
+        return jsonify({"error": "Endpoint not found"}), 404
+
+    @app.errorhandler(500)
+    def internal_error(error):
+        return jsonify({"error": "Internal server error"}), 500
+
+    @app.errorhandler(413)
+    def file_too_large(error):
+        return jsonify({"error": f"File too large. Maximum size: {max_upload // (1024*1024)}MB"}), 413
+
+    return app
+
+
+def create_app(names=None):
+    """The app serving the named services (default: SERVICES, else all)."""
+    if names is None:
+        names = [n.strip() for n in os.getenv("SERVICES", ",".join(SERVICE_MODULES)).split(",") if n.strip()]
+    unknown = [n for n in names if n not in SERVICE_MODULES]
+    if unknown:
+        raise ValueError(f"Unknown services: {', '.join(unknown)} (choose from {', '.join(SERVICE_MODULES)})")
+
+    # One log file for the combined app; configured before the service
+    # modules are imported, since the first configuration wins
+    configure_logging(LOG_SERVICE)
+    services = [importlib.import_module(SERVICE_MODULES[n]).service for n in names]
+    logger.info("🧩 Serving %s", ", ".join(f"{s.name} at {s.prefix}" for s in services))
+    return build_app(services)
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 8080))
+    create_app().run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
@@ -0,0 +1,155 @@
+"""
+Shared logging setup for the SymptoCheck services.
+
+Records are written as one JSON object per line by a background thread:
+request threads only put the record on a queue, and a QueueListener does the
+formatting and the file/stream I/O.
+
+Environment variables:
+    LOG_LEVEL          default level for all loggers (INFO)
+    LOG_LEVELS         per-logger overrides, e.g. "healty_lifestyle.tts=DEBUG,werkzeug=WARNING"
+    LOG_FILE           log file path (defaults to "<service>.log", empty disables the file)
+    LOG_MAX_BYTES      rotate the log file at this size (10 MB)
+    LOG_BACKUP_COUNT   rotated files to keep (5)
+    LOG_SAMPLE_EVERY   keep 1 in N sampled events, e.g. per-chunk TTS debug lines (10)
+    LOG_STDERR         also log to stderr (1)
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed through `extra`.
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects, including `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and key != "sample":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep one in `every` records for each sample key.
+
+    Records opt in with extra={"sample": "<key>"}; records without a sample
+    key always pass. Warnings and errors are never sampled away.
+    """
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, every)
+        self._counters = {}
+
+    def filter(self, record):
+        key = getattr(record, "sample", None)
+        if key is None or self.every == 1 or record.levelno >= logging.WARNING:
+            return True
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters.setdefault(key, itertools.count())
+        # itertools.count is atomic under the GIL, so no lock is needed here.
+        return next(counter) % self.every == 0
+
+
+class _FastQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+
+    The stock prepare() runs the full formatter in the calling thread; we only
+    merge the message arguments so the record is safe to hand over.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in (spec or "").split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(service):
+    """
+    Route all logging through the background JSON queue handler.
+    Safe to call from several modules; only the first call installs handlers.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+
+        handlers = []
+        formatter = JsonFormatter()
+
+        log_file = os.getenv("LOG_FILE", f"{service}.log")
+        if log_file:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file,
+                maxBytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+                backupCount=int(os.getenv("LOG_BACKUP_COUNT", 5)),
+                encoding="utf-8",
+                delay=True,
+            )
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+
+        if os.getenv("LOG_STDERR", "1") != "0":
+            stream_handler = logging.StreamHandler()
+            stream_handler.setFormatter(formatter)
+            handlers.append(stream_handler)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _FastQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(int(os.getenv("LOG_SAMPLE_EVERY", 10))))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        for name, level in _parse_levels(os.getenv("LOG_LEVELS")).items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def get_logger(name, service=None):
+    """
+    Return a logger, configuring the shared handlers for `service` (by
+    default the first part of `name`) on first use. Only service
+    entrypoints should call this; library modules use
+    logging.getLogger(__name__), so importing them never picks the log file.
+    """
+    configure_logging(service or name.split(".")[0])
+    return logging.getLogger(name)
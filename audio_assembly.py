@@ -0,0 +1,547 @@
+import struct
+
+# Bitrates in kbps, indexed by the 4-bit bitrate index of the frame header.
+_BITRATES = {
+    # (MPEG-1, layer)
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    # (MPEG-2 / 2.5, layer)
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# Sample rates indexed by the 2-bit version id, then the 2-bit rate index.
+_SAMPLE_RATES = {
+    0: (11025, 12000, 8000),   # MPEG-2.5
+    2: (22050, 24000, 16000),  # MPEG-2
+    3: (44100, 48000, 32000),  # MPEG-1
+}
+
+_LAYERS = {1: 3, 2: 2, 3: 1}  # header layer bits -> layer number
+
+_VBR_TAGS = (b"Xing", b"Info")
+
+
+class Mp3FrameHeader:
+    """
+    Decoded 4-byte MPEG audio frame header.
+    """
+
+    __slots__ = ("raw", "version_id", "layer", "protected", "bitrate", "sample_rate",
+                 "padding", "mono", "frame_length", "samples")
+
+    def __init__(self, raw, version_id, layer, protected, bitrate, sample_rate, padding, mono):
+        self.raw = raw
+        self.version_id = version_id
+        self.layer = layer
+        self.protected = protected
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+        self.padding = padding
+        self.mono = mono
+
+        mpeg1 = version_id == 3
+        if layer == 1:
+            self.samples = 384
+            self.frame_length = (12 * bitrate // sample_rate + padding) * 4
+        elif layer == 2 or mpeg1:
+            self.samples = 1152
+            self.frame_length = 144 * bitrate // sample_rate + padding
+        else:
+            self.samples = 576
+            self.frame_length = 72 * bitrate // sample_rate + padding
+
+    @classmethod
+    def parse(cls, data, offset=0):
+        """
+        Parse the frame header at data[offset:offset + 4], or return None.
+        Free-format frames (bitrate index 0) are not supported.
+        """
+        if offset + 4 > len(data):
+            return None
+        b0, b1, b2, b3 = data[offset], data[offset + 1], data[offset + 2], data[offset + 3]
+        if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+            return None
+
+        version_id = (b1 >> 3) & 0x03
+        layer = _LAYERS.get((b1 >> 1) & 0x03)
+        bitrate_index = b2 >> 4
+        rate_index = (b2 >> 2) & 0x03
+        if version_id == 1 or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+            return None
+
+        bitrate = _BITRATES[(version_id == 3, layer)][bitrate_index] * 1000
+        sample_rate = _SAMPLE_RATES[version_id][rate_index]
+        return cls(
+            raw=bytes((b0, b1, b2, b3)),
+            version_id=version_id,
+            layer=layer,
+            protected=not (b1 & 0x01),
+            bitrate=bitrate,
+            sample_rate=sample_rate,
+            padding=(b2 >> 1) & 0x01,
+            mono=((b3 >> 6) & 0x03) == 3,
+        )
+
+    @property
+    def side_info_end(self):
+        """Offset from the frame start where a Xing/Info tag would begin."""
+        if self.version_id == 3:
+            side_info = 17 if self.mono else 32
+        else:
+            side_info = 9 if self.mono else 17
+        return 4 + (2 if self.protected else 0) + side_info
+
+    def same_stream(self, other):
+        return (self.version_id, self.layer, self.sample_rate) == \
+               (other.version_id, other.layer, other.sample_rate)
+
+
+def _id3v2_size(data):
+    """Size of a leading ID3v2 tag, or 0."""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return min(len(data), 10 + size + footer)
+
+
+def _is_metadata_frame(view, offset, header):
+    """True for Xing/Info/VBRI frames, which carry no audio."""
+    tag_offset = offset + header.side_info_end
+    if bytes(view[tag_offset:tag_offset + 4]) in _VBR_TAGS:
+        return True
+    return bytes(view[offset + 36:offset + 40]) == b"VBRI"
+
+
+def _find_frame(view, start, end):
+    """Offset of the next frame header followed by a consistent frame, or -1."""
+    offset = start
+    while offset + 4 <= end:
+        if view[offset] == 0xFF:
+            header = Mp3FrameHeader.parse(view, offset)
+            if header is not None:
+                following = offset + header.frame_length
+                if following == end:
+                    return offset
+                next_header = Mp3FrameHeader.parse(view, following)
+                if next_header is not None and next_header.same_stream(header):
+                    return offset
+        offset += 1
+    return -1
+
+
+# Silent frames are handed out as slices of one shared block per format
+_SILENCE_BLOCK_FRAMES = 256
+_silence_blocks = {}
+
+
+def silent_frame(header):
+    """
+    A frame that decodes to silence, in the format of `header` (without CRC
+    or padding). Its side info and main data are all zero, so it carries no
+    audio and does not use the bit reservoir. It has the lowest bitrate
+    that leaves room for the side info, which makes the stream VBR.
+    """
+    b0, b1, b2, b3 = header.raw
+    for bitrate_index in range(1, 15):
+        raw = bytes((b0, b1 | 0x01, (bitrate_index << 4) | (b2 & 0x0C), b3))
+        silent = Mp3FrameHeader.parse(raw)
+        if silent.frame_length >= silent.side_info_end:
+            break
+    frame = bytearray(silent.frame_length)
+    frame[:4] = raw
+    return bytes(frame)
+
+
+def _silence_block(header):
+    """Frames of silence for `header`'s format, as (memoryview of the block, frame header)."""
+    key = (header.raw[1], header.raw[2] & 0x0C, header.raw[3])
+    block = _silence_blocks.get(key)
+    if block is None:
+        frame = silent_frame(header)
+        block = _silence_blocks[key] = (memoryview(frame * _SILENCE_BLOCK_FRAMES), Mp3FrameHeader.parse(frame))
+    return block
+
+
+class Mp3Assembly:
+    """
+    Concatenates MP3 files into a single clean MPEG audio stream without copying.
+
+    Each appended file is scanned frame by frame. ID3v1/ID3v2 tags and
+    Xing/Info/VBRI header frames are dropped, and the remaining audio frames
+    are kept as memoryview slices of the original bytes. Duration is summed
+    from the frame headers, so nothing is decoded. When iterated, a single
+    fresh Info/Xing frame describing the whole stream is emitted first, so
+    players see the correct total duration.
+
+    Data that is not recognisable as MPEG audio is kept as-is; in that case no
+    header frame is emitted, since the duration would be wrong.
+    """
+
+    def __init__(self):
+        self._segments = []
+        self._audio_bytes = 0
+        self._frame_count = 0
+        self._samples = 0.0
+        self._bitrates = set()
+        self._first_header = None
+        self._unparsed_segments = 0
+        self._header_frame = None
+
+    def append(self, data):
+        """
+        Add one MP3 file (bytes-like) to the end of the stream.
+        Returns the duration in seconds found in this file.
+        """
+        view = memoryview(data).cast("B")
+        start = _id3v2_size(view)
+        end = len(view)
+        if end - start >= 128 and bytes(view[end - 128:end - 125]) == b"TAG":
+            end -= 128
+
+        offset = _find_frame(view, start, end)
+        if offset < 0:
+            self._add_segment(view[start:end])
+            self._unparsed_segments += 1
+            return 0.0
+
+        duration = 0.0
+        first = True
+        span_start = offset
+        while offset + 4 <= end:
+            header = Mp3FrameHeader.parse(view, offset)
+            if header is None or offset + header.frame_length > end or \
+                    (self._first_header is not None and not header.same_stream(self._first_header)):
+                # Lost sync: keep what we have and look for the next frame.
+                self._add_segment(view[span_start:offset])
+                offset = _find_frame(view, offset + 1, end)
+                if offset < 0:
+                    break
+                span_start = offset
+                continue
+
+            if first and _is_metadata_frame(view, offset, header):
+                offset += header.frame_length
+                span_start = offset
+                first = False
+                continue
+            first = False
+
+            if self._first_header is None:
+                self._first_header = header
+            self._frame_count += 1
+            self._samples += header.samples
+            self._bitrates.add(header.bitrate)
+            duration += header.samples / header.sample_rate
+            offset += header.frame_length
+        else:
+            self._add_segment(view[span_start:offset])
+
+        self._header_frame = None
+        return duration
+
+    def __iadd__(self, data):
+        self.append(data)
+        return self
+
+    def append_silence(self, seconds):
+        """
+        Add `seconds` of silence, rounded to whole frames in the format of
+        the stream's audio, which must already have been appended. Returns
+        the duration added.
+        """
+        header = self._first_header
+        if header is None:
+            raise ValueError("Silence takes its format from the stream; append audio first")
+        frames = round(seconds * header.sample_rate / header.samples)
+        if frames <= 0:
+            return 0.0
+        block, silent = _silence_block(header)
+        remaining = frames
+        while remaining:
+            count = min(remaining, _SILENCE_BLOCK_FRAMES)
+            self._add_segment(block[:count * silent.frame_length])
+            remaining -= count
+        self._frame_count += frames
+        self._samples += frames * header.samples
+        self._bitrates.add(silent.bitrate)
+        self._header_frame = None
+        return frames * header.samples / header.sample_rate
+
+    def _add_segment(self, view):
+        if len(view):
+            self._segments.append(view)
+            self._audio_bytes += len(view)
+
+    @property
+    def frame_count(self):
+        return self._frame_count
+
+    @property
+    def duration_seconds(self):
+        if self._first_header is None:
+            return 0.0
+        return self._samples / self._first_header.sample_rate
+
+    def _build_header_frame(self):
+        """
+        Build an Info (CBR) or Xing (VBR) frame with frame and byte counts,
+        modelled on the first audio frame of the stream.
+        """
+        first = self._first_header
+        if first is None or first.layer != 3 or self._unparsed_segments:
+            return b""
+
+        b0, b1, b2, b3 = first.raw
+        # No CRC and no padding keep the frame layout trivial. The bitrate of
+        # this frame does not matter to players, so pick the first one that
+        # leaves room for the tag.
+        for bitrate_index in range(b2 >> 4, 15):
+            raw = bytes((b0, b1 | 0x01, (bitrate_index << 4) | (b2 & 0x0D), b3))
+            header = Mp3FrameHeader.parse(raw)
+            if header.frame_length >= header.side_info_end + 16:
+                break
+        else:
+            return b""
+        frame = bytearray(header.frame_length)
+        frame[:4] = raw
+
+        tag = b"Info" if len(self._bitrates) == 1 else b"Xing"
+        total_bytes = header.frame_length + self._audio_bytes
+        struct.pack_into(">4sIII", frame, header.side_info_end,
+                         tag, 0x0003, self._frame_count, total_bytes)
+        return bytes(frame)
+
+    def header_frame(self):
+        if self._header_frame is None:
+            self._header_frame = self._build_header_frame()
+        return self._header_frame
+
+    def __len__(self):
+        return len(self.header_frame()) + self._audio_bytes
+
+    def __iter__(self):
+        """Yield the stream as memoryviews, without copying audio data."""
+        header = self.header_frame()
+        if header:
+            yield memoryview(header)
+        yield from self._segments
+
+    def iter_bytes(self, include_header=True):
+        """
+        Yield the stream as bytes, one per segment.
+        WSGI servers only accept bytes, so HTTP responses should use this.
+        Pass include_header=False to get only the audio frames, e.g. when
+        appending to a stream that is already playing.
+        """
+        if not include_header:
+            for view in self._segments:
+                yield view.tobytes()
+            return
+        for view in self:
+            yield view.tobytes()
+
+    def to_bytes(self):
+        return b"".join(self)
+
+
+class WavAssembly:
+    """
+    Concatenates 16-bit PCM (raw, or WAV files whose header is dropped) into
+    one WAV file. The RIFF header is written for the total length, so audio
+    is never copied.
+    """
+
+    def __init__(self, sample_rate=24000, channels=1):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._segments = []
+        self._audio_bytes = 0
+
+    def append(self, data):
+        """
+        Add PCM audio to the end of the file; returns its duration in seconds.
+        """
+        view = memoryview(data).cast("B")
+        if len(view) >= 12 and bytes(view[:4]) == b"RIFF" and bytes(view[8:12]) == b"WAVE":
+            view = _wav_data(view)
+        # Keep whole sample frames, so later segments stay aligned
+        view = view[:len(view) - len(view) % (2 * self.channels)]
+        if len(view):
+            self._segments.append(view)
+            self._audio_bytes += len(view)
+        return len(view) / (2 * self.channels * self.sample_rate)
+
+    def __iadd__(self, data):
+        self.append(data)
+        return self
+
+    @property
+    def duration_seconds(self):
+        return self._audio_bytes / (2 * self.channels * self.sample_rate)
+
+    def header(self):
+        block_align = 2 * self.channels
+        return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + self._audio_bytes, b"WAVE",
+                           b"fmt ", 16, 1, self.channels, self.sample_rate,
+                           self.sample_rate * block_align, block_align, 16,
+                           b"data", self._audio_bytes)
+
+    def __len__(self):
+        return 44 + self._audio_bytes
+
+    def __iter__(self):
+        yield memoryview(self.header())
+        yield from self._segments
+
+    def iter_bytes(self, include_header=True):
+        """Yield the file as bytes; include_header=False yields only the PCM."""
+        if include_header:
+            yield self.header()
+        for view in self._segments:
+            yield view.tobytes()
+
+    def to_bytes(self):
+        return b"".join(self)
+
+
+def _wav_data(view):
+    """The data chunk of a WAV file, or the whole file if it has none."""
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        size = int.from_bytes(view[offset + 4:offset + 8], "little")
+        if chunk_id == b"data":
+            return view[offset + 8:min(len(view), offset + 8 + size)]
+        offset += 8 + size + (size & 1)
+    return view
+
+
+_OGG_PAGE = struct.Struct("<4sBBqIIIB")  # capture, version, type, granule, serial, sequence, crc, segments
+_OPUS_RATE = 48000
+
+
+def _ogg_crc_table():
+    table = []
+    for index in range(256):
+        crc = index << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+
+_OGG_CRC_TABLE = _ogg_crc_table()
+
+
+def _ogg_crc(data):
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _OGG_CRC_TABLE[(crc >> 24) ^ byte]
+    return crc
+
+
+def _ogg_pages(view):
+    """(offset, length, granule, serial) of each Ogg page, or None if `view` is not Ogg."""
+    pages = []
+    offset = 0
+    while offset < len(view):
+        if offset + _OGG_PAGE.size > len(view) or bytes(view[offset:offset + 4]) != b"OggS":
+            return None
+        _, _, _, granule, serial, _, _, segments = _OGG_PAGE.unpack_from(view, offset)
+        table_end = offset + _OGG_PAGE.size + segments
+        if table_end > len(view):
+            return None
+        length = table_end - offset + sum(view[offset + _OGG_PAGE.size:table_end])
+        if offset + length > len(view):
+            return None
+        pages.append((offset, length, granule, serial))
+        offset += length
+    return pages
+
+
+class OggOpusAssembly:
+    """
+    Chains Ogg Opus files into one physical Ogg stream.
+
+    Each appended file stays a complete logical stream, which the Ogg format
+    allows to follow one another ("chaining"); nothing is re-encoded. Chained
+    streams must have distinct serial numbers, so a file reusing an earlier
+    serial is renumbered (and its page checksums recomputed). Duration is read
+    from each stream's final granule position less its pre-skip.
+    """
+
+    def __init__(self):
+        self._segments = []
+        self._audio_bytes = 0
+        self._serials = set()
+        self._samples = 0
+
+    def append(self, data):
+        """Add one Ogg Opus file to the end of the chain; returns its duration in seconds."""
+        view = memoryview(data).cast("B")
+        pages = _ogg_pages(view)
+        if not pages:
+            self._add_segment(view)
+            return 0.0
+
+        serials = {serial for _, _, _, serial in pages}
+        if serials & self._serials:
+            view = self._renumber(view, pages)
+            serials = {serial for _, _, _, serial in _ogg_pages(view)}
+        self._serials |= serials
+        self._add_segment(view)
+
+        first_offset, first_length = pages[0][:2]
+        first_page = bytes(view[first_offset:first_offset + first_length])
+        head = first_page.find(b"OpusHead")
+        pre_skip = struct.unpack_from("<H", first_page, head + 10)[0] if head >= 0 else 0
+        samples = max(0, max(granule for _, _, granule, _ in pages) - pre_skip)
+        self._samples += samples
+        return samples / _OPUS_RATE
+
+    def _renumber(self, view, pages):
+        data = bytearray(view)
+        mapping = {}
+        serial = max(self._serials) + 1
+        for offset, length, _, old in pages:
+            if old not in mapping:
+                while serial in self._serials or serial in mapping.values():
+                    serial = (serial + 1) & 0xFFFFFFFF
+                mapping[old] = serial
+            struct.pack_into("<I", data, offset + 14, mapping[old])
+            struct.pack_into("<I", data, offset + 22, 0)
+            struct.pack_into("<I", data, offset + 22, _ogg_crc(data[offset:offset + length]))
+        return memoryview(bytes(data))
+
+    def __iadd__(self, data):
+        self.append(data)
+        return self
+
+    def _add_segment(self, view):
+        if len(view):
+            self._segments.append(view)
+            self._audio_bytes += len(view)
+
+    @property
+    def duration_seconds(self):
+        return self._samples / _OPUS_RATE
+
+    def __len__(self):
+        return self._audio_bytes
+
+    def __iter__(self):
+        yield from self._segments
+
+    def iter_bytes(self, include_header=True):
+        """Yield the chain as bytes, one per appended file."""
+        for view in self._segments:
+            yield view.tobytes()
+
+    def to_bytes(self):
+        return b"".join(self)
@@ -0,0 +1,109 @@
+"""
+Audio encodings the services can synthesize, and picking one per request.
+
+    mp3        audio/mpeg, the default
+    opus       low-bitrate Opus in Ogg (audio/ogg), for metered mobile data
+    linear16   16-bit PCM in WAV (audio/wav), for smart speakers
+
+A request chooses with ?format= (also "ogg", "wav" and "pcm"), else by its
+Accept header; anything else gets MP3. Each format is synthesized by
+Deepgram in that encoding, chunk by chunk like MP3, and the chunks are
+joined by the format's assembly (see audio_assembly).
+
+Environment variables:
+    TTS_OPUS_BITRATE     Opus bitrate in bits/s (16000)
+    TTS_PCM_SAMPLE_RATE  linear16 sample rate in Hz (24000)
+"""
+import os
+
+from flask import request
+from werkzeug.exceptions import BadRequest
+
+from audio_assembly import Mp3Assembly, OggOpusAssembly, WavAssembly
+
+OPUS_BITRATE = int(os.getenv("TTS_OPUS_BITRATE", 16000))
+PCM_SAMPLE_RATE = int(os.getenv("TTS_PCM_SAMPLE_RATE", 24000))
+
+
+class AudioFormat:
+    """One output encoding: its Deepgram query, MIME type and file extension."""
+
+    def __init__(self, name, mimetype, extension, query, assembly):
+        self.name = name
+        self.mimetype = mimetype
+        self.extension = extension
+        self.query = query
+        self._assembly = assembly
+
+    def assembly(self):
+        """An empty assembly joining this format's chunk files."""
+        return self._assembly()
+
+
+MP3 = AudioFormat("mp3", "audio/mpeg", "mp3", "encoding=mp3", Mp3Assembly)
+OPUS = AudioFormat("opus", "audio/ogg", "ogg", f"encoding=opus&container=ogg&bit_rate={OPUS_BITRATE}",
+                   OggOpusAssembly)
+LINEAR16 = AudioFormat("linear16", "audio/wav", "wav",
+                       f"encoding=linear16&container=none&sample_rate={PCM_SAMPLE_RATE}",
+                       lambda: WavAssembly(PCM_SAMPLE_RATE))
+
+AUDIO_FORMATS = {f.name: f for f in (MP3, OPUS, LINEAR16)}
+_ALIASES = {"mpeg": "mp3", "ogg": "opus", "wav": "linear16", "pcm": "linear16"}
+
+# Accept header types, in order of preference when the client has none
+_MIMETYPES = (
+    ("audio/mpeg", MP3),
+    ("audio/mp3", MP3),
+    ("audio/ogg", OPUS),
+    ("audio/opus", OPUS),
+    ("audio/wav", LINEAR16),
+    ("audio/wave", LINEAR16),
+    ("audio/x-wav", LINEAR16),
+    ("audio/L16", LINEAR16),
+)
+
+
+class UnsupportedAudioFormat(BadRequest):
+    def __init__(self, name):
+        super().__init__(description=f"Unsupported audio format '{name}' (choose from {', '.join(AUDIO_FORMATS)})")
+
+
+def get_audio_format(name):
+    """The AudioFormat called `name` (or an alias); raises UnsupportedAudioFormat."""
+    key = str(name).strip().lower()
+    found = AUDIO_FORMATS.get(_ALIASES.get(key, key))
+    if found is None:
+        raise UnsupportedAudioFormat(name)
+    return found
+
+
+def format_of(data):
+    """The AudioFormat whose files start like `data` (their first bytes), or None."""
+    head = bytes(data[:12])
+    if head[:4] == b"OggS":
+        return OPUS
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return LINEAR16
+    if head[:3] == b"ID3" or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return MP3
+    return None
+
+
+def format_for_extension(extension):
+    for candidate in AUDIO_FORMATS.values():
+        if candidate.extension == extension:
+            return candidate
+    return None
+
+
+def requested_format(data=None):
+    """
+    The format asked for by the format query parameter, JSON or form field,
+    else by the Accept header, else MP3.
+    """
+    name = (request.args.get('format') or (data or {}).get('audio_format')
+            or request.form.get('audio_format'))
+    if name:
+        return get_audio_format(name)
+    best = request.accept_mimetypes.best_match([mimetype for mimetype, _ in _MIMETYPES])
+    return dict(_MIMETYPES).get(best, MP3)
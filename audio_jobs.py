@@ -0,0 +1,185 @@
+"""
+Background audio synthesis jobs.
+
+Endpoints that produce text before audio can hand synthesis to an
+AudioJobQueue and answer with the text at once. A fixed set of worker
+threads runs jobs in submission order; each job reports its progress and
+can be looked up by id while it is queued, running and for a while after it
+has finished. The queue is bounded: submit() returns None when it is full,
+and callers fall back to synthesizing in the request.
+
+Environment variables:
+    AUDIO_JOB_WORKERS   worker threads per queue (2)
+    AUDIO_JOB_QUEUE     jobs that may wait for a worker (64)
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept for status lookups
+FINISHED_JOBS_KEPT = 1024
+
+AUDIO_JOBS = gauge(
+    "symptocheck_audio_jobs",
+    "Background audio jobs by queue and state.",
+    ("queue", "state"),
+)
+AUDIO_JOBS_FINISHED = counter(
+    "symptocheck_audio_jobs_finished_total",
+    "Background audio jobs finished, by queue and outcome.",
+    ("queue", "status"),
+)
+
+_queues = []
+
+
+class AudioJob:
+    def __init__(self, job_id, fn):
+        self.id = job_id
+        self.fn = fn
+        self.status = "queued"  # queued, running, ready, failed
+        self.progress = 0.0
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ("ready", "failed")
+
+    def set_progress(self, fraction):
+        self.progress = max(self.progress, min(1.0, fraction))
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+        }
+        if self.started_at is not None:
+            data["wait_seconds"] = round(self.started_at - self.submitted_at, 3)
+        if self.finished_at is not None:
+            data["run_seconds"] = round(self.finished_at - self.started_at, 3)
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+class AudioJobQueue:
+    """FIFO of AudioJobs run by `workers` background threads."""
+
+    def __init__(self, name, workers=2, max_queue=64):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.running = 0
+        self._pending = deque()
+        self._jobs = OrderedDict()  # id -> AudioJob, oldest first
+        self._condition = threading.Condition()
+        self._threads = []
+        _queues.append(self)
+
+    def submit(self, job_id, fn):
+        """
+        Queue fn(job) to run in the background. Returns the AudioJob, or None
+        if the queue is full.
+        """
+        with self._condition:
+            if len(self._pending) >= self.max_queue:
+                return None
+            self._start_workers()
+            job = AudioJob(job_id, fn)
+            self._jobs[job_id] = job
+            self._pending.append(job)
+            self._prune()
+            self._condition.notify()
+        return job
+
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def position(self, job):
+        """Jobs ahead of `job` in the queue (0 when it is next or running)."""
+        with self._condition:
+            try:
+                return self._pending.index(job)
+            except ValueError:
+                return 0
+
+    def stats(self):
+        with self._condition:
+            finished = [job for job in self._jobs.values() if job.done]
+            return {
+                "queue": self.name,
+                "queued": len(self._pending),
+                "running": self.running,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "recently_ready": sum(1 for job in finished if job.status == "ready"),
+                "recently_failed": sum(1 for job in finished if job.status == "failed"),
+            }
+
+    def _start_workers(self):
+        # Started on first use, so forked server workers each get their own
+        if not self._threads:
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"{self.name}-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                job = self._pending.popleft()
+                self.running += 1
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.fn(job)
+                job.progress = 1.0
+                job.status = "ready"
+            except Exception as e:
+                logger.warning("⚠️ Audio job %s failed: %s", job.id, e)
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                AUDIO_JOBS_FINISHED.inc(queue=self.name, status=job.status)
+                with self._condition:
+                    self.running -= 1
+
+
+def audio_job_queue(name):
+    """AudioJobQueue configured from AUDIO_JOB_WORKERS and AUDIO_JOB_QUEUE."""
+    return AudioJobQueue(
+        name,
+        workers=int(os.getenv("AUDIO_JOB_WORKERS", 2)),
+        max_queue=int(os.getenv("AUDIO_JOB_QUEUE", 64)),
+    )
+
+
+def _job_samples():
+    samples = {}
+    for queue in list(_queues):
+        stats = queue.stats()
+        samples[(queue.name, "queued")] = stats["queued"]
+        samples[(queue.name, "running")] = stats["running"]
+    return samples
+
+
+AUDIO_JOBS.set_function(_job_samples)
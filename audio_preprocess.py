@@ -0,0 +1,238 @@
+"""
+PCM preprocessing of WAV uploads before speech-to-text.
+
+Uncompressed uploads are decoded with NumPy, downmixed to mono, resampled to
+16 kHz, trimmed of leading and trailing silence with an energy-based voice
+activity detector and re-encoded as 16-bit WAV. A 44.1 kHz stereo voice note
+shrinks about 5.5x before trimming, and Deepgram has less audio to process.
+
+Compressed formats (mp3, webm, ogg, ...) are left untouched, as is everything
+when NumPy is not installed. NumPy is imported on the first WAV upload (or
+by warmup()), which keeps it out of service start-up.
+"""
+import struct
+
+np = None
+_numpy_missing = False
+
+TARGET_RATE = 16000
+FRAME_SECONDS = 0.03
+# Speech is kept this far around the first and last voiced frame
+PADDING_SECONDS = 0.25
+# Frames this much louder than the noise floor count as voiced...
+NOISE_MARGIN_DB = 12.0
+# ...as long as they are within this range of the loudest frame
+DYNAMIC_RANGE_DB = 50.0
+
+_FORMAT_PCM = 0x0001
+_FORMAT_FLOAT = 0x0003
+_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class PcmAudio:
+    """Decoded WAV audio: float32 samples shaped (frames, channels)."""
+
+    def __init__(self, samples, sample_rate):
+        self.samples = samples
+        self.sample_rate = sample_rate
+
+    @property
+    def duration_seconds(self):
+        return len(self.samples) / self.sample_rate
+
+
+def warmup():
+    """Import NumPy now; returns False if it is not installed."""
+    global np, _numpy_missing
+    if np is None and not _numpy_missing:
+        try:
+            import numpy
+        except ImportError:  # preprocessing is skipped without NumPy
+            _numpy_missing = True
+        else:
+            np = numpy
+    return np is not None
+
+
+def _wav_chunks(data):
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    chunks = {}
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, size = struct.unpack_from("<4sI", data, offset)
+        body = offset + 8
+        if chunk_id not in chunks:
+            # Streaming encoders may leave the data size at 0 or 0xFFFFFFFF
+            if chunk_id == b"data" and (size == 0 or body + size > len(data)):
+                size = len(data) - body
+            chunks[chunk_id] = (body, size)
+        offset = body + size + (size & 1)
+    return chunks
+
+
+def decode_wav(data):
+    """Decode integer or float PCM WAV bytes, or return None if unsupported."""
+    if not warmup():
+        return None
+    chunks = _wav_chunks(data)
+    if not chunks or b"fmt " not in chunks or b"data" not in chunks:
+        return None
+
+    fmt_offset, fmt_size = chunks[b"fmt "]
+    if fmt_size < 16:
+        return None
+    format_tag, channels, sample_rate, _, block_align, bits = struct.unpack_from("<HHIIHH", data, fmt_offset)
+    if format_tag == _FORMAT_EXTENSIBLE and fmt_size >= 40:
+        format_tag = struct.unpack_from("<H", data, fmt_offset + 24)[0]
+    if channels < 1 or sample_rate < 1 or bits < 8 or block_align != channels * (bits // 8):
+        return None
+
+    data_offset, data_size = chunks[b"data"]
+    frames = data_size // block_align
+    raw = np.frombuffer(data, dtype=np.uint8, count=frames * block_align, offset=data_offset)
+
+    if format_tag == _FORMAT_FLOAT and bits == 32:
+        samples = raw.view("<f4").astype(np.float32)
+    elif format_tag == _FORMAT_FLOAT and bits == 64:
+        samples = raw.view("<f8").astype(np.float32)
+    elif format_tag != _FORMAT_PCM:
+        return None
+    elif bits == 8:
+        samples = (raw.astype(np.float32) - 128.0) / 128.0
+    elif bits == 16:
+        samples = raw.view("<i2").astype(np.float32) / 32768.0
+    elif bits == 24:
+        triples = raw.reshape(-1, 3).astype(np.int32)
+        values = triples[:, 0] | (triples[:, 1] << 8) | (triples[:, 2] << 16)
+        values = np.where(values & 0x800000, values - 0x1000000, values)
+        samples = values.astype(np.float32) / 8388608.0
+    elif bits == 32:
+        samples = raw.view("<i4").astype(np.float32) / 2147483648.0
+    else:
+        return None
+
+    return PcmAudio(samples.reshape(-1, channels), sample_rate)
+
+
+def downmix(audio):
+    """Average all channels into one."""
+    if audio.samples.shape[1] == 1:
+        return PcmAudio(audio.samples[:, 0], audio.sample_rate)
+    return PcmAudio(audio.samples.mean(axis=1, dtype=np.float32), audio.sample_rate)
+
+
+def resample(audio, rate=TARGET_RATE):
+    """
+    Resample mono audio by linear interpolation. When downsampling, a moving
+    average over one output period first removes most content above the new
+    Nyquist frequency; plenty for speech recognition.
+    """
+    samples = audio.samples
+    if audio.sample_rate == rate or len(samples) == 0:
+        return PcmAudio(samples, rate)
+
+    ratio = audio.sample_rate / rate
+    if ratio > 1:
+        width = int(round(ratio))
+        if width > 1:
+            cumulative = np.cumsum(np.concatenate(([0.0], samples)), dtype=np.float64)
+            smoothed = (cumulative[width:] - cumulative[:-width]) / width
+            # Keep the signal aligned: the average is centred on its window
+            samples = np.concatenate((samples[:width // 2], smoothed.astype(np.float32),
+                                      samples[len(samples) - (width - 1 - width // 2):]))
+
+    count = int(len(samples) / ratio)
+    positions = np.arange(count, dtype=np.float64) * ratio
+    resampled = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+    return PcmAudio(resampled, rate)
+
+
+def voiced_bounds(samples, sample_rate):
+    """
+    (start, end) sample indices of the voiced part of mono audio, found from
+    per-frame RMS energy against an adaptive noise floor. Returns the whole
+    range when nothing stands out (silence or constant noise).
+    """
+    frame = max(1, int(sample_rate * FRAME_SECONDS))
+    count = len(samples) // frame
+    if count < 3:
+        return 0, len(samples)
+
+    frames = samples[:count * frame].reshape(count, frame).astype(np.float64)
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = max(noise_floor + NOISE_MARGIN_DB, energy_db.max() - DYNAMIC_RANGE_DB)
+
+    voiced = np.flatnonzero(energy_db >= threshold)
+    if len(voiced) == 0 or energy_db.max() - noise_floor < NOISE_MARGIN_DB:
+        return 0, len(samples)
+
+    padding = int(sample_rate * PADDING_SECONDS)
+    start = max(0, voiced[0] * frame - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame + padding)
+    return int(start), int(end)
+
+
+def encode_wav(samples, sample_rate):
+    """16-bit mono PCM WAV bytes."""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + len(pcm), b"WAVE",
+        b"fmt ", 16, _FORMAT_PCM, 1, sample_rate, sample_rate * 2, 2, 16,
+        b"data", len(pcm),
+    )
+    return header + pcm
+
+
+def preprocess_wav(data):
+    """
+    Trim, downmix and resample WAV bytes for STT.
+
+    Returns (wav_bytes, info) where info describes the input and output audio,
+    or None when the data is not PCM WAV or NumPy is unavailable.
+    """
+    audio = decode_wav(data)
+    if audio is None:
+        return None
+
+    original_seconds = audio.duration_seconds
+    original_channels = audio.samples.shape[1]
+    original_rate = audio.sample_rate
+
+    audio = resample(downmix(audio))
+    start, end = voiced_bounds(audio.samples, audio.sample_rate)
+    trimmed = audio.samples[start:end]
+    wav = encode_wav(trimmed, audio.sample_rate)
+
+    return wav, {
+        "format": "wav",
+        "original_seconds": round(original_seconds, 3),
+        "original_sample_rate": original_rate,
+        "original_channels": original_channels,
+        "trimmed_seconds": round(len(trimmed) / audio.sample_rate, 3),
+        "leading_silence_seconds": round(start / audio.sample_rate, 3),
+        "trailing_silence_seconds": round((len(audio.samples) - end) / audio.sample_rate, 3),
+        "sample_rate": audio.sample_rate,
+        "bytes_uploaded": len(data),
+        "bytes_sent": len(wav),
+    }
+
+
+def preprocess_upload(file_storage):
+    """
+    preprocess_wav for an uploaded file, recognised by its RIFF/WAVE header
+    rather than its name. Compressed uploads are not read at all.
+    """
+    if not warmup():
+        return None
+    stream = file_storage.stream
+    stream.seek(0)
+    header = stream.read(12)
+    stream.seek(0)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return None
+    data = stream.read()
+    stream.seek(0)
+    return preprocess_wav(data)
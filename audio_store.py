@@ -0,0 +1,150 @@
+"""
+Content-addressed audio shared by the services.
+
+Synthesized responses are stored once under the SHA-256 of their bytes and
+served from /audio/<digest>.<extension>. A content-addressed URL never changes
+meaning, so it is served with a strong ETag and an immutable Cache-Control:
+browsers and CDNs replay it without contacting the origin, and sessions
+that produced identical audio share one URL and one stored copy. Session
+entries keep only digests, one per audio format (see audio_formats);
+/get_audio/<session_id> serves the same bytes with the same ETag but must
+be revalidated, answering 304 when the client already has them. Both
+answer byte Range requests with 206 Partial Content, so players can seek.
+
+With SHARED_STORE_DIR set, audio lives in an `audio_store` SharedStore that
+every worker maps (see shared_store); otherwise in process memory.
+
+Environment variables:
+    AUDIO_STORE_SIZE      responses kept in process memory (1024)
+    AUDIO_STORE_TTL       seconds a response is kept in process memory (86400)
+    AUDIO_URL_MAX_AGE     max-age of content-addressed URLs (31536000)
+"""
+import hashlib
+import os
+import re
+
+from flask import Response, request
+
+from audio_formats import format_of
+from shared_store import StoredAudio, store_from_env
+from ttl_cache import TTLCache
+
+MAX_AGE = int(os.getenv("AUDIO_URL_MAX_AGE", 31536000))
+IMMUTABLE = f"public, max-age={MAX_AGE}, immutable"
+REVALIDATE = "no-cache"
+
+_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+
+def audio_digest(audio):
+    """Hex SHA-256 of audio bytes or of an assembly's (e.g. Mp3Assembly) file."""
+    digest = hashlib.sha256()
+    for part in audio.iter_bytes() if hasattr(audio, "iter_bytes") else (audio,):
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def is_audio_digest(value):
+    return _DIGEST.fullmatch(value) is not None
+
+
+class AudioStore:
+    """Audio by content digest, in a SharedStore or a TTLCache."""
+
+    def __init__(self, name, shared=None, max_entries=1024, ttl=86400.0):
+        self.name = name
+        self.shared = shared
+        if shared is None:
+            self.local = TTLCache(name, max_entries=max_entries, ttl=ttl, size_of=len)
+
+    def put(self, audio):
+        """Store `audio` (bytes or an Mp3Assembly) unless it is already stored; returns its digest."""
+        digest = audio_digest(audio)
+        if self.shared is not None:
+            if digest not in self.shared:
+                self.shared.put(digest, b"".join(audio.iter_bytes()) if hasattr(audio, "iter_bytes") else bytes(audio))
+        elif digest not in self.local:
+            self.local.put(digest, audio)
+        return digest
+
+    def get(self, digest):
+        """The audio stored under `digest`, or None."""
+        if self.shared is not None:
+            data = self.shared.get(digest)
+            return None if data is None else StoredAudio(data)
+        return self.local.get(digest)
+
+    def get_as(self, digest, audio_format):
+        """
+        The audio stored under `digest` if it is in `audio_format`, else None,
+        so a URL naming the wrong extension is not served as that format.
+        """
+        audio = self.get(digest)
+        if audio is None:
+            return None
+        head = next(audio.iter_bytes(), b"") if hasattr(audio, "iter_bytes") else audio
+        return audio if format_of(head) is audio_format else None
+
+    def clear(self):
+        (self.shared or self.local).clear()
+
+
+AUDIO_STORE = AudioStore(
+    "audio_store",
+    shared=store_from_env("audio_store"),
+    max_entries=int(os.getenv("AUDIO_STORE_SIZE", 1024)),
+    ttl=float(os.getenv("AUDIO_STORE_TTL", 86400)),
+)
+
+
+def audio_fields(audio, audio_format):
+    """
+    Put a session's audio in AUDIO_STORE; returns the session entry fields
+    describing it. It becomes the session's first audio variant.
+    """
+    digest = AUDIO_STORE.put(audio)
+    return {
+        'audio_sha256': digest,
+        'audio_format': audio_format.name,
+        'audio_variants': {audio_format.name: digest},
+        'audio_size': len(audio),
+        'audio_duration': round(audio.duration_seconds, 2),
+    }
+
+
+def session_audio(entry, audio_format, synthesize):
+    """
+    A session's audio in `audio_format`, as (audio, digest, changed). A
+    format not synthesized yet, or evicted from AUDIO_STORE, is synthesized
+    from the session's response_text with synthesize(text, audio_format)
+    and recorded in entry['audio_variants']; `changed` tells the caller to
+    store the entry again. Returns (None, None, False) when there is no text.
+    """
+    variants = entry.setdefault('audio_variants', {})
+    digest = variants.get(audio_format.name)
+    audio = AUDIO_STORE.get(digest) if digest else None
+    if audio is not None:
+        return audio, digest, False
+    if not entry.get('response_text'):
+        return None, None, False
+    audio = synthesize(entry['response_text'], audio_format)
+    digest = AUDIO_STORE.put(audio)
+    variants[audio_format.name] = digest
+    return audio, digest, True
+
+
+def audio_response(audio, digest, filename, cache_control=REVALIDATE, mimetype="audio/mpeg"):
+    """
+    Stream `audio` with `digest` as its strong ETag. Answers 304 Not
+    Modified when the request's If-None-Match already names it, and 206
+    Partial Content for a single byte Range (honouring If-Range), which
+    players use to seek.
+    """
+    headers = {
+        "Content-Disposition": f"inline; filename={filename}",
+        "Cache-Control": cache_control,
+        "Content-Length": str(len(audio)),
+    }
+    response = Response(audio.iter_bytes(), mimetype=mimetype, headers=headers)
+    response.set_etag(digest)
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(audio))
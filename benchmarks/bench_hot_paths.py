@@ -0,0 +1,347 @@
+"""
+Micro-benchmarks for the pure-Python code that runs on every request.
+
+Timings are stored relative to a fixed calibration loop, so baselines recorded
+on one machine stay meaningful on another. Each timing sample is paired with a
+calibration sample taken right beside it, so a machine that speeds up or slows
+down during the run (frequency scaling, noisy neighbours) shifts both alike;
+the best of the paired ratios is kept. A benchmark fails when it runs more
+than `--threshold` times slower than its stored baseline in each of
+`ATTEMPTS` measurements.
+
+Usage:
+    python benchmarks/bench_hot_paths.py              # compare against baselines
+    python benchmarks/bench_hot_paths.py --update     # record new baselines
+    python benchmarks/bench_hot_paths.py tts_split    # only run matching benchmarks
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import timeit
+from contextlib import redirect_stdout
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_THRESHOLD = 1.50
+REPEAT = 7
+# A benchmark over the threshold is measured again up to this many times in all
+ATTEMPTS = 3
+
+# name -> setup function returning the zero-argument callable to time
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark setup function under `name`."""
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+SENTENCES = [
+    "Take a slow breath in through your nose and let your shoulders soften.",
+    "Notice where your body feels tense, and allow that area to relax a little more with each exhale.",
+    "There is nothing you need to fix right now; simply observe what is here.",
+    "If your mind wanders, gently guide your attention back to the rhythm of your breath!",
+    "Are you holding tension in your jaw, your hands or your forehead?",
+    "Hydration, gentle movement and regular sleep all support a calmer nervous system.",
+]
+
+
+def _wellness_text(paragraphs, sentences_per_paragraph):
+    lines = []
+    for p in range(paragraphs):
+        lines.append(" ".join(
+            SENTENCES[(p + s) % len(SENTENCES)] for s in range(sentences_per_paragraph)
+        ))
+    return "\n\n".join(lines)
+
+
+def _silenced(func):
+    """Wrap `func` so the prints it makes go to /dev/null, as they would in a daemonised server."""
+    sink = open(os.devnull, "w")
+
+    def run():
+        with redirect_stdout(sink):
+            return func()
+    return run
+
+
+# --- split_text_for_tts -----------------------------------------------------
+
+@benchmark("tts_split_short")
+def bench_tts_split_short():
+    from healty_lifestyle import split_text_for_tts
+    text = SENTENCES[0] + " " + SENTENCES[2]
+    return _silenced(lambda: split_text_for_tts(text, max_chars=250))
+
+
+@benchmark("tts_split_long")
+def bench_tts_split_long():
+    from healty_lifestyle import split_text_for_tts
+    text = _wellness_text(paragraphs=6, sentences_per_paragraph=8)
+    return _silenced(lambda: split_text_for_tts(text, max_chars=250))
+
+
+@benchmark("tts_split_pathological")
+def bench_tts_split_pathological():
+    # 20 KB with no sentence or clause punctuation: everything goes through word packing.
+    from healty_lifestyle import split_text_for_tts
+    words = ("breathe slowly and let the body settle into stillness " * 400).split()
+    text = " ".join(words)[:20000]
+    return _silenced(lambda: split_text_for_tts(text, max_chars=250))
+
+
+@benchmark("tts_split_100kb")
+def bench_tts_split_100kb():
+    from healty_lifestyle import split_text_for_tts
+    text = _wellness_text(paragraphs=250, sentences_per_paragraph=5)[:100 * 1024]
+    return _silenced(lambda: split_text_for_tts(text, max_chars=250))
+
+
+# --- EnhancedMedicalChatbot helpers -------------------------------------------
+
+def _chatbot():
+    from ai_assistance import get_medical_chatbot
+    return get_medical_chatbot()
+
+
+def _symptoms(count):
+    from ai_assistance import SymptomDetail
+    names = ["mild cough", "tiredness", "runny nose", "sore throat", "back stiffness", "light rash"]
+    return [
+        SymptomDetail(
+            symptom=f"{names[i % len(names)]} {i}",
+            severity=1 + i % 7,
+            duration=f"{i % 10} days" if i % 3 else "unknown",
+            frequency="daily",
+            triggers=["cold air"],
+            alleviating_factors=["rest"],
+        )
+        for i in range(count)
+    ]
+
+
+def _long_conversation(session_id, symptoms=500, history=400):
+    from ai_assistance import ConversationState, ConversationStage, PatientProfile
+    profile = PatientProfile(
+        age=42,
+        gender="female",
+        medical_history=[f"condition {i}" for i in range(100)],
+        current_medications=[f"medication {i}" for i in range(50)],
+        lifestyle_factors={"smoking": "no", "exercise": "weekly", "stress": "high"},
+    )
+    # Recent enough that the 24h cleanup in ai_assistance never evicts it mid-run.
+    now = datetime.now()
+    return ConversationState(
+        session_id=session_id,
+        stage=ConversationStage.ANALYSIS,
+        symptoms=_symptoms(symptoms),
+        patient_profile=profile,
+        conversation_history=[
+            {
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": SENTENCES[i % len(SENTENCES)] * 3,
+                "timestamp": now.isoformat(),
+            }
+            for i in range(history)
+        ],
+        extracted_info={},
+        diagnosis_results=[],
+        follow_up_questions=[],
+        created_at=now,
+        last_updated=now,
+    )
+
+
+@benchmark("assess_urgency_large")
+def bench_assess_urgency_large():
+    # No keyword matches and low severities: the full scan always runs.
+    chatbot = _chatbot()
+    symptoms = _symptoms(2000)
+    return lambda: chatbot._assess_urgency(symptoms)
+
+
+@benchmark("fallback_extraction_large")
+def bench_fallback_extraction_large():
+    chatbot = _chatbot()
+    message = " ".join(
+        f"I have had a {name} for a while" for name in ["mild cough", "runny nose", "tiredness"] * 600
+    ) + " and now a fever."
+    return lambda: chatbot._fallback_extraction(message)
+
+
+@benchmark("patient_summary_long")
+def bench_patient_summary_long():
+    chatbot = _chatbot()
+    conversation = _long_conversation("bench-summary")
+    return lambda: chatbot._build_patient_summary(conversation)
+
+
+@benchmark("conversation_context_long")
+def bench_conversation_context_long():
+    chatbot = _chatbot()
+    conversation = _long_conversation("bench-context")
+    return lambda: chatbot._build_conversation_context(conversation)
+
+
+# --- /conversation/<session_id> payload ----------------------------------------
+
+@benchmark("conversation_json")
+def bench_conversation_json():
+    import ai_assistance
+    from app_factory import build_app
+    session_id = "bench-conversation-json"
+    ai_assistance.CONVERSATIONS[session_id] = _long_conversation(session_id)
+    client = build_app([ai_assistance.service], prefixed=False).test_client()
+
+    def run():
+        response = client.get(f"/conversation/{session_id}")
+        assert response.status_code == 200
+        return response.data
+    return run
+
+
+@benchmark("conversation_json_delta")
+def bench_conversation_json_delta():
+    # The same long session, polled with a cursor one message behind.
+    import ai_assistance
+    from app_factory import build_app
+    session_id = "bench-conversation-delta"
+    conversation = _long_conversation(session_id)
+    ai_assistance.CONVERSATIONS[session_id] = conversation
+    conversation.add_message("user", SENTENCES[0])
+    since = conversation.revision
+    conversation.add_message("assistant", SENTENCES[1])
+    client = build_app([ai_assistance.service], prefixed=False).test_client()
+
+    def run():
+        response = client.get(f"/conversation/{session_id}?since={since}&epoch={conversation.epoch}")
+        assert response.status_code == 200 and not response.json["full"]
+        return response.data
+    return run
+
+
+# --- harness -------------------------------------------------------------------
+
+def _calibration_workload():
+    """A fixed pure-Python workload used to normalise all results."""
+    total = 0
+    parts = []
+    for i in range(2000):
+        total += i * i % 7
+        parts.append(str(i))
+    return total, " ".join(parts)
+
+
+def _measure(func, calibration):
+    """
+    Time `func` in REPEAT samples, each right after a sample of the
+    `calibration` timer, and return the best ratio of a sample to its
+    calibration sample.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    ratios = []
+    for _ in range(REPEAT):
+        calibration_seconds = calibration.timeit(calibration.number) / calibration.number
+        ratios.append(timer.timeit(number) / number / calibration_seconds)
+    return min(ratios)
+
+
+def _calibration_timer():
+    timer = timeit.Timer(_calibration_workload)
+    timer.number, _ = timer.autorange()
+    return timer
+
+
+def _load_baselines():
+    if not os.path.exists(BASELINES_PATH):
+        return {}
+    with open(BASELINES_PATH) as f:
+        return json.load(f).get("benchmarks", {})
+
+
+def _save_baselines(results, calibration):
+    data = {
+        "calibration_seconds": calibration,
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "benchmarks": {
+            name: {"seconds": seconds, "relative": seconds / calibration}
+            for name, seconds in sorted(results.items())
+        },
+    }
+    with open(BASELINES_PATH, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("patterns", nargs="*", help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--update", action="store_true", help="record the results as new baselines")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"maximum allowed slowdown versus baseline (default {DEFAULT_THRESHOLD}x)")
+    args = parser.parse_args(argv)
+
+    # Keep benchmark runs out of the application log files.
+    logging.disable(logging.CRITICAL)
+
+    selected = [
+        name for name in BENCHMARKS
+        if not args.patterns or any(p in name for p in args.patterns)
+    ]
+    if not selected:
+        print("No benchmarks matched")
+        return 2
+
+    calibration_timer = _calibration_timer()
+    calibration = min(calibration_timer.repeat(REPEAT, calibration_timer.number)) / calibration_timer.number
+    baselines = _load_baselines()
+    results = {}
+    regressions = []
+
+    print(f"calibration: {calibration * 1e6:.1f} us")
+    print(f"{'benchmark':<28} {'time':>12} {'baseline':>12} {'ratio':>8}")
+    for name in selected:
+        func = BENCHMARKS[name]()
+        baseline = baselines.get(name)
+        for _ in range(ATTEMPTS):
+            relative = _measure(func, calibration_timer)
+            if not baseline or args.update or relative / baseline["relative"] <= args.threshold:
+                break
+        results[name] = relative * calibration
+
+        if baseline:
+            expected = baseline["relative"] * calibration
+            ratio = relative / baseline["relative"]
+            status = "REGRESSION" if ratio > args.threshold else ""
+            if status:
+                regressions.append(name)
+            print(f"{name:<28} {results[name] * 1e6:>10.1f}us {expected * 1e6:>10.1f}us {ratio:>7.2f}x {status}")
+        else:
+            print(f"{name:<28} {results[name] * 1e6:>10.1f}us {'-':>12} {'-':>8}")
+
+    if args.update:
+        merged = {n: b["relative"] * calibration for n, b in baselines.items()}
+        merged.update(results)
+        _save_baselines(merged, calibration)
+        print(f"Baselines written to {BASELINES_PATH}")
+        return 0
+
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than {args.threshold}x baseline: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Cold-start benchmark: how long a fresh interpreter takes to build the app.
+
+Each target is imported and its app built in a new Python process, the way
+a freshly scheduled worker starts. Times are compared with a bare
+`import flask` in a fresh process, so the budget holds across machines. A
+target fails when it takes more than `--budget` times as long as that
+reference, or when it imports a module that should only load on first use
+(the Gemini SDK, requests, NumPy).
+
+Usage:
+    python benchmarks/bench_import.py                  # all targets
+    python benchmarks/bench_import.py assistant        # only matching targets
+    python benchmarks/bench_import.py --budget 4 --runs 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BUDGET = 3.0
+DEFAULT_RUNS = 5
+
+# Modules that must not be imported before the first request or warmup
+LAZY_MODULES = ("google.generativeai", "google.api_core", "requests", "numpy")
+
+REFERENCE = "import flask"
+
+# name -> code building the app
+TARGETS = {
+    "all": "import app_factory; app_factory.create_app()",
+    "medical": "import app_factory; app_factory.create_app(['medical'])",
+    "wellness": "import app_factory; app_factory.create_app(['wellness'])",
+    "assistant": "import app_factory; app_factory.create_app(['assistant'])",
+    "medical_chatbot": "import medical_chatbot",
+    "healty_lifestyle": "import healty_lifestyle",
+    "ai_assistance": "import ai_assistance",
+}
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def _cold_start(code):
+    """Time `code` in a fresh interpreter; returns (seconds, lazy modules it loaded)."""
+    env = dict(os.environ, LOG_FILE="", LOG_STDERR="0", PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(code=code, lazy=LAZY_MODULES)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    return data["seconds"], data["loaded"]
+
+
+def _best_of(code, runs):
+    times = []
+    loaded = set()
+    for _ in range(runs):
+        seconds, modules = _cold_start(code)
+        times.append(seconds)
+        loaded.update(modules)
+    return min(times), sorted(loaded)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("patterns", nargs="*", help="only run targets whose name contains one of these")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                        help=f"maximum cold start as a multiple of `{REFERENCE}` (default {DEFAULT_BUDGET}x)")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS,
+                        help=f"fresh processes per target; the fastest counts (default {DEFAULT_RUNS})")
+    args = parser.parse_args(argv)
+
+    selected = [
+        name for name in TARGETS
+        if not args.patterns or any(p in name for p in args.patterns)
+    ]
+    if not selected:
+        print("No targets matched")
+        return 2
+
+    reference, _ = _best_of(REFERENCE, args.runs)
+    failures = []
+
+    print(f"reference ({REFERENCE}): {reference * 1e3:.1f} ms")
+    print(f"{'target':<20} {'time':>10} {'ratio':>8}  lazy modules loaded")
+    for name in selected:
+        seconds, loaded = _best_of(TARGETS[name], args.runs)
+        ratio = seconds / reference
+        status = []
+        if ratio > args.budget:
+            status.append("OVER BUDGET")
+        if loaded:
+            status.append("EAGER IMPORT")
+        if status:
+            failures.append(name)
+        print(f"{name:<20} {seconds * 1e3:>8.1f}ms {ratio:>7.2f}x  {', '.join(loaded) or '-'} {' '.join(status)}")
+
+    if failures:
+        print(f"{len(failures)} target(s) over the {args.budget}x budget or importing lazy modules: "
+              f"{', '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
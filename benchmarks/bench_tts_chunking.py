@@ -0,0 +1,56 @@
+"""
+Throughput benchmark for tts_chunking.iter_tts_chunks.
+
+The chunker is timed on 100 KB inputs against the previous multi-pass
+implementation of split_text_for_tts (`legacy_split_text_for_tts`, which
+tests/test_tts_chunking.py also checks it against).
+
+Usage:
+    python benchmarks/bench_tts_chunking.py
+    python benchmarks/bench_tts_chunking.py --number 20
+"""
+import argparse
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from tests.test_tts_chunking import legacy_split_text_for_tts  # noqa: E402
+from tts_chunking import iter_tts_chunks  # noqa: E402
+
+INPUT_SIZE = 100 * 1024
+
+
+def _inputs():
+    prose = ("Notice the breath as it moves in and out. Let your shoulders drop, "
+             "your jaw soften; your hands rest: there is nothing to do right now! ")
+    return {
+        "prose": (prose * (INPUT_SIZE // len(prose) + 1))[:INPUT_SIZE],
+        "unpunctuated": ("settle into stillness and simply breathe " * (INPUT_SIZE // 40 + 1))[:INPUT_SIZE],
+        "one_clause": ("a" * 9 + " ") * (INPUT_SIZE // 10),
+    }
+
+
+def run_throughput(number):
+    print(f"{'input (100 KB)':<16} {'legacy':>12} {'chunker':>12} {'speedup':>8}")
+    for name, text in _inputs().items():
+        legacy = min(timeit.repeat(lambda: legacy_split_text_for_tts(text, 250), number=number, repeat=3)) / number
+        current = min(timeit.repeat(lambda: list(iter_tts_chunks(text, 250)), number=number, repeat=3)) / number
+        mb = len(text) / 1e6
+        print(f"{name:<16} {mb / legacy:>9.1f}MB/s {mb / current:>9.1f}MB/s {legacy / current:>7.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=5, help="iterations per throughput measurement")
+    args = parser.parse_args(argv)
+
+    run_throughput(args.number)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Paced audio assembled locally from pre-rendered cue clips.
+
+Breathing exercises repeat a handful of short cues ("Breathe in", "Hold",
+counts) for minutes on end, so synthesizing their script would send the
+same words to Deepgram again and again. A CueLibrary instead renders each
+cue once with a DeepgramVoice and keeps the MP3. Clips are saved to
+CUE_CLIPS_DIR and reloaded from there, so a cue is rendered once for every
+worker and restart.
+
+A CueTrack then lays clips out on a timeline: each clip starts at a given
+time and the gaps are filled with silent MP3 frames. The clips' frames are
+spliced into an Mp3Assembly without decoding or copying, so any exercise
+and duration is assembled with no upstream calls once its clips exist.
+
+Environment variables:
+    CUE_CLIPS_DIR   directory rendered clips are kept in (cue_clips); set it
+                    empty to keep them in memory only
+"""
+import hashlib
+import logging
+import os
+import tempfile
+
+from audio_assembly import Mp3Assembly
+from audio_formats import MP3
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+CLIPS_DIR = os.getenv("CUE_CLIPS_DIR", "cue_clips")
+
+# Spoken counts, by number
+COUNT_WORDS = {
+    1: "One", 2: "Two", 3: "Three", 4: "Four", 5: "Five",
+    6: "Six", 7: "Seven", 8: "Eight", 9: "Nine", 10: "Ten",
+}
+
+# A count is dropped rather than spoken this late (e.g. after a long cue)
+LATE_COUNT_SECONDS = 0.25
+
+
+class CueLibrary:
+    """Cue clips of one voice, rendered on first use and kept in memory and in `directory`."""
+
+    def __init__(self, voice, directory=CLIPS_DIR):
+        self.voice = voice
+        self.directory = directory
+        self._clips = {}
+        # Each cue is loaded or rendered once at a time; different cues in parallel
+        self._renders = SingleFlight("cue_clips")
+
+    def _path(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.directory, f"{self.voice.model}-{digest}.mp3")
+
+    def _load(self, text):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(text), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("⚠️ Ignoring unreadable cue clip for '%s': %s", text, e)
+            return None
+
+    def _save(self, text, audio):
+        """Write a clip atomically, so other workers never read half of it."""
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".cue.", dir=self.directory)
+            with os.fdopen(fd, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, self._path(text))
+        except OSError as e:
+            logger.warning("⚠️ Could not save cue clip for '%s': %s", text, e)
+
+    def clip(self, text):
+        """MP3 bytes of `text`, rendered once and then reused."""
+        audio = self._clips.get(text)
+        if audio is not None:
+            return audio
+        return self._renders.do(text, self._fetch, text)
+
+    def _fetch(self, text):
+        audio = self._clips.get(text)
+        if audio is None:
+            audio = self._load(text)
+            if audio is None:
+                audio = self.voice.text_to_speech_chunked(text, MP3).to_bytes()
+                self._save(text, audio)
+                logger.info("🎙 Rendered cue clip '%s' (%d bytes)", text[:40], len(audio))
+            self._clips[text] = audio
+        return audio
+
+    def prerender(self, texts):
+        """Render every clip in `texts` that is not available yet; returns how many failed."""
+        failed = 0
+        for text in texts:
+            try:
+                self.clip(text)
+            except Exception as e:
+                logger.warning("⚠️ Could not render cue clip '%s': %s", text[:40], e)
+                failed += 1
+        return failed
+
+    def __len__(self):
+        return len(self._clips)
+
+
+class CueTrack:
+    """An Mp3Assembly built by placing cue clips at times, with silence in between."""
+
+    def __init__(self, library):
+        self.library = library
+        self.audio = Mp3Assembly()
+
+    @property
+    def position(self):
+        """Seconds of audio laid out so far."""
+        return self.audio.duration_seconds
+
+    def pad_to(self, seconds):
+        """Fill with silence up to `seconds` (no-op if already past it)."""
+        if seconds > self.position and self.audio.frame_count:
+            self.audio.append_silence(seconds - self.position)
+
+    def pause(self, seconds):
+        self.pad_to(self.position + seconds)
+
+    def cue(self, text, at=None):
+        """Play the clip for `text`, starting at `at` seconds or straight away."""
+        if at is not None:
+            self.pad_to(at)
+        self.audio.append(self.library.clip(text))
+
+    def breathe(self, phases, counted=True):
+        """
+        One breathing cycle: each phase is (cue, seconds). The cue starts the
+        phase and, when `counted`, the remaining seconds are counted aloud
+        ("Two", "Three", ...), each on its second. Counts that a long cue has
+        overrun are skipped, so the cycle keeps its pace.
+        """
+        for text, seconds in phases:
+            start = self.position
+            self.cue(text)
+            if counted:
+                for second in range(2, seconds + 1):
+                    at = start + second - 1
+                    if self.position <= at + LATE_COUNT_SECONDS and second in COUNT_WORDS:
+                        self.cue(COUNT_WORDS[second], at=at)
+            self.pad_to(start + seconds)
@@ -0,0 +1,226 @@
+"""
+Deepgram speech-to-text and text-to-speech shared by the services.
+
+All calls go through one pooled requests.Session, so consecutive requests
+reuse connections instead of repeating the TLS handshake. Synthesized audio
+is cached by voice, encoding (see audio_formats) and text in a single cache
+for every service in the process, and each voice keeps its own learned payload limit (see tts_limits)
+and hedging statistics (see hedging). requests is imported when the first
+call is made, or by warmup().
+
+Environment variables:
+    Deepgram_API          API key, read on first use
+    TTS_CACHE_SIZE        synthesized chunks to keep (512)
+    TTS_CACHE_TTL         seconds a chunk is fresh (86400)
+    TTS_CACHE_STALE_TTL   seconds a chunk may then be served stale (86400)
+"""
+import logging
+import os
+import threading
+
+import audio_preprocess
+from admission import UpstreamRateLimited, retry_after_from
+from audio_formats import MP3
+from hedging import hedged_call_from_env
+from metrics import record_upstream_error, time_stage, upstream_status
+from singleflight import request_key
+from stt_cache import TRANSCRIPT_CACHE, transcript_key
+from tracing import timed_iter
+from tts_chunking import iter_tts_chunks
+from tts_limits import TtsPayloadTooLarge, chunk_sizer, synthesize_within_limit
+from ttl_cache import StaleWhileRevalidateCache
+from uploads import UploadBody, upload_content_type
+
+logger = logging.getLogger(__name__)
+
+STT_URL = "https://api.deepgram.com/v1/listen?model=nova-2&smart_format=true&punctuate=true"
+TTS_URL = "https://api.deepgram.com/v1/speak?model={model}&{query}"
+
+# Synthesized audio only depends on the text, voice and encoding
+TTS_CACHE = StaleWhileRevalidateCache(
+    "tts_cache",
+    max_entries=int(os.getenv("TTS_CACHE_SIZE", 512)),
+    ttl=float(os.getenv("TTS_CACHE_TTL", 86400)),
+    stale_ttl=float(os.getenv("TTS_CACHE_STALE_TTL", 86400)),
+    size_of=len,
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def api_key():
+    return os.getenv("Deepgram_API")
+
+
+def http_session():
+    """The process-wide pooled session for Deepgram requests."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+                _session = session
+    return _session
+
+
+def warmup():
+    """Open the HTTP session and load the upload preprocessing ahead of the first request."""
+    http_session()
+    audio_preprocess.warmup()
+
+
+def speech_to_text(audio_file, service):
+    """
+    Use Deepgram API to convert speech to text.
+    The spooled upload is streamed as the raw request body; transcripts are
+    cached by audio content, so retried uploads skip the Deepgram call.
+    PCM WAV uploads are trimmed and converted to 16 kHz mono first.
+    Returns (transcript, audio_input), where audio_input describes that
+    preprocessing or is None.
+    """
+    cache_key = transcript_key(audio_file, STT_URL)
+    cached = TRANSCRIPT_CACHE.get(cache_key)
+    if cached is not None:
+        logger.info("♻️ Reusing cached transcript for identical audio")
+        return cached
+
+    with time_stage(service, "stt_preprocess"):
+        prepared = audio_preprocess.preprocess_upload(audio_file)
+    if prepared is not None:
+        body, audio_input = prepared
+        content_type = "audio/wav"
+        logger.info("✂️ Trimmed WAV upload from %.1fs to %.1fs (%d -> %d bytes)",
+                    audio_input["original_seconds"], audio_input["trimmed_seconds"],
+                    audio_input["bytes_uploaded"], audio_input["bytes_sent"])
+    else:
+        body, audio_input = UploadBody(audio_file), None
+        content_type = upload_content_type(audio_file)
+
+    headers = {
+        "Authorization": f"Token {api_key()}",
+        "Content-Type": content_type
+    }
+
+    import requests
+    try:
+        with time_stage(service, "stt"):
+            response = http_session().post(STT_URL, headers=headers, data=body)
+        response.raise_for_status()
+
+        result = response.json()
+
+        # Extract transcript from Deepgram response
+        if 'results' in result and 'channels' in result['results']:
+            alternatives = result['results']['channels'][0]['alternatives']
+            if alternatives and len(alternatives) > 0:
+                transcript = alternatives[0]['transcript']
+                if transcript:
+                    TRANSCRIPT_CACHE.put(cache_key, (transcript, audio_input))
+                return transcript, audio_input
+
+        return "", audio_input
+
+    except requests.exceptions.RequestException as e:
+        record_upstream_error(service, "deepgram_stt", upstream_status(e))
+        raise Exception(f"Deepgram STT failed: {str(e)}")
+    except KeyError as e:
+        raise Exception(f"Unexpected Deepgram response format: {str(e)}")
+
+
+class DeepgramVoice:
+    """One Aura voice used by `service`; metrics are labelled with the service."""
+
+    def __init__(self, model, service, timeout=30):
+        self.model = model
+        self.service = service
+        self.timeout = timeout
+        self.url = self.url_for(MP3)
+        # Chunk size learned from the payloads this voice accepts and rejects
+        self.sizer = chunk_sizer(model)
+        # Chunk requests slower than the p95 get a backup request (TTS_HEDGE=1)
+        self.hedge = hedged_call_from_env(model)
+
+    def url_for(self, audio_format):
+        return TTS_URL.format(model=self.model, query=audio_format.query)
+
+    def text_to_speech(self, text, audio_format=MP3):
+        """
+        Convert text to speech, sharing in-flight calls and cached audio for
+        identical text and encoding.
+        """
+        if not text or not text.strip():
+            raise Exception("No text provided for TTS")
+        return TTS_CACHE.get_or_compute(request_key(self.url_for(audio_format), text),
+                                        lambda: self.hedge.call(self._text_to_speech, text, audio_format))
+
+    def text_to_speech_chunked(self, text, audio_format=MP3):
+        """
+        Convert text of any length to speech in chunks sized to the voice's
+        learned payload limit. Returns the format's assembly of the chunk
+        audio (an Mp3Assembly for MP3).
+        """
+        audio = audio_format.assembly()
+        synthesized = 0
+        synthesize = lambda segment: self.text_to_speech(segment, audio_format)
+        for chunk in timed_iter(iter_tts_chunks(text, max_chars=self.sizer.chunk_size()), "chunking"):
+            for segment in synthesize_within_limit(chunk, synthesize, self.sizer):
+                audio.append(segment)
+                synthesized += 1
+        if not synthesized:
+            raise Exception("No text provided for TTS")
+        return audio
+
+    def _text_to_speech(self, text, audio_format=MP3):
+        """
+        Use Deepgram TTS API to convert text to speech. Text over the voice's
+        payload limit raises TtsPayloadTooLarge; callers split it further.
+        """
+        text = text.strip()
+        logger.debug("🎙️ Sending to TTS (%d chars): '%s...'", len(text), text[:100], extra={"sample": "tts_chunk"})
+
+        headers = {
+            "Authorization": f"Token {api_key()}",
+            "Content-Type": "application/json"
+        }
+
+        import requests
+        try:
+            with time_stage(self.service, "tts_chunk"):
+                response = http_session().post(self.url_for(audio_format), headers=headers,
+                                               json={"text": text}, timeout=self.timeout)
+
+            if response.status_code >= 400:
+                record_upstream_error(self.service, "deepgram_tts", str(response.status_code))
+
+            if response.status_code == 413:
+                raise TtsPayloadTooLarge(len(text))
+            elif response.status_code == 400:
+                logger.error("❌ Bad request. Response: %s", response.text)
+                raise Exception(f"Invalid text format for Deepgram TTS: {response.text}")
+            elif response.status_code == 401:
+                raise Exception("Deepgram API authentication failed")
+            elif response.status_code == 429:
+                raise UpstreamRateLimited("Deepgram TTS", retry_after_from(response))
+
+            response.raise_for_status()
+
+            # Verify we got audio content
+            if len(response.content) == 0:
+                raise Exception("Received empty audio response from Deepgram TTS")
+
+            logger.debug("✅ Generated audio: %d bytes", len(response.content), extra={"sample": "tts_chunk"})
+            return response.content
+
+        except requests.exceptions.Timeout:
+            record_upstream_error(self.service, "deepgram_tts", "timeout")
+            raise Exception("Deepgram TTS request timed out")
+        except requests.exceptions.RequestException as e:
+            if e.response is None:
+                record_upstream_error(self.service, "deepgram_tts", upstream_status(e))
+            logger.error("❌ Deepgram TTS failed: %s", e,
+                         extra={"response_body": getattr(e.response, 'text', None)})
+            raise Exception(f"Deepgram TTS failed: {str(e)}")
@@ -0,0 +1,88 @@
+"""
+Gemini access shared by the services.
+
+The SDK takes most of a second to import, so it is imported and configured
+with the Gemini_API key on first use (or by warmup()) rather than when the
+services load. Rate limiting (429) surfaces as UpstreamRateLimited, and
+other failures are counted as upstream errors of the calling service.
+"""
+import os
+import threading
+
+from admission import UpstreamRateLimited
+from metrics import record_upstream_error, time_stage, upstream_status
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def api_key():
+    return os.getenv("Gemini_API", "")
+
+
+def configure():
+    """Import the SDK and configure it with the API key, once; returns the SDK."""
+    global _configured
+    import google.generativeai as genai
+    if _configured:
+        return genai
+    with _configure_lock:
+        if not _configured:
+            genai.configure(api_key=api_key())
+            _configured = True
+    return genai
+
+
+def generative_model(name=DEFAULT_MODEL):
+    return configure().GenerativeModel(name)
+
+
+def warmup():
+    """Import and configure the SDK ahead of the first request."""
+    configure()
+
+
+def generate_text(contents, service, model_name=DEFAULT_MODEL):
+    """
+    Return Gemini's response text for `contents`, recording latency and
+    upstream errors for `service`.
+    """
+    model = generative_model(model_name)
+    from google.api_core.exceptions import ResourceExhausted
+    try:
+        with time_stage(service, "llm"):
+            response = model.generate_content(contents)
+    except ResourceExhausted as e:
+        record_upstream_error(service, "gemini", "429")
+        raise UpstreamRateLimited("Gemini") from e
+    except Exception as e:
+        record_upstream_error(service, "gemini", upstream_status(e))
+        raise
+    return response.text
+
+
+def stream_text(contents, service, model_name=DEFAULT_MODEL):
+    """
+    Yield Gemini's response text in pieces as it is generated. Only the time
+    to the first piece is recorded, since the consumer's work between pieces
+    would otherwise be counted as LLM latency.
+    """
+    model = generative_model(model_name)
+    from google.api_core.exceptions import ResourceExhausted
+    try:
+        with time_stage(service, "llm_first_chunk"):
+            chunks = iter(model.generate_content(contents, stream=True))
+            first = next(chunks, None)
+        if first is None:
+            return
+        yield first.text
+        for chunk in chunks:
+            yield chunk.text
+    except ResourceExhausted as e:
+        record_upstream_error(service, "gemini", "429")
+        raise UpstreamRateLimited("Gemini") from e
+    except Exception as e:
+        record_upstream_error(service, "gemini", upstream_status(e))
+        raise
@@ -1,125 +1,72 @@
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, Response
+from flask import Blueprint, request, jsonify, url_for
 import os
-import google.generativeai as genai
-import requests
 import uuid
-import io
-from werkzeug.utils import secure_filename
-import json
+from werkzeug.exceptions import HTTPException
 from datetime import datetime
-import re
 import random
+import math
+import threading
+import time
+from tts_chunking import iter_tts_chunks
+from app_logging import get_logger
+from metrics import record_cache_lookup, time_stage
+from uploads import upload_size
+from tracing import span, timed_iter
+from admission import UpstreamRateLimited
+from singleflight import SingleFlight, request_key
+from ttl_cache import StaleWhileRevalidateCache
+from tts_limits import synthesize_within_limit
+from audio_jobs import audio_job_queue
+from shared_store import StoredAudio, session_cache
+from audio_store import (AUDIO_STORE, IMMUTABLE, audio_fields, audio_response, is_audio_digest,
+                         session_audio)
+from audio_formats import MP3, format_for_extension, get_audio_format, requested_format
+from hls import playlist_response, target_duration_for, timestamp_tag
+from audio_assembly import Mp3Assembly
+from cue_clips import COUNT_WORDS, CueLibrary, CueTrack
+from compression import gzipped
+from session_index import DEFAULT_LIMIT, SESSION_INDEX, parse_time
+import deepgram_client
+import gemini_client
+from gemini_client import generate_text
+from deepgram_client import DeepgramVoice, speech_to_text
+from app_factory import Service, build_app
 
 # Load environment variables
 load_dotenv()
 
+SERVICE = "healty_lifestyle"
+logger = get_logger(SERVICE)
+# Per-chunk TTS events go to their own logger so they can be tuned via LOG_LEVELS.
+tts_logger = get_logger("healty_lifestyle.tts")
+
 # Set up API keys
 GENAI_API_KEY = os.getenv("Gemini_API")
 DEEPGRAM_API_KEY = os.getenv("Deepgram_API")
 
-# Configure Gemini
-genai.configure(api_key=GENAI_API_KEY)
+# Soothing voice model with conservative parameters
+voice = DeepgramVoice("aura-luna-en", SERVICE)
 
-def split_text_for_tts(text, max_chars=300):
+# Identical concurrent Gemini calls share one request. Prompts built only from
+# request parameters (yoga, nutrition, meditation) are also cached, and hot
+# entries are refreshed in the background instead of expiring under load.
+gemini_calls = SingleFlight("wellness_gemini")
+llm_cache = StaleWhileRevalidateCache(
+    "wellness_llm_cache",
+    max_entries=int(os.getenv("LLM_CACHE_SIZE", 256)),
+    ttl=float(os.getenv("LLM_CACHE_TTL", 600)),
+    stale_ttl=float(os.getenv("LLM_CACHE_STALE_TTL", 3600)),
+    size_of=len,
+)
+def split_text_for_tts(text, max_chars=None):
     """
-    Ultra-conservative text splitting for Deepgram TTS to prevent payload errors.
+    Split text for Deepgram TTS, by default at the chunk size learned for the voice.
     """
-    # Clean up the text first
-    text = text.strip()
-    if not text:
-        return []
-    
-    # Remove excessive whitespace and normalize
-    text = re.sub(r'\s+', ' ', text)
-    
-    chunks = []
-    
-    # First, split by paragraphs (double newlines)
-    paragraphs = text.split('\n\n')
-    
-    for paragraph in paragraphs:
-        paragraph = paragraph.strip()
-        if not paragraph:
-            continue
-            
-        # If paragraph is short enough, use it as is
-        if len(paragraph) <= max_chars:
-            chunks.append(paragraph)
-            continue
-        
-        # Split long paragraphs by sentences
-        sentences = re.split(r'(?<=[.!?])\s+', paragraph)
-        current_chunk = ""
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-            
-            # If single sentence is too long, split it further
-            if len(sentence) > max_chars:
-                # Split by commas, semicolons, or other natural breaks
-                sub_parts = re.split(r'[,;:]\s+', sentence)
-                for part in sub_parts:
-                    part = part.strip()
-                    if len(part) > max_chars:
-                        # Last resort: split by character count with word boundaries
-                        words = part.split()
-                        temp_chunk = ""
-                        for word in words:
-                            if len(temp_chunk + " " + word) <= max_chars:
-                                temp_chunk = temp_chunk + " " + word if temp_chunk else word
-                            else:
-                                if temp_chunk:
-                                    chunks.append(temp_chunk.strip())
-                                temp_chunk = word
-                        if temp_chunk:
-                            chunks.append(temp_chunk.strip())
-                    else:
-                        chunks.append(part)
-                continue
-            
-            # Check if adding this sentence would exceed the limit
-            test_chunk = current_chunk + " " + sentence if current_chunk else sentence
-            
-            if len(test_chunk) <= max_chars:
-                current_chunk = test_chunk
-            else:
-                # Save current chunk and start new one
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence
-
-        # Add the last chunk
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-
-    # Final validation and cleanup
-    validated_chunks = []
-    for chunk in chunks:
-        chunk = chunk.strip()
-        if chunk and len(chunk) <= max_chars:
-            validated_chunks.append(chunk)
-        elif chunk:
-            # Emergency split for oversized chunks
-            words = chunk.split()
-            temp_chunk = ""
-            for word in words:
-                if len(temp_chunk + " " + word) <= max_chars:
-                    temp_chunk = temp_chunk + " " + word if temp_chunk else word
-                else:
-                    if temp_chunk:
-                        validated_chunks.append(temp_chunk.strip())
-                    temp_chunk = word[:max_chars]  # Truncate very long words
-            if temp_chunk:
-                validated_chunks.append(temp_chunk.strip())
-    
-    print(f"📝 Split text into {len(validated_chunks)} chunks (max chars per chunk: {max_chars})")
-    for i, chunk in enumerate(validated_chunks):
-        print(f"   Chunk {i+1}: {len(chunk)} chars - '{chunk[:50]}...'")
-    
-    return validated_chunks
+    max_chars = max_chars or voice.sizer.chunk_size()
+    chunks = list(iter_tts_chunks(text, max_chars))
+    tts_logger.debug("📝 Split text into %d chunks (max chars per chunk: %d)", len(chunks), max_chars)
+    return chunks
 
 def allowed_file(filename):
     """Check if the uploaded file has an allowed extension."""
@@ -128,36 +75,25 @@ def allowed_file(filename):
 
 def deepgram_speech_to_text(audio_file):
     """
-    Use Deepgram API to convert speech to text.
+    Convert speech to text with Deepgram; returns (transcript, audio_input).
     """
-    url = "https://api.deepgram.com/v1/listen?model=nova-2&smart_format=true&punctuate=true"
-    
-    headers = {
-        "Authorization": f"Token {DEEPGRAM_API_KEY}",
-    }
-    
-    files = {
-        'audio': audio_file
-    }
-    
-    try:
-        response = requests.post(url, headers=headers, files=files)
-        response.raise_for_status()
-        
-        result = response.json()
-        
-        # Extract transcript from Deepgram response
-        if 'results' in result and 'channels' in result['results']:
-            alternatives = result['results']['channels'][0]['alternatives']
-            if alternatives and len(alternatives) > 0:
-                return alternatives[0]['transcript']
-        
-        return ""
-        
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Deepgram STT failed: {str(e)}")
-    except KeyError as e:
-        raise Exception(f"Unexpected Deepgram response format: {str(e)}")
+    return speech_to_text(audio_file, SERVICE)
+
+def generate_gemini_text(contents, cacheable=False):
+    """
+    Return Gemini's response text for `contents`. Identical concurrent calls
+    are coalesced; with cacheable=True the text is also cached.
+    """
+    key = request_key(*(contents if isinstance(contents, list) else [contents]))
+    if cacheable:
+        return llm_cache.get_or_compute(key, lambda: _call_gemini(contents))
+    return gemini_calls.do(key, _call_gemini, contents)
+
+def _call_gemini(contents):
+    """
+    Call Gemini and return the response text, recording latency and upstream errors.
+    """
+    return generate_text(contents, SERVICE)
 
 def get_wellness_response(user_message, session_type="general"):
     """
@@ -246,105 +182,47 @@ def get_wellness_response(user_message, session_type="general"):
     full_prompt = f"{base_prompt}\n\n{specific_prompt}\n\nRemember: Be their gentle guide toward healing and wellness. Always end with encouragement and remind them of their inner strength. Keep response concise for better audio processing. MAKE THE RESPONSE IN NOT MORE THAN 250 WORDS. DONOT EXCEED 250 WORDS."
     
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content([full_prompt, f"User says: {user_message}"])
-        return response.text
+        return generate_gemini_text([full_prompt, f"User says: {user_message}"])
+    except UpstreamRateLimited:
+        raise
     except Exception as e:
         raise Exception(f"Failed to generate wellness response: {str(e)}")
 
-def deepgram_text_to_speech(text):
+def deepgram_text_to_speech(text, audio_format=MP3):
     """
-    Use Deepgram TTS API to convert text to speech with ultra-conservative limits.
+    Convert text to speech, sharing in-flight calls and cached audio for
+    identical text. Text over the voice's payload limit raises
+    TtsPayloadTooLarge; callers split it further.
     """
-    max_chars = 250  # Very conservative limit
-    
-    # Validate and truncate if necessary
-    if not text or not text.strip():
-        raise Exception("No text provided for TTS")
-    
-    text = text.strip()
-    if len(text) > max_chars:
-        print(f"⚠️ Truncating text from {len(text)} to {max_chars} characters")
-        # Try to truncate at sentence boundary
-        sentences = re.split(r'(?<=[.!?])\s+', text)
-        truncated = ""
-        for sentence in sentences:
-            if len(truncated + sentence) <= max_chars:
-                truncated += sentence + " "
-            else:
-                break
-        text = truncated.strip() if truncated.strip() else text[:max_chars].strip()
-
-    # Log what we're sending to TTS
-    print(f"🎙️ Sending to TTS ({len(text)} chars): '{text[:100]}...'")
-
-    # Using a soothing voice model with conservative parameters
-    url = "https://api.deepgram.com/v1/speak?model=aura-luna-en&encoding=mp3"
-
-    headers = {
-        "Authorization": f"Token {DEEPGRAM_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    payload = {
-        "text": text
-    }
+    return voice.text_to_speech(text, audio_format)
 
-    try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        
-        # Detailed error checking
-        if response.status_code == 413:
-            raise Exception(f"Text payload too large ({len(text)} chars). Deepgram rejected it.")
-        elif response.status_code == 400:
-            print(f"❌ Bad request. Response: {response.text}")
-            raise Exception(f"Invalid text format for Deepgram TTS: {response.text}")
-        elif response.status_code == 401:
-            raise Exception("Deepgram API authentication failed")
-        elif response.status_code == 429:
-            raise Exception("Deepgram API rate limit exceeded")
-        
-        response.raise_for_status()
-        
-        # Verify we got audio content
-        if len(response.content) == 0:
-            raise Exception("Received empty audio response from Deepgram TTS")
-        
-        print(f"✅ Generated audio: {len(response.content)} bytes")
-        return response.content
-        
-    except requests.exceptions.Timeout:
-        raise Exception("Deepgram TTS request timed out")
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Deepgram TTS failed: {str(e)}")
-        if hasattr(e.response, 'text'):
-            print(f"❌ Response body: {e.response.text}")
-        raise Exception(f"Deepgram TTS failed: {str(e)}")
-
-def deepgram_text_to_speech_multi(text):
+def deepgram_text_to_speech_multi(text, audio_format=MP3, progress=None):
     """
     Split long text and generate combined TTS audio with extensive error handling.
+    Returns the format's assembly of the chunk audio (an Mp3Assembly for
+    MP3). progress(fraction), if given, is called with the share of the text
+    processed after each chunk.
     """
     if not text or not text.strip():
         raise Exception("No text provided for TTS")
     
-    print(f"🔍 Starting TTS for text length: {len(text)} characters")
-    print(f"📄 Full text being processed: '{text[:200]}...'")
-    
-    # Use very conservative chunking
-    chunks = split_text_for_tts(text, max_chars=250)
-    
-    if not chunks:
-        raise Exception("Failed to split text into chunks")
+    tts_logger.info("🔍 Starting TTS for text length: %d characters", len(text))
+    tts_logger.debug("📄 Full text being processed: '%s...'", text[:200])
     
-    combined_audio = b""
+    # Chunk files are spliced without copying the audio.
+    combined_audio = audio_format.assembly()
     successful_chunks = 0
     failed_chunks = []
     chunk_details = []
+    chunk_count = 0
+    total_chars = len(' '.join(text.split()))
+    processed_chars = 0
 
-    print(f"🔍 Processing {len(chunks)} text chunks for TTS")
-
-    for idx, chunk in enumerate(chunks):
+    # Chunks are sized from the payload limit learned for this voice and
+    # split lazily, so the first TTS request goes out before the rest of the
+    # text has been split. Chunks rejected as too large are split again.
+    for idx, chunk in enumerate(timed_iter(iter_tts_chunks(text, max_chars=voice.sizer.chunk_size()), "chunking")):
+        chunk_count += 1
         chunk_info = {
             'index': idx + 1,
             'text': chunk,
@@ -353,115 +231,195 @@ def deepgram_text_to_speech_multi(text):
         }
         
         try:
-            print(f"🎙 Processing chunk {idx + 1}/{len(chunks)}: {len(chunk)} characters")
-            print(f"📝 Chunk content: '{chunk[:100]}...'")
-            
-            # Additional safety check
-            if len(chunk) > 300:
-                print(f"⚠️ Chunk {idx + 1} too long ({len(chunk)} chars), skipping")
-                chunk_info['status'] = 'skipped_too_long'
-                chunk_info['error'] = f"Too long ({len(chunk)} chars)"
-                failed_chunks.append(f"Chunk {idx + 1}: too long")
-                chunk_details.append(chunk_info)
-                continue
+            tts_logger.debug("🎙 Processing chunk %d: %d characters", idx + 1, len(chunk), extra={"sample": "tts_chunk"})
             
-            audio = deepgram_text_to_speech(chunk)
-            if audio and len(audio) > 0:
-                combined_audio += audio
-                successful_chunks += 1
-                chunk_info['status'] = 'success'
-                chunk_info['audio_size'] = len(audio)
-                print(f"✅ Chunk {idx + 1} processed successfully ({len(audio)} bytes)")
-            else:
-                chunk_info['status'] = 'failed_empty'
-                chunk_info['error'] = 'Empty audio response'
-                failed_chunks.append(f"Chunk {idx + 1}: empty audio")
+            segments = synthesize_within_limit(chunk, lambda part: deepgram_text_to_speech(part, audio_format),
+                                               voice.sizer)
+            audio_size = 0
+            for audio in segments:
+                combined_audio.append(audio)
+                audio_size += len(audio)
+            successful_chunks += 1
+            chunk_info['status'] = 'success' if len(segments) == 1 else 'split'
+            chunk_info['audio_size'] = audio_size
+            tts_logger.debug("✅ Chunk %d processed successfully (%d bytes in %d requests)",
+                             idx + 1, audio_size, len(segments), extra={"sample": "tts_chunk"})
                 
+        except UpstreamRateLimited:
+            # Further chunks would be rejected too; give up on audio for now
+            raise
         except Exception as e:
             error_msg = str(e)
             chunk_info['status'] = 'failed'
             chunk_info['error'] = error_msg
-            print(f"❌ Failed to generate audio for chunk {idx + 1}: {error_msg}")
+            tts_logger.warning("❌ Failed to generate audio for chunk %d: %s", idx + 1, error_msg)
             failed_chunks.append(f"Chunk {idx + 1}: {error_msg}")
-            
-            # Try emergency mini-chunking for oversized chunks
-            if "413" in error_msg or "too large" in error_msg.lower() or "payload" in error_msg.lower():
-                print(f"🔄 Attempting emergency mini-chunking for chunk {idx + 1}")
-                try:
-                    mini_chunks = split_text_for_tts(chunk, max_chars=150)
-                    mini_success = 0
-                    for mini_idx, mini_chunk in enumerate(mini_chunks):
-                        try:
-                            if len(mini_chunk) <= 200:  # Extra safety
-                                mini_audio = deepgram_text_to_speech(mini_chunk)
-                                if mini_audio and len(mini_audio) > 0:
-                                    combined_audio += mini_audio
-                                    mini_success += 1
-                                    print(f"✅ Mini-chunk {mini_idx + 1} successful")
-                        except Exception as mini_e:
-                            print(f"❌ Mini-chunk {mini_idx + 1} failed: {str(mini_e)}")
-                    
-                    if mini_success > 0:
-                        successful_chunks += 0.5  # Partial success
-                        chunk_info['status'] = 'partial_success'
-                        chunk_info['mini_chunks_success'] = mini_success
-                        chunk_info['mini_chunks_total'] = len(mini_chunks)
-                        
-                except Exception as split_e:
-                    print(f"❌ Emergency chunking failed: {str(split_e)}")
-            
-            continue
         
         chunk_details.append(chunk_info)
+        processed_chars += len(chunk) + 1
+        if progress is not None:
+            progress(processed_chars / total_chars)
 
-    # Log detailed results
-    print(f"\n📊 TTS Processing Summary:")
-    print(f"   Total chunks: {len(chunks)}")
-    print(f"   Successful: {successful_chunks}")
-    print(f"   Failed: {len(failed_chunks)}")
-    print(f"   Combined audio size: {len(combined_audio)} bytes")
-    
-    for detail in chunk_details:
-        status_emoji = {
-            'success': '✅',
-            'failed': '❌',
-            'skipped_too_long': '⏭️',
-            'failed_empty': '🔇',
-            'partial_success': '🟡'
-        }.get(detail['status'], '❓')
-        
-        print(f"   {status_emoji} Chunk {detail['index']}: {detail['length']} chars - {detail['status']}")
-        if 'error' in detail:
-            print(f"      Error: {detail['error']}")
+    # Log detailed results as a single structured record
+    tts_logger.info("📊 TTS Processing Summary", extra={
+        "total_chunks": chunk_count,
+        "successful_chunks": successful_chunks,
+        "failed_chunks": len(failed_chunks),
+        "audio_bytes": len(combined_audio),
+        "audio_duration": round(combined_audio.duration_seconds, 2),
+        "chunk_statuses": [
+            {key: detail[key] for key in ('index', 'length', 'status', 'error') if key in detail}
+            for detail in chunk_details
+        ],
+    })
 
     if successful_chunks == 0:
         error_summary = '; '.join(failed_chunks[:3])  # Limit error message length
         raise Exception(f"Failed to generate audio for any text chunks. Sample errors: {error_summary}")
     
-    print(f"🎵 Final combined audio: {len(combined_audio)} bytes from {successful_chunks} successful chunks")
     return combined_audio
 
-# Flask App Setup
-app = Flask(__name__)
-from flask_cors import CORS
-CORS(app)
+# Routes are served by the standalone app below, or mounted under /wellness by app_factory
+bp = Blueprint(SERVICE, __name__)
 
 # Configuration
 ALLOWED_AUDIO_EXTENSIONS = {'wav', 'mp3', 'm4a', 'flac', 'webm', 'ogg'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
-# Store audio responses temporarily in memory
-audio_cache = {}
+# Session responses, shared by all workers when SHARED_STORE_DIR is set; the
+# audio itself is kept once per content digest in AUDIO_STORE
+audio_cache = session_cache("wellness_audio_cache")
 
 # Store user wellness sessions (in-memory for demo - use database in production)
 wellness_sessions = {}
 
-@app.route('/health', methods=['GET'])
+def store_session(session_id, entry):
+    """
+    Store a session entry in audio_cache and its metadata in SESSION_INDEX,
+    which /sessions lists without reading the cache.
+    """
+    audio_cache[session_id] = entry
+    SESSION_INDEX.record(SERVICE, session_id, entry)
+
+# Audio for "async" requests is synthesized here after the text is returned
+audio_jobs = audio_job_queue("wellness_audio")
+DEFAULT_AUDIO_MODE = os.getenv("AUDIO_MODE", "sync")
+
+def requested_audio_mode(data=None):
+    """
+    "async" to return text at once and synthesize audio in the background,
+    or "sync" to include the audio in the response. Taken from the
+    audio_mode query parameter, JSON field or form field, else AUDIO_MODE.
+    """
+    mode = (request.args.get('audio_mode') or (data or {}).get('audio_mode')
+            or request.form.get('audio_mode') or DEFAULT_AUDIO_MODE)
+    return "async" if str(mode).lower() == "async" else "sync"
+
+def attach_audio(session_id, text, session_data, response_data, audio_mode="sync", audio_format=MP3):
+    """
+    Synthesize `text` for a session, storing it in AUDIO_STORE and the
+    session (with `session_data` and the audio's digest) in audio_cache, and
+    describing it in `response_data`. Audio failures are
+    reported in the response rather than raised. Audio is synthesized in
+    `audio_format`; /get_audio adds other formats on request. In "async" mode the audio
+    is left to a background job and the response says audio_status "pending";
+    /get_audio answers 202 until it is ready. A full job queue falls back to
+    synthesizing in the request.
+    """
+    entry = dict(session_data, response_text=text, timestamp=datetime.now().isoformat())
+    audio_url = url_for('.get_audio', session_id=session_id, _external=True)
+
+    if audio_mode == "async":
+        entry.update(audio_job_status="queued", audio_progress=0.0)
+
+        def synthesize(job):
+            # The entry is stored again as the job advances, so every worker
+            # sharing audio_cache can report on it
+            def progress(fraction):
+                job.set_progress(fraction)
+                entry.update(audio_job_status="running", audio_progress=round(job.progress, 3))
+                store_session(session_id, entry)
+
+            progress(0.0)
+            try:
+                with time_stage(SERVICE, "tts"):
+                    audio_content = deepgram_text_to_speech_multi(text, audio_format, progress=progress)
+            except Exception as audio_error:
+                entry.update(audio_job_status="failed", audio_error=str(audio_error))
+                store_session(session_id, entry)
+                raise
+            entry.update(audio_job_status="ready", audio_progress=1.0, **audio_fields(audio_content, audio_format))
+            store_session(session_id, entry)
+
+        store_session(session_id, entry)
+        if audio_jobs.submit(session_id, synthesize) is not None:
+            response_data.update({
+                "audio_status": "pending",
+                "audio_url": audio_url,
+                "audio_job_url": url_for('.audio_job', session_id=session_id, _external=True),
+            })
+            logger.info("⏳ Text response ready, audio queued", extra={"session_id": session_id})
+            return
+        logger.warning("⚠️ Audio job queue full, synthesizing in the request")
+        del entry['audio_job_status'], entry['audio_progress']
+
+    try:
+        logger.info("🎵 Generating calming audio response...")
+        with time_stage(SERVICE, "tts"):
+            audio_content = deepgram_text_to_speech_multi(text, audio_format)
+        entry.update(audio_fields(audio_content, audio_format))
+        response_data.update({
+            "audio_available": True,
+            "audio_status": "ready",
+            "audio_url": audio_url,
+            "audio_content_url": content_audio_url(entry),
+            "audio_format": audio_format.name,
+            "audio_size": len(audio_content),
+            "audio_duration": round(audio_content.duration_seconds, 2)
+        })
+        logger.info("✨ Response with audio ready", extra={"session_id": session_id})
+    except Exception as audio_error:
+        logger.warning("⚠️ Audio generation failed, returning text-only response: %s", audio_error)
+        entry['audio_error'] = str(audio_error)
+        response_data.update({"audio_status": "failed", "audio_error": str(audio_error)})
+    store_session(session_id, entry)
+
+def content_audio_url(entry):
+    """Content-addressed URL of a session's first audio variant."""
+    extension = get_audio_format(entry.get('audio_format', MP3.name)).extension
+    return url_for('.content_audio', digest=entry['audio_sha256'], extension=extension, _external=True)
+
+def audio_job_status(session_id, entry=None):
+    """Status of the session's background audio job, or None if it has none."""
+    if entry is None:
+        entry = audio_cache.get(session_id)
+    if not entry or 'audio_job_status' not in entry:
+        return None
+    status = {
+        "job_id": session_id,
+        "session_id": session_id,
+        "status": entry['audio_job_status'],
+        "progress": entry.get('audio_progress', 0.0),
+    }
+    if entry.get('audio_error'):
+        status["error"] = entry['audio_error']
+    if entry.get('audio_sha256'):
+        status["audio_content_url"] = content_audio_url(entry)
+    # Jobs queued in this worker also know their place in the queue
+    job = audio_jobs.get(session_id)
+    if job is not None:
+        status.update(job.to_dict())
+        if not job.done:
+            status["queue_position"] = audio_jobs.position(job)
+            status["queue_depth"] = audio_jobs.stats()["queued"]
+    return status
+
+@bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
     return jsonify({"status": "healthy", "service": "AI Wellness Coach - Dr. Serenity"}), 200
 
-@app.route('/wellness_chat', methods=['POST'])
+@bp.route('/wellness_chat', methods=['POST'])
 def wellness_chat():
     """
     Main wellness chat endpoint - accepts text or audio input.
@@ -469,12 +427,18 @@ def wellness_chat():
     """
     try:
         user_message = None
+        audio_input = None
         session_type = "general"
+
+        # Parsing the multipart body reads the whole upload
+        with span("upload"):
+            has_audio = 'audio' in request.files
         
-        # Check for text message in JSON
-        if request.json:
-            user_message = request.json.get('message', '').strip()
-            session_type = request.json.get('type', 'general')
+        # Check for text message in JSON (multipart uploads are not JSON)
+        data = request.get_json(silent=True)
+        if data:
+            user_message = data.get('message', '').strip()
+            session_type = data.get('type', 'general')
         
         # Check for text message in form data
         elif request.form.get("message"):
@@ -482,7 +446,7 @@ def wellness_chat():
             session_type = request.form.get("type", "general")
         
         # Check if audio file is uploaded
-        elif 'audio' in request.files:
+        elif has_audio:
             audio_file = request.files['audio']
             
             if audio_file.filename == '':
@@ -491,16 +455,12 @@ def wellness_chat():
             if not allowed_file(audio_file.filename):
                 return jsonify({"error": f"Unsupported audio format. Allowed: {', '.join(ALLOWED_AUDIO_EXTENSIONS)}"}), 400
             
-            # Check file size
-            audio_file.seek(0, os.SEEK_END)
-            file_size = audio_file.tell()
-            audio_file.seek(0)
-            
-            if file_size > MAX_FILE_SIZE:
+            # The request body is capped while reading; this checks the file itself
+            if upload_size(audio_file) > MAX_FILE_SIZE:
                 return jsonify({"error": "Audio file too large. Maximum size: 10MB"}), 400
             
-            print("🎧 Converting speech to text...")
-            user_message = deepgram_speech_to_text(audio_file)
+            logger.info("🎧 Converting speech to text...")
+            user_message, audio_input = deepgram_speech_to_text(audio_file)
             
             if not user_message.strip():
                 return jsonify({"error": "Could not understand the audio. Please try speaking clearly and try again."}), 400
@@ -508,10 +468,10 @@ def wellness_chat():
         if not user_message:
             return jsonify({"error": "Please share what's on your mind (text or voice message)"}), 400
 
-        print(f"💭 Processing {session_type} session: {user_message[:100]}...")
+        logger.debug("💭 Processing %s session: %s...", session_type, user_message[:100])
         
         # Generate wellness response
-        print("🌱 Generating wellness response...")
+        logger.info("🌱 Generating wellness response...", extra={"session_type": session_type})
         response_text = get_wellness_response(user_message, session_type)
 
         # Always prepare the text response first
@@ -523,50 +483,27 @@ def wellness_chat():
             "session_type": session_type,
             "wellness_tip": get_daily_wellness_tip(),
             "audio_available": False,
-            "text_sent_to_tts": response_text  # Always show what text is being processed
+            "text_sent_to_tts": response_text,  # Always show what text is being processed
+            "audio_input": audio_input  # WAV preprocessing applied to a voice message, if any
         }
 
         # Try to generate audio, but don't fail if it doesn't work
-        try:
-            print("🎵 Generating calming audio response...")
-            audio_content = deepgram_text_to_speech_multi(response_text)
-            
-            # Store session data with audio
-            audio_cache[session_id] = {
-                'audio_content': audio_content,
-                'response_text': response_text,
-                'user_message': user_message,
-                'session_type': session_type,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            response_data.update({
-                "audio_available": True,
-                "audio_url": f"{request.host_url}get_audio/{session_id}",
-                "audio_size": len(audio_content)
-            })
-            print("✨ Wellness response with audio ready")
-            
-        except Exception as audio_error:
-            print(f"⚠️ Audio generation failed: {audio_error}")
-            print("📝 Returning text-only response")
-            # Store session data without audio
-            audio_cache[session_id] = {
-                'response_text': response_text,
-                'user_message': user_message,
-                'session_type': session_type,
-                'timestamp': datetime.now().isoformat(),
-                'audio_error': str(audio_error)
-            }
-            response_data['audio_error'] = str(audio_error)
+        attach_audio(session_id, response_text, {
+            'user_message': user_message,
+            'session_type': session_type,
+        }, response_data, requested_audio_mode(data), requested_format(data))
 
-        return jsonify(response_data)
+        with span("serialize"):
+            return jsonify(response_data)
 
+    except HTTPException:
+        # e.g. 413 from the upload size cap
+        raise
     except Exception as e:
-        print(f"❌ Error: {e}")
+        logger.exception("❌ Error: %s", e)
         return jsonify({"error": f"I'm here to listen. Please try again: {str(e)}"}), 500
 
-@app.route('/yoga_sequence', methods=['POST'])
+@bp.route('/yoga_sequence', methods=['POST'])
 def yoga_sequence():
     """
     Generate personalized yoga sequence based on user needs.
@@ -596,14 +533,11 @@ def yoga_sequence():
         MAKE SURE THAT YOU DONT EXCEED MORE THAN 200-300 words
         """
         
-        print(f"🧘‍♀️ Generating yoga sequence for: {need}, {duration}min, {level} level")
+        logger.info("🧘‍♀️ Generating yoga sequence for: %s, %smin, %s level", need, duration, level)
         
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(yoga_prompt)
-        sequence_text = response.text
+        sequence_text = generate_gemini_text(yoga_prompt, cacheable=True)
         
-        print(f"📝 Generated yoga sequence ({len(sequence_text)} chars):")
-        print(f"   Preview: {sequence_text[:150]}...")
+        logger.debug("📝 Generated yoga sequence (%d chars): %s...", len(sequence_text), sequence_text[:150])
         
         session_id = str(uuid.uuid4())
         response_data = {
@@ -623,42 +557,23 @@ def yoga_sequence():
         }
         
         # Try to generate audio
-        try:
-            print("🎵 Generating audio for yoga sequence...")
-            audio_content = deepgram_text_to_speech_multi(sequence_text)
-            audio_cache[session_id] = {
-                'audio_content': audio_content,
-                'response_text': sequence_text,
-                'type': 'yoga_sequence',
-                'need': need,
-                'duration': duration,
-                'level': level,
-                'timestamp': datetime.now().isoformat()
-            }
-            response_data.update({
-                "audio_available": True,
-                "audio_url": f"{request.host_url}get_audio/{session_id}",
-                "audio_size": len(audio_content)
-            })
-            print("✅ Yoga sequence with audio ready")
-            
-        except Exception as audio_error:
-            print(f"⚠️ Audio generation failed for yoga sequence: {audio_error}")
-            audio_cache[session_id] = {
-                'response_text': sequence_text,
-                'type': 'yoga_sequence',
-                'audio_error': str(audio_error),
-                'timestamp': datetime.now().isoformat()
-            }
-            response_data['audio_error'] = str(audio_error)
-        
-        return jsonify(response_data)
-        
+        attach_audio(session_id, sequence_text, {
+            'type': 'yoga_sequence',
+            'need': need,
+            'duration': duration,
+            'level': level,
+        }, response_data, requested_audio_mode(data), requested_format(data))
+        
+        with span("serialize"):
+            return jsonify(response_data)
+        
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Yoga sequence error: {e}")
+        logger.exception("❌ Yoga sequence error: %s", e)
         return jsonify({"error": str(e)}), 500
 
-@app.route('/nutrition_plan', methods=['POST'])
+@bp.route('/nutrition_plan', methods=['POST'])
 def nutrition_plan():
     """
     Generate personalized nutrition and wellness routine.
@@ -689,9 +604,7 @@ def nutrition_plan():
         MAKE SURE THAT YOU DONT EXCEED MORE THAN 200-300 words
         """
         
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(nutrition_prompt)
-        plan_text = response.text
+        plan_text = generate_gemini_text(nutrition_prompt, cacheable=True)
         
         return jsonify({
             "nutrition_plan": plan_text,
@@ -702,42 +615,374 @@ def nutrition_plan():
             "wellness_reminder": "Remember: Small, consistent changes create lasting transformation. Be patient and kind with yourself."
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Nutrition plan error: {e}")
+        logger.exception("❌ Nutrition plan error: %s", e)
         return jsonify({"error": str(e)}), 500
 
-@app.route('/get_audio/<session_id>', methods=['GET'])
+@bp.route('/get_audio/<session_id>', methods=['GET'])
 def get_audio(session_id):
     """
-    Stream the cached audio response.
+    Stream the cached audio response in the format asked for by ?format= or
+    the Accept header; other formats are synthesized on first request and
+    kept alongside. Replays are revalidated against the ETag (the audio's
+    content digest) and answered with 304.
     """
     try:
-        if session_id not in audio_cache:
+        cached_data = audio_cache.get(session_id)
+        record_cache_lookup("wellness_audio_cache", cached_data is not None)
+        if cached_data is None:
             return jsonify({"error": "Audio not found or expired"}), 404
         
-        cached_data = audio_cache[session_id]
-        
-        if 'audio_content' not in cached_data:
-            return jsonify({"error": "Audio not available for this session"}), 404
+        job_status = audio_job_status(session_id, cached_data)
+        if job_status is not None and job_status["status"] in ("queued", "running"):
+            # Still being synthesized; poll again shortly
+            response = jsonify(dict(job_status, audio_status="pending"))
+            response.status_code = 202
+            response.headers["Retry-After"] = "1"
+            return response
+        
+        if 'audio_sha256' not in cached_data:
+            return jsonify({
+                "error": "Audio not available for this session",
+                "audio_error": cached_data.get('audio_error')
+            }), 404
             
-        audio_content = cached_data['audio_content']
-        
-        return Response(
-            audio_content,
-            mimetype="audio/mpeg",
-            headers={
-                "Content-Disposition": f"inline; filename=wellness_response_{session_id}.mp3",
-                "Content-Length": str(len(audio_content)),
-                "Cache-Control": "no-cache",
-                "Accept-Ranges": "bytes"
-            }
-        )
-        
+        audio_format = requested_format()
+        with time_stage(SERVICE, "tts"):
+            audio_content, audio_digest, changed = session_audio(
+                cached_data, audio_format, deepgram_text_to_speech_multi)
+        if audio_content is None:
+            return jsonify({"error": "Audio not found or expired"}), 404
+        if changed:
+            store_session(session_id, cached_data)
+        
+        response = audio_response(audio_content, audio_digest,
+                                  f"wellness_response_{session_id}.{audio_format.extension}",
+                                  mimetype=audio_format.mimetype)
+        response.vary.add("Accept")
+        return response
+        
+    except HTTPException:
+        # e.g. 400 for an unknown format
+        raise
     except Exception as e:
-        print(f"❌ Audio streaming error: {e}")
+        logger.exception("❌ Audio streaming error: %s", e)
         return jsonify({"error": "Failed to serve audio response"}), 500
 
-@app.route('/guided_meditation', methods=['POST'])
+@bp.route('/audio/<digest>.<extension>', methods=['GET'])
+def content_audio(digest, extension):
+    """
+    Serve audio by content digest. The URL always names the same bytes, so
+    it may be cached forever.
+    """
+    audio_format = format_for_extension(extension)
+    audio_content = AUDIO_STORE.get_as(digest, audio_format) if audio_format and is_audio_digest(digest) else None
+    if audio_content is None:
+        return jsonify({"error": "Audio not found or expired"}), 404
+    return audio_response(audio_content, digest, f"{digest}.{extension}", IMMUTABLE,
+                          mimetype=audio_format.mimetype)
+
+@bp.route('/audio_jobs', methods=['GET'])
+def audio_jobs_status():
+    """
+    Background audio job queue depth and recent outcomes.
+    """
+    return jsonify(audio_jobs.stats())
+
+@bp.route('/audio_jobs/<session_id>', methods=['GET'])
+def audio_job(session_id):
+    """
+    Status and progress of a session's background audio job.
+    """
+    status = audio_job_status(session_id)
+    if status is None:
+        return jsonify({"error": "No audio job for this session"}), 404
+    status["queue_depth"] = audio_jobs.stats()["queued"]
+    return jsonify(status)
+
+# Long meditations can instead be delivered as an HLS playlist of MP3
+# segments. Each segment's script is generated and synthesized on its own, and
+# only MEDITATION_LOOKAHEAD segments ahead of the last one the listener has
+# fetched, so playback starts after the first segment and a listener who stops
+# early costs no further Gemini or Deepgram calls.
+DEFAULT_MEDITATION_DELIVERY = os.getenv("MEDITATION_DELIVERY", "single")
+MEDITATION_SEGMENT_MINUTES = float(os.getenv("MEDITATION_SEGMENT_MINUTES", 2))
+MEDITATION_LOOKAHEAD = int(os.getenv("MEDITATION_LOOKAHEAD", 2))
+MEDITATION_MAX_SEGMENTS = int(os.getenv("MEDITATION_MAX_SEGMENTS", 60))
+# Slow guidance with pauses, in words per minute of meditation
+MEDITATION_WORDS_PER_MINUTE = 80
+# A producer that has not reported for this long is presumed lost and replaced
+MEDITATION_STALL_SECONDS = 120
+# Consecutive failures of one segment before the playlist is closed without it
+MEDITATION_SEGMENT_ATTEMPTS = 3
+
+MEDITATION_PHASES = (
+    "a gentle introduction: welcome the listener and help them settle in",
+    "breathing awareness and relaxation of the body",
+    "the main {meditation_type} meditation practice",
+    "a gentle return to awareness of the body and the room",
+    "closing affirmations of loving-kindness and encouragement",
+)
+
+def requested_delivery(data=None):
+    """
+    "segmented" for an HLS playlist of segments produced just in time, or
+    "single" for one audio file. Taken from the delivery query parameter or
+    JSON field, else MEDITATION_DELIVERY.
+    """
+    delivery = request.args.get('delivery') or (data or {}).get('delivery') or DEFAULT_MEDITATION_DELIVERY
+    return "segmented" if str(delivery).lower() == "segmented" else "single"
+
+def meditation_plan(meditation_type, minutes):
+    """
+    What each segment of a `minutes`-long meditation covers: one segment per
+    MEDITATION_SEGMENT_MINUTES, at least three and at most
+    MEDITATION_MAX_SEGMENTS, with the main practice spread over the middle.
+    """
+    count = min(MEDITATION_MAX_SEGMENTS, max(3, math.ceil(minutes / MEDITATION_SEGMENT_MINUTES)))
+    introduction, breathing, practice, awakening, closing = MEDITATION_PHASES
+    opening = [introduction] + ([breathing] if count >= 5 else [])
+    ending = ([awakening] if count >= 4 else []) + [closing]
+    middle = count - len(opening) - len(ending)
+    practice = practice.format(meditation_type=meditation_type)
+    if middle > 1:
+        return opening + [f"{practice} (part {i + 1} of {middle})" for i in range(middle)] + ending
+    return opening + [practice] + ending
+
+def meditation_segment_prompt(entry, index):
+    """Gemini prompt for segment `index` of a segmented meditation, continuing the one before it."""
+    plan = entry['segment_plan']
+    words = int(MEDITATION_SEGMENT_MINUTES * MEDITATION_WORDS_PER_MINUTE)
+    prompt = f"""
+        You are writing part {index + 1} of {len(plan)} of a {entry['duration']}-minute guided {entry['meditation_type']} meditation script.
+        This part covers {plan[index]}.
+        Write about {words} words of calming, slow-paced guidance with natural pauses.
+        Include gentle guidance for the mind when it wanders.
+        Write it as if you're speaking directly to someone in a soothing voice.
+        Use simple, clear language that flows well when spoken aloud.
+        """
+    if index > 0:
+        previous = entry['segments'][index - 1]['text'][-400:]
+        prompt += f"""Continue seamlessly from where the previous part ended, without welcoming the listener again:
+        "...{previous}"
+        """
+    if index < len(plan) - 1:
+        prompt += "Do not end the meditation; more guidance follows this part.\n"
+    return prompt
+
+def meditation_cursor_key(session_id):
+    # The listener's progress is stored apart from the session entry, which
+    # only the producer writes, so neither overwrites the other's updates
+    return f"{session_id}/segments_fetched"
+
+def meditation_segments_fetched(session_id):
+    """Index of the last segment the listener has fetched, or -1."""
+    cursor = audio_cache.get(meditation_cursor_key(session_id))
+    return cursor['index'] if cursor else -1
+
+# Sessions with a producer at work in this process; a second producer for
+# one of them (e.g. after a stall takeover) leaves it to the first
+_segment_producers = set()
+_segment_producers_lock = threading.Lock()
+
+def produce_meditation_segments(session_id, limit=None):
+    """
+    Produce a segmented meditation's next segments, script then audio,
+    storing the session entry after each one, until MEDITATION_LOOKAHEAD
+    segments are ready beyond the listener's position, `limit` segments have
+    been made or the meditation is complete. Returns straight away when
+    another producer in this process is at work on the session.
+    """
+    with _segment_producers_lock:
+        if session_id in _segment_producers:
+            return
+        _segment_producers.add(session_id)
+    try:
+        _produce_meditation_segments(session_id, limit)
+    finally:
+        with _segment_producers_lock:
+            _segment_producers.discard(session_id)
+
+def _produce_meditation_segments(session_id, limit):
+    produced = 0
+    while limit is None or produced < limit:
+        entry = audio_cache.get(session_id)
+        if entry is None:
+            return
+        index = len(entry['segments'])
+        if index >= len(entry['segment_plan']):
+            entry['segment_status'] = "complete"
+            store_session(session_id, entry)
+            return
+        if index > meditation_segments_fetched(session_id) + MEDITATION_LOOKAHEAD:
+            break
+        entry.update(segment_status="producing", segment_heartbeat=time.time())
+        store_session(session_id, entry)
+
+        def heartbeat(fraction):
+            # A long synthesis must not look like a stalled producer. The
+            # stored entry is updated, so a segment another worker has
+            # added meanwhile is not overwritten.
+            current = audio_cache.get(session_id)
+            if current is not None and len(current['segments']) == index:
+                current['segment_heartbeat'] = entry['segment_heartbeat'] = time.time()
+                store_session(session_id, current)
+
+        try:
+            text = generate_gemini_text(meditation_segment_prompt(entry, index), cacheable=True)
+            heartbeat(0.0)
+            with time_stage(SERVICE, "tts"):
+                audio_content = deepgram_text_to_speech_multi(text, MP3, progress=heartbeat)
+        except Exception as segment_error:
+            failures = entry.get('segment_failures', 0) + 1
+            entry.update(segment_failures=failures, segment_error=str(segment_error),
+                         segment_status="failed" if failures >= MEDITATION_SEGMENT_ATTEMPTS else "waiting")
+            store_session(session_id, entry)
+            raise
+        # Aura speaks the script faster than the planned pace, so each segment
+        # ends in silence up to its planned length: the playlist's target
+        # duration then matches the segments and the meditation its duration
+        audio_content.append_silence(MEDITATION_SEGMENT_MINUTES * 60 - audio_content.duration_seconds)
+        # Packed audio segments start with an ID3 tag giving their start time
+        start = sum(segment['audio_duration'] for segment in entry['segments'])
+        duration = audio_content.duration_seconds
+        if round(duration) > entry['target_duration']:
+            logger.warning("⚠️ Meditation segment %d runs %.1fs, over the %ds target duration",
+                           index + 1, duration, entry['target_duration'], extra={"session_id": session_id})
+        audio_content = StoredAudio(timestamp_tag(start) + audio_content.to_bytes(), duration)
+        current = audio_cache.get(session_id)
+        if current is None or len(current['segments']) != index:
+            # A producer in another worker got there first; its segment stands
+            logger.info("🧘 Meditation segment %d was produced elsewhere; discarding this one", index + 1,
+                        extra={"session_id": session_id})
+            return
+        entry['segments'].append({
+            'text': text,
+            'audio_sha256': AUDIO_STORE.put(audio_content),
+            'audio_duration': round(duration, 3),
+        })
+        entry['response_text'] = ' '.join(segment['text'] for segment in entry['segments'])
+        entry.pop('segment_error', None)
+        entry.update(segment_failures=0, segment_heartbeat=time.time())
+        produced += 1
+        logger.info("🧘 Meditation segment %d/%d ready", index + 1, len(entry['segment_plan']),
+                    extra={"session_id": session_id})
+        if index + 1 >= len(entry['segment_plan']):
+            entry['segment_status'] = "complete"
+            store_session(session_id, entry)
+            return
+        store_session(session_id, entry)
+    entry['segment_status'] = "waiting"
+    store_session(session_id, entry)
+
+def schedule_meditation_segments(session_id, entry):
+    """
+    Queue production of further segments when the listener is within
+    MEDITATION_LOOKAHEAD segments of the last one ready and no producer is
+    at work. Called whenever the playlist or a segment is fetched.
+    """
+    status = entry.get('segment_status')
+    if status in ("complete", "failed"):
+        return
+    if (status in ("queued", "producing")
+            and time.time() - entry.get('segment_heartbeat', 0) < MEDITATION_STALL_SECONDS):
+        return
+    if len(entry['segments']) > meditation_segments_fetched(session_id) + MEDITATION_LOOKAHEAD:
+        return
+    entry.update(segment_status="queued", segment_heartbeat=time.time())
+    store_session(session_id, entry)
+    if audio_jobs.submit(f"{session_id}/segments", lambda job: produce_meditation_segments(session_id)) is None:
+        # Queue full; the listener's next fetch tries again
+        entry['segment_status'] = "waiting"
+        store_session(session_id, entry)
+
+def meditation_playlist_entries(session_id, entry):
+    """(duration, URL) of each ready segment, for the playlist."""
+    return [
+        (segment['audio_duration'],
+         url_for('.meditation_segment', session_id=session_id, index=index, _external=True))
+        for index, segment in enumerate(entry['segments'])
+    ]
+
+def meditation_segments_status(session_id, entry):
+    """Progress of a segmented meditation, for JSON responses."""
+    status = {
+        "delivery": "segmented",
+        "playlist_url": url_for('.meditation_playlist', session_id=session_id, _external=True),
+        "segment_count": len(entry['segment_plan']),
+        "segments_ready": len(entry['segments']),
+        "segment_status": entry['segment_status'],
+    }
+    if entry.get('segment_error'):
+        status["segment_error"] = entry['segment_error']
+    return status
+
+def start_segmented_meditation(data, meditation_type, duration):
+    """
+    Plan a segmented meditation and start producing it: the first segment
+    is produced in the request unless audio_mode is "async", and the
+    following ones in the background. Returns None when the first segment
+    fails, so the caller can fall back to a single audio file.
+    """
+    try:
+        minutes = float(duration)
+    except (TypeError, ValueError):
+        minutes = 0
+    if minutes <= 0:
+        return jsonify({"error": "duration must be a positive number of minutes"}), 400
+
+    session_id = str(uuid.uuid4())
+    entry = {
+        'type': 'guided_meditation',
+        'meditation_type': meditation_type,
+        'duration': duration,
+        'delivery': 'segmented',
+        'segment_plan': meditation_plan(meditation_type, minutes),
+        'segments': [],
+        'segment_status': "waiting",
+        # Fixed for the life of the playlist, which players poll
+        'target_duration': target_duration_for(MEDITATION_SEGMENT_MINUTES * 60),
+        'response_text': '',
+        'timestamp': datetime.now().isoformat(),
+    }
+    store_session(session_id, entry)
+    if requested_audio_mode(data) == "sync":
+        try:
+            produce_meditation_segments(session_id, limit=1)
+        except UpstreamRateLimited:
+            raise
+        except Exception as segment_error:
+            logger.warning("⚠️ First meditation segment failed, falling back to a single file: %s",
+                           segment_error, extra={"session_id": session_id})
+            audio_cache.pop(session_id, None)
+            SESSION_INDEX.delete(session_id)
+            return None
+        entry = audio_cache[session_id]
+    schedule_meditation_segments(session_id, entry)
+
+    response_data = {
+        "session_id": session_id,
+        "meditation_script": entry['response_text'],  # Script of the segments ready so far
+        "display_text": entry['response_text'],
+        "type": meditation_type,
+        "duration": duration,
+        "audio_available": bool(entry['segments']),
+        "preparation_tips": [
+            "Find a quiet, comfortable space where you won't be disturbed",
+            "Sit or lie down in a comfortable position",
+            "Close your eyes or soften your gaze",
+            "Take three deep breaths to begin settling in"
+        ]
+    }
+    response_data.update(meditation_segments_status(session_id, entry))
+    logger.info("🧘 Segmented meditation started: %d segments", response_data["segment_count"],
+                extra={"session_id": session_id})
+    with span("serialize"):
+        return jsonify(response_data)
+
+@bp.route('/guided_meditation', methods=['POST'])
 def guided_meditation():
     """
     Generate guided meditation sessions.
@@ -747,6 +992,11 @@ def guided_meditation():
         meditation_type = data.get('type', 'relaxation')  # relaxation, anxiety, sleep, focus, loving_kindness
         duration = data.get('duration', 10)  # minutes
         
+        if requested_delivery(data) == "segmented":
+            response = start_segmented_meditation(data, meditation_type, duration)
+            if response is not None:
+                return response
+        
         meditation_prompt = f"""
         Create a {duration}-minute guided {meditation_type} meditation script.
         Keep the response concise but complete (aim for 100 words for better audio processing).
@@ -766,12 +1016,9 @@ def guided_meditation():
         MAKE SURE THAT YOU DONT EXCEED MORE THAN 200-300 words
         """
         
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(meditation_prompt)
-        meditation_text = response.text
+        meditation_text = generate_gemini_text(meditation_prompt, cacheable=True)
         
-        print(f"📝 Generated meditation script ({len(meditation_text)} chars):")
-        print(f"   Preview: {meditation_text[:150]}...")
+        logger.debug("📝 Generated meditation script (%d chars): %s...", len(meditation_text), meditation_text[:150])
         
         session_id = str(uuid.uuid4())
         response_data = {
@@ -791,41 +1038,165 @@ def guided_meditation():
         }
         
         # Try to generate audio for the meditation
-        try:
-            print("🎵 Generating audio for guided meditation...")
-            audio_content = deepgram_text_to_speech_multi(meditation_text)
-            audio_cache[session_id] = {
-                'audio_content': audio_content,
-                'response_text': meditation_text,
-                'type': 'guided_meditation',
-                'meditation_type': meditation_type,
-                'duration': duration,
-                'timestamp': datetime.now().isoformat()
-            }
-            response_data.update({
-                "audio_available": True,
-                "audio_url": f"{request.host_url}get_audio/{session_id}",
-                "audio_size": len(audio_content)
-            })
-            print("✅ Guided meditation with audio ready")
-            
-        except Exception as audio_error:
-            print(f"⚠️ Audio generation failed for meditation: {audio_error}")
-            audio_cache[session_id] = {
-                'response_text': meditation_text,
-                'type': 'guided_meditation',
-                'audio_error': str(audio_error),
-                'timestamp': datetime.now().isoformat()
-            }
-            response_data['audio_error'] = str(audio_error)
+        attach_audio(session_id, meditation_text, {
+            'type': 'guided_meditation',
+            'meditation_type': meditation_type,
+            'duration': duration,
+        }, response_data, requested_audio_mode(data), requested_format(data))
         
-        return jsonify(response_data)
+        with span("serialize"):
+            return jsonify(response_data)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Guided meditation error: {e}")
+        logger.exception("❌ Guided meditation error: %s", e)
         return jsonify({"error": str(e)}), 500
 
-@app.route('/breathing_exercise', methods=['POST'])
+@bp.route('/guided_meditation/<session_id>/playlist.m3u8', methods=['GET'])
+def meditation_playlist(session_id):
+    """
+    HLS playlist of a segmented meditation's ready segments. It stays open,
+    and players keep polling it, until the last segment is listed.
+    """
+    entry = audio_cache.get(session_id)
+    record_cache_lookup("wellness_audio_cache", entry is not None)
+    if entry is None or entry.get('delivery') != 'segmented':
+        return jsonify({"error": "Meditation not found or expired"}), 404
+    schedule_meditation_segments(session_id, entry)
+    return playlist_response(meditation_playlist_entries(session_id, entry),
+                             ended=entry['segment_status'] in ("complete", "failed"),
+                             target_duration=entry['target_duration'])
+
+@bp.route('/guided_meditation/<session_id>/segments/<int:index>.mp3', methods=['GET'])
+def meditation_segment(session_id, index):
+    """
+    One segment of a segmented meditation. Fetching it moves the listener's
+    position forward, which lets production run further ahead.
+    """
+    entry = audio_cache.get(session_id)
+    record_cache_lookup("wellness_audio_cache", entry is not None)
+    if entry is None or entry.get('delivery') != 'segmented' or index >= len(entry['segment_plan']):
+        return jsonify({"error": "Segment not found or expired"}), 404
+    if index > meditation_segments_fetched(session_id):
+        audio_cache[meditation_cursor_key(session_id)] = {'index': index}
+    schedule_meditation_segments(session_id, entry)
+
+    if index >= len(entry['segments']):
+        response = jsonify(dict(meditation_segments_status(session_id, entry), audio_status="pending"))
+        response.status_code = 202
+        response.headers["Retry-After"] = "1"
+        return response
+    segment = entry['segments'][index]
+    audio_content = AUDIO_STORE.get(segment['audio_sha256'])
+    if audio_content is None:
+        return jsonify({"error": "Segment not found or expired"}), 404
+    return audio_response(audio_content, segment['audio_sha256'],
+                          f"meditation_{session_id}_{index}.mp3", IMMUTABLE)
+
+# Breathing exercise audio is assembled from cue clips rendered once (see
+# cue_clips), so it costs no upstream calls per request. Each exercise's
+# cycle is a list of (cue, seconds) phases.
+BREATHING_EXERCISES = {
+    '4-7-8': {
+        'name': '4-7-8 Calming Breath',
+        'description': 'Inhale for 4, hold for 7, exhale for 8. Perfect for anxiety and sleep.',
+        'instruction': 'Place tongue tip behind upper teeth. Inhale through nose for 4 counts, hold for 7, exhale through mouth for 8 with a whoosh sound.',
+        'phases': (('Breathe in', 4), ('Hold', 7), ('Breathe out', 8)),
+    },
+    'box_breathing': {
+        'name': 'Box Breathing (Square Breathing)',
+        'description': 'Equal counts for inhale, hold, exhale, hold. Great for focus and stress relief.',
+        'instruction': 'Inhale for 4 counts, hold for 4, exhale for 4, hold empty for 4. Visualize drawing a square with your breath.',
+        'phases': (('Breathe in', 4), ('Hold', 4), ('Breathe out', 4), ('Hold', 4)),
+    },
+    'alternate_nostril': {
+        'name': 'Alternate Nostril Breathing',
+        'description': 'Ancient yogic technique to balance the nervous system and clear the mind.',
+        'instruction': 'Use right thumb to close right nostril, inhale left. Close left with ring finger, release right, exhale. Inhale right, switch, exhale left.',
+        'phases': (('Breathe in through the left', 4), ('Switch, and breathe out through the right', 4),
+                   ('Breathe in through the right', 4), ('Switch, and breathe out through the left', 4)),
+    },
+    'belly_breathing': {
+        'name': 'Deep Belly Breathing',
+        'description': 'Activates the relaxation response by engaging the diaphragm.',
+        'instruction': 'One hand on chest, one on belly. Breathe so only the belly hand moves. Inhale slowly through nose, exhale through pursed lips.',
+        'phases': (('Breathe in, and let your belly rise', 4), ('Breathe out slowly', 6)),
+    }
+}
+
+BREATHING_CLOSING = ("Beautiful work. Take a moment to notice how you feel now. "
+                     "You can return to this breath whenever you need to find your center.")
+BREATHING_MAX_MINUTES = 60
+breathing_cues = CueLibrary(voice)
+# Assembled sessions by (exercise, minutes): the same request always gets the same audio
+breathing_audio_digests = {}
+
+def breathing_intro(exercise):
+    return f"{exercise['name']}. {exercise['description']} {exercise['instruction']} Let's begin."
+
+def breathing_cue_texts():
+    """Every clip the breathing exercises use."""
+    texts = {BREATHING_CLOSING}
+    for exercise in BREATHING_EXERCISES.values():
+        texts.add(breathing_intro(exercise))
+        for cue, seconds in exercise['phases']:
+            texts.add(cue)
+            texts.update(COUNT_WORDS[second] for second in range(2, seconds + 1))
+    return sorted(texts)
+
+def breathing_exercise_audio(exercise, minutes):
+    """
+    Paced audio for `minutes` of an exercise: its introduction, as many
+    counted cycles as fit before the closing words (at least one), and the
+    closing. Returns an Mp3Assembly.
+    """
+    track = CueTrack(breathing_cues)
+    track.cue(breathing_intro(exercise))
+    track.pause(2)
+    cycle_seconds = sum(seconds for _, seconds in exercise['phases'])
+    closing_seconds = Mp3Assembly().append(breathing_cues.clip(BREATHING_CLOSING)) + 1
+    end = minutes * 60 - closing_seconds
+    cycles = 0
+    while cycles == 0 or track.position + cycle_seconds <= end:
+        track.breathe(exercise['phases'])
+        cycles += 1
+    track.pause(1)
+    track.cue(BREATHING_CLOSING)
+    logger.info("🌬 Assembled %d breathing cycles (%.1fs) from %d cue clips",
+                cycles, track.position, len(breathing_cues))
+    return track.audio
+
+def attach_breathing_audio(exercise_key, duration, response_data):
+    """
+    Describe an exercise's paced audio in `response_data`, assembling it and
+    storing it in AUDIO_STORE unless the same exercise and length already
+    is. Failures, which only happen while cue clips are first rendered, are
+    reported in the response rather than raised.
+    """
+    minutes = min(BREATHING_MAX_MINUTES, max(1, round(float(duration))))
+    key = (exercise_key, minutes)
+    try:
+        digest, audio_duration = breathing_audio_digests.get(key, (None, None))
+        audio_content = AUDIO_STORE.get(digest) if digest else None
+        if audio_content is None:
+            with time_stage(SERVICE, "audio_assembly"):
+                audio_content = breathing_exercise_audio(BREATHING_EXERCISES[exercise_key], minutes)
+            digest = AUDIO_STORE.put(audio_content)
+            audio_duration = round(audio_content.duration_seconds, 2)
+            breathing_audio_digests[key] = (digest, audio_duration)
+        response_data.update({
+            "audio_available": True,
+            "audio_content_url": url_for('.content_audio', digest=digest, extension=MP3.extension, _external=True),
+            "audio_format": MP3.name,
+            "audio_size": len(audio_content),
+            "audio_duration": audio_duration,
+        })
+    except Exception as audio_error:
+        logger.warning("⚠️ Breathing audio failed, returning text-only response: %s", audio_error)
+        response_data.update({"audio_available": False, "audio_error": str(audio_error)})
+
+@bp.route('/breathing_exercise', methods=['POST'])
 def breathing_exercise():
     """
     Generate guided breathing exercises for different needs.
@@ -835,30 +1206,8 @@ def breathing_exercise():
         exercise_type = data.get('type', '4-7-8')  # 4-7-8, box_breathing, alternate_nostril, belly_breathing
         duration = data.get('duration', 5)  # minutes
         
-        breathing_exercises = {
-            '4-7-8': {
-                'name': '4-7-8 Calming Breath',
-                'description': 'Inhale for 4, hold for 7, exhale for 8. Perfect for anxiety and sleep.',
-                'instruction': 'Place tongue tip behind upper teeth. Inhale through nose for 4 counts, hold for 7, exhale through mouth for 8 with a whoosh sound.'
-            },
-            'box_breathing': {
-                'name': 'Box Breathing (Square Breathing)',
-                'description': 'Equal counts for inhale, hold, exhale, hold. Great for focus and stress relief.',
-                'instruction': 'Inhale for 4 counts, hold for 4, exhale for 4, hold empty for 4. Visualize drawing a square with your breath.'
-            },
-            'alternate_nostril': {
-                'name': 'Alternate Nostril Breathing',
-                'description': 'Ancient yogic technique to balance the nervous system and clear the mind.',
-                'instruction': 'Use right thumb to close right nostril, inhale left. Close left with ring finger, release right, exhale. Inhale right, switch, exhale left.'
-            },
-            'belly_breathing': {
-                'name': 'Deep Belly Breathing',
-                'description': 'Activates the relaxation response by engaging the diaphragm.',
-                'instruction': 'One hand on chest, one on belly. Breathe so only the belly hand moves. Inhale slowly through nose, exhale through pursed lips.'
-            }
-        }
-        
-        selected_exercise = breathing_exercises.get(exercise_type, breathing_exercises['4-7-8'])
+        exercise_key = exercise_type if exercise_type in BREATHING_EXERCISES else '4-7-8'
+        selected_exercise = BREATHING_EXERCISES[exercise_key]
         
         breathing_script = f"""
         **{selected_exercise['name']} - {duration} Minute Session**
@@ -886,7 +1235,7 @@ def breathing_exercise():
         Remember: Your breath is always available to you as an anchor of peace and stability.
         """
         
-        return jsonify({
+        response_data = {
             "breathing_script": breathing_script,
             "display_text": breathing_script,
             "text_sent_to_tts": breathing_script,
@@ -895,10 +1244,15 @@ def breathing_exercise():
             "duration": duration,
             "benefits": selected_exercise['description'],
             "quick_reminder": "Breathe with intention. Let each breath guide you to greater calm and clarity."
-        })
+        }
+        # Paced audio spliced from pre-rendered cue clips, not synthesized from the script
+        attach_breathing_audio(exercise_key, duration, response_data)
+        
+        with span("serialize"):
+            return jsonify(response_data)
         
     except Exception as e:
-        print(f"❌ Breathing exercise error: {e}")
+        logger.exception("❌ Breathing exercise error: %s", e)
         return jsonify({"error": str(e)}), 500
 
 def get_daily_wellness_tip():
@@ -924,7 +1278,7 @@ def get_daily_wellness_tip():
     ]
     return random.choice(tips)
 
-@app.route('/wellness_tips', methods=['GET'])
+@bp.route('/wellness_tips', methods=['GET'])
 def get_wellness_tips():
     """
     Get multiple wellness tips and inspiration.
@@ -940,20 +1294,20 @@ def get_wellness_tips():
         })
         
     except Exception as e:
-        print(f"❌ Wellness tips error: {e}")
+        logger.exception("❌ Wellness tips error: %s", e)
         return jsonify({"error": str(e)}), 500
 
-@app.route('/session_history/<session_id>', methods=['GET'])
+@bp.route('/session_history/<session_id>', methods=['GET'])
 def get_session_history(session_id):
     """
     Retrieve session history and details.
     """
     try:
-        if session_id not in audio_cache:
+        session_data = audio_cache.get(session_id)
+        record_cache_lookup("wellness_audio_cache", session_data is not None)
+        if session_data is None:
             return jsonify({"error": "Session not found"}), 404
         
-        session_data = audio_cache[session_id]
-        
         # Remove audio content from response to keep it lightweight
         response_data = {
             "session_id": session_id,
@@ -961,9 +1315,14 @@ def get_session_history(session_id):
             "user_message": session_data.get('user_message', ''),
             "session_type": session_data.get('session_type', 'general'),
             "timestamp": session_data.get('timestamp', ''),
-            "audio_available": 'audio_content' in session_data,
+            "audio_available": 'audio_sha256' in session_data,
             "type": session_data.get('type', 'wellness_chat')
         }
+        if 'audio_sha256' in session_data:
+            response_data["audio_content_url"] = content_audio_url(session_data)
+        job_status = audio_job_status(session_id, session_data)
+        if job_status is not None:
+            response_data["audio_job"] = job_status
         
         # Add specific data based on session type
         if session_data.get('type') == 'yoga_sequence':
@@ -977,29 +1336,76 @@ def get_session_history(session_id):
                 "meditation_type": session_data.get('meditation_type'),
                 "duration": session_data.get('duration')
             })
+            if session_data.get('delivery') == 'segmented':
+                response_data["audio_available"] = bool(session_data['segments'])
+                response_data.update(meditation_segments_status(session_id, session_data))
         
         return jsonify(response_data)
         
     except Exception as e:
-        print(f"❌ Session history error: {e}")
+        logger.exception("❌ Session history error: %s", e)
         return jsonify({"error": str(e)}), 500
 
-@app.route('/clear_cache', methods=['POST'])
+@bp.route('/sessions', methods=['GET'])
+@gzipped
+def list_sessions():
+    """
+    List sessions newest first, from the session index: filter with type,
+    session_type (for meditations, the meditation type), since and until
+    (ISO 8601 or epoch seconds), page with limit and the previous page's
+    next_cursor. Audio and response text are never read.
+    """
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        filters = {
+            'type': request.args.get('type'),
+            'session_type': request.args.get('session_type'),
+            'since': parse_time(since) if since else None,
+            'until': parse_time(until) if until else None,
+        }
+        limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+        with span("session_index"):
+            sessions, next_cursor = SESSION_INDEX.query(SERVICE, limit=limit, cursor=request.args.get('cursor'),
+                                                        **filters)
+        for session in sessions:
+            session['session_url'] = url_for('.get_session_history', session_id=session['session_id'],
+                                             _external=True)
+        response_data = {
+            "sessions": sessions,
+            "count": len(sessions),
+            "next_cursor": next_cursor,
+        }
+        if next_cursor is not None:
+            response_data["next_url"] = url_for('.list_sessions', **dict(request.args, cursor=next_cursor),
+                                                _external=True)
+        with span("serialize"):
+            return jsonify(response_data)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("❌ Session listing error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/clear_cache', methods=['POST'])
 def clear_audio_cache():
     """
-    Clear the audio cache (for maintenance).
+    Clear the audio cache and this service's sessions in the session index
+    (for maintenance).
     """
     try:
-        cache_count = len(audio_cache)
         audio_cache.clear()
+        # Counted from the index, so it matches what /sessions listed
+        sessions_cleared = SESSION_INDEX.clear(SERVICE)
         return jsonify({
             "message": f"Audio cache cleared successfully",
-            "sessions_cleared": cache_count
+            "sessions_cleared": sessions_cleared
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/app_info', methods=['GET'])
+@bp.route('/app_info', methods=['GET'])
 def app_info():
     """
     Get application information and available endpoints.
@@ -1012,12 +1418,18 @@ def app_info():
             "/health": "Health check",
             "/wellness_chat": "Main chat endpoint (text or audio input)",
             "/yoga_sequence": "Generate personalized yoga sequences",
-            "/guided_meditation": "Create guided meditation scripts",
-            "/breathing_exercise": "Generate breathing exercise guides",
+            "/guided_meditation": "Create guided meditation scripts (delivery=segmented for an HLS playlist)",
+            "/guided_meditation/{session_id}/playlist.m3u8": "HLS playlist of a segmented meditation",
+            "/breathing_exercise": "Generate breathing exercise guides with paced audio",
             "/nutrition_plan": "Create nutrition and wellness plans",
             "/wellness_tips": "Get daily wellness tips",
-            "/get_audio/{session_id}": "Stream generated audio responses",
+            "/get_audio/{session_id}": "Stream generated audio responses, ?format=mp3|opus|linear16 (202 while pending)",
+            "/audio/{sha256}.{mp3|ogg|wav}": "Audio by content digest (immutable, cacheable forever)",
+            "/audio_jobs": "Background audio job queue depth",
+            "/audio_jobs/{session_id}": "Background audio job status and progress",
             "/session_history/{session_id}": "Retrieve session details",
+            "/sessions": "List sessions by type, session_type and time (paginated)",
+            "/metrics": "Prometheus metrics",
             "/app_info": "This endpoint"
         },
         "supported_audio_formats": list(ALLOWED_AUDIO_EXTENSIONS),
@@ -1033,21 +1445,39 @@ def app_info():
         ]
     })
 
-# Error handlers
-@app.errorhandler(404)
-def not_found(error):
-    return jsonify({"error": "Endpoint not found"}), 404
-
-@app.errorhandler(500)
-def internal_error(error):
-    return jsonify({"error": "Internal server error"}), 500
+def warmup():
+    """
+    Load the Gemini SDK, open the Deepgram session and render any breathing
+    cue clips not rendered yet before the first request.
+    """
+    gemini_client.warmup()
+    deepgram_client.warmup()
+    failed = breathing_cues.prerender(breathing_cue_texts())
+    if failed:
+        logger.warning("⚠️ %d breathing cue clips not rendered; they are retried on first use", failed)
 
-@app.errorhandler(413)
-def file_too_large(error):
-    return jsonify({"error": f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"}), 413
+service = Service(
+    "wellness", bp, "/wellness",
+    # Gemini/Deepgram endpoints get their own bounded capacity; the rest stays responsive
+    admission_pools={
+        'wellness_chat': 'expensive',
+        'yoga_sequence': 'expensive',
+        'nutrition_plan': 'expensive',
+        'guided_meditation': 'expensive',
+        # Synthesizes the session again for a format not cached yet
+        'get_audio': 'expensive',
+        # Renders missing cue clips on a cold start
+        'breathing_exercise': 'expensive',
+    },
+    max_upload=MAX_FILE_SIZE,
+    warmup=warmup,
+)
 
 # Main execution
 if __name__ == '__main__':
+    # Standalone app serving only this service at the root
+    app = build_app([service], prefixed=False, name=SERVICE, import_name=__name__)
+
     print("🌱 Starting AI Wellness Coach - Dr. Serenity")
     print("🔑 Checking API keys...")
     
@@ -1066,11 +1496,16 @@ if __name__ == '__main__':
     print("   POST /wellness_chat - Main wellness chat (text/audio)")
     print("   POST /yoga_sequence - Generate yoga sequences")
     print("   POST /guided_meditation - Create meditation scripts")
+    print("   GET  /guided_meditation/{session_id}/playlist.m3u8 - Segmented meditation playlist")
     print("   POST /breathing_exercise - Generate breathing guides")
     print("   POST /nutrition_plan - Create wellness plans")
     print("   GET  /wellness_tips - Get daily tips")
     print("   GET  /get_audio/{session_id} - Stream audio responses")
+    print("   GET  /audio/{sha256}.{mp3|ogg|wav} - Audio by content (immutable)")
+    print("   GET  /audio_jobs - Background audio job queue")
     print("   GET  /session_history/{session_id} - Session details")
+    print("   GET  /sessions - List sessions (?type=&session_type=&since=&until=&limit=&cursor=)")
+    print("   GET  /metrics - Prometheus metrics")
     print("   GET  /app_info - Application information")
     print("\n🎧 Features:")
     print("   • Speech-to-Text conversion")
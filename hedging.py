@@ -0,0 +1,145 @@
+"""
+Hedged upstream calls.
+
+A multi-chunk TTS response is only as fast as its slowest chunk, and an
+occasional straggling Deepgram request turns a 2 s response into 15 s. A
+HedgedCall runs the call in a worker thread; if it has not finished by the
+running p95 latency, an identical backup request is issued and whichever
+succeeds first wins. The loser is not cancelled (a blocking HTTP request
+cannot be), its result is simply discarded.
+
+Hedges are limited by a budget: every call earns `budget` hedge tokens (up
+to a small burst) and every hedge spends one, so at most that fraction of
+calls is duplicated even when the upstream is slow across the board.
+
+Environment variables:
+    TTS_HEDGE             "1" to hedge TTS chunk requests (off by default)
+    TTS_HEDGE_BUDGET      fraction of calls that may be hedged (0.05)
+    TTS_HEDGE_MIN_DELAY   never hedge before this many seconds (0.25)
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import counter
+
+# Calls needed before the p95 is trusted; until then nothing is hedged
+MIN_SAMPLES = 20
+WINDOW = 200
+BURST = 5.0
+
+HEDGES_ISSUED = counter(
+    "symptocheck_hedges_issued_total",
+    "Backup requests issued because the first was slower than the p95.",
+    ("call",),
+)
+HEDGES_WON = counter(
+    "symptocheck_hedges_won_total",
+    "Hedged calls answered by the backup request.",
+    ("call",),
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+        return _executor
+
+
+class HedgedCall:
+    """
+    Latency-hedged calls of one kind (e.g. one TTS voice). Disabled instances
+    call straight through.
+    """
+
+    def __init__(self, name, enabled=False, budget=0.05, min_delay=0.25, quantile=0.95):
+        self.name = name
+        self.enabled = enabled
+        self.budget = budget
+        self.min_delay = min_delay
+        self.quantile = quantile
+        self._latencies = deque(maxlen=WINDOW)
+        self._tokens = BURST
+        self._lock = threading.Lock()
+
+    def hedge_delay(self):
+        """Seconds to wait for the first request before hedging, or None if not yet known."""
+        with self._lock:
+            if len(self._latencies) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.quantile))
+        return max(self.min_delay, ordered[index])
+
+    def _observe(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def _take_token(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def _timed(self, fn, args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self._observe(time.perf_counter() - start)
+        return result
+
+    def _submit(self, executor, fn, args):
+        # Run in a copy of the caller's context, so the attempt still sees
+        # the request (tracing spans, logging fields); each attempt needs its
+        # own copy, since a context can only be entered by one thread at a time
+        return executor.submit(contextvars.copy_context().run, self._timed, fn, args)
+
+    def call(self, fn, *args):
+        if not self.enabled:
+            return fn(*args)
+
+        with self._lock:
+            self._tokens = min(BURST, self._tokens + self.budget)
+
+        executor = _get_executor()
+        primary = self._submit(executor, fn, args)
+        delay = self.hedge_delay()
+        if delay is None:
+            return primary.result()
+
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_token():
+            return primary.result()
+
+        HEDGES_ISSUED.inc(call=self.name)
+        backup = self._submit(executor, fn, args)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        HEDGES_WON.inc(call=self.name)
+                    return future.result()
+                if error is None:
+                    error = future.exception()
+        raise error
+
+
+def hedged_call_from_env(name, prefix="TTS_HEDGE"):
+    """HedgedCall configured from the <prefix>, <prefix>_BUDGET and <prefix>_MIN_DELAY variables."""
+    return HedgedCall(
+        name,
+        enabled=os.getenv(prefix, "0").lower() in ("1", "true", "yes"),
+        budget=float(os.getenv(f"{prefix}_BUDGET", 0.05)),
+        min_delay=float(os.getenv(f"{prefix}_MIN_DELAY", 0.25)),
+    )
@@ -0,0 +1,86 @@
+"""
+HLS media playlists for audio delivered in segments.
+
+A long response can be produced and synthesized a segment at a time and
+listed in a playlist as its segments become ready. The playlist is an
+EVENT playlist: segments are only ever appended, players poll it for new
+ones, and #EXT-X-ENDLIST marks the last. Segments are MP3, which HLS
+players accept as packed audio, so playback starts with the first segment
+while later ones are still being produced. Packed audio segments must each
+start with an ID3 tag giving their start time (see timestamp_tag).
+"""
+import math
+import struct
+
+from flask import Response
+
+PLAYLIST_MIMETYPE = "application/vnd.apple.mpegurl"
+
+# Target durations are whole seconds, and at least one
+MIN_TARGET_DURATION = 1
+
+# PRIV frame owner that carries a packed audio segment's start time
+TIMESTAMP_OWNER = b"com.apple.streaming.transportStreamTimestamp"
+# MPEG-2 transport stream timestamps count a 90 kHz clock in 33 bits
+_TIMESTAMP_CLOCK = 90000
+_TIMESTAMP_MASK = (1 << 33) - 1
+
+
+def target_duration_for(longest_segment):
+    """
+    The #EXT-X-TARGETDURATION for segments of at most `longest_segment`
+    seconds. It may not change while players poll, so it is fixed when the
+    segments are planned, from the longest one planned.
+    """
+    return max(MIN_TARGET_DURATION, math.ceil(longest_segment))
+
+
+def _syncsafe(size):
+    """ID3v2.4 sizes use 7 bits per byte."""
+    return bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+
+
+def timestamp_tag(start_seconds):
+    """
+    ID3v2.4 tag for the start of a packed audio segment starting
+    `start_seconds` into the stream: one PRIV frame owned by
+    com.apple.streaming.transportStreamTimestamp holding the 33-bit,
+    90 kHz timestamp as 8 big-endian bytes.
+    """
+    timestamp = round(start_seconds * _TIMESTAMP_CLOCK) & _TIMESTAMP_MASK
+    body = TIMESTAMP_OWNER + b"\x00" + struct.pack(">Q", timestamp)
+    frame = b"PRIV" + _syncsafe(len(body)) + b"\x00\x00" + body
+    return b"ID3\x04\x00\x00" + _syncsafe(len(frame)) + frame
+
+
+def render_playlist(segments, ended, target_duration):
+    """
+    M3U8 text listing `segments`, (duration in seconds, URI) pairs in play
+    order. `ended` closes the playlist once no more segments will follow.
+    Players reload an open playlist about once per `target_duration`, so it
+    should match the segments' length; it must be the same on every poll
+    (see target_duration_for) and is written as given.
+    """
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{int(math.ceil(target_duration))}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:EVENT",
+    ]
+    for duration, uri in segments:
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(uri)
+    if ended:
+        lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def playlist_response(segments, ended, target_duration):
+    """
+    The playlist as a response. An open playlist must be refetched on every
+    poll; a closed one never changes again.
+    """
+    response = Response(render_playlist(segments, ended, target_duration), mimetype=PLAYLIST_MIMETYPE)
+    response.headers["Cache-Control"] = "public, max-age=86400" if ended else "no-cache"
+    return response
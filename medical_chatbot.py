@@ -1,33 +1,52 @@
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, Response
+from flask import Blueprint, request, jsonify, Response, url_for
 import os
-import google.generativeai as genai
-import requests
 import uuid
 import io
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
+from app_logging import get_logger
+from metrics import record_cache_lookup, time_stage
+from uploads import upload_size
+from tracing import span
+from voice_stream import register_voice_endpoint, stt_backend_from_env
+from admission import UpstreamRateLimited
+from singleflight import SingleFlight, request_key
+from shared_store import session_cache
+from audio_store import (AUDIO_STORE, IMMUTABLE, audio_fields, audio_response, is_audio_digest,
+                         session_audio)
+from audio_formats import MP3, format_for_extension, requested_format
+import deepgram_client
+import gemini_client
+from gemini_client import generate_text, stream_text
+from deepgram_client import DeepgramVoice, speech_to_text
+from app_factory import Service, build_app
 
 # Load environment variables
 load_dotenv()
 
+SERVICE = "medical_chatbot"
+logger = get_logger(SERVICE)
+
 # Set up API keys
 GENAI_API_KEY = os.getenv("Gemini_API")
 DEEPGRAM_API_KEY = os.getenv("Deepgram_API")
 
-# Configure Gemini
-genai.configure(api_key=GENAI_API_KEY)
+voice = DeepgramVoice("aura-asteria-en", SERVICE)
+
+# Identical questions asked at the same time share one Gemini call
+gemini_calls = SingleFlight("medical_gemini")
 
-# Flask App Setup
-app = Flask(__name__)
-from flask_cors import CORS
-CORS(app)
+# Routes are served by the standalone app below, or mounted under /medical by app_factory
+bp = Blueprint(SERVICE, __name__)
 
 # Configuration
 ALLOWED_AUDIO_EXTENSIONS = {'wav', 'mp3', 'm4a', 'flac', 'webm', 'ogg'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
-# Store audio responses temporarily in memory
-audio_cache = {}
+# Session responses, shared by all workers when SHARED_STORE_DIR is set; the
+# audio itself is kept once per content digest in AUDIO_STORE
+audio_cache = session_cache("medical_audio_cache")
 
 def allowed_file(filename):
     """Check if the uploaded file has an allowed extension."""
@@ -36,42 +55,11 @@ def allowed_file(filename):
 
 def deepgram_speech_to_text(audio_file):
     """
-    Use Deepgram API to convert speech to text.
+    Convert speech to text with Deepgram; returns (transcript, audio_input).
     """
-    url = "https://api.deepgram.com/v1/listen?model=nova-2&smart_format=true&punctuate=true"
-    
-    headers = {
-        "Authorization": f"Token {DEEPGRAM_API_KEY}",
-    }
-    
-    files = {
-        'audio': audio_file
-    }
-    
-    try:
-        response = requests.post(url, headers=headers, files=files)
-        response.raise_for_status()
-        
-        result = response.json()
-        
-        # Extract transcript from Deepgram response
-        if 'results' in result and 'channels' in result['results']:
-            alternatives = result['results']['channels'][0]['alternatives']
-            if alternatives and len(alternatives) > 0:
-                return alternatives[0]['transcript']
-        
-        return ""
-        
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Deepgram STT failed: {str(e)}")
-    except KeyError as e:
-        raise Exception(f"Unexpected Deepgram response format: {str(e)}")
+    return speech_to_text(audio_file, SERVICE)
 
-def get_medical_response(user_question):
-    """
-    Generate medical AI response from Gemini with improved prompt.
-    """
-    prompt = """
+MEDICAL_PROMPT = """
     You are a responsible and helpful medical AI assistant. Follow these guidelines:
     
     1. Provide clear, accurate general health information
@@ -89,58 +77,68 @@ def get_medical_response(user_question):
     
     If the question is not medical-related, politely redirect to medical topics.
     """
-    
+
+def get_medical_response(user_question):
+    """
+    Generate medical AI response from Gemini with improved prompt.
+    Identical concurrent questions (ignoring case and spacing) share one call.
+    """
+    return gemini_calls.do(request_key(user_question.casefold()), _generate_medical_response, user_question)
+
+def _generate_medical_response(user_question):
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content([prompt, user_question])
-        return response.text
+        return generate_text([MEDICAL_PROMPT, user_question], SERVICE)
+    except UpstreamRateLimited:
+        raise
     except Exception as e:
         raise Exception(f"Failed to generate medical response: {str(e)}")
 
-def deepgram_text_to_speech(text):
+def stream_medical_response(user_question):
     """
-    Use Deepgram TTS API to convert text to speech and return audio stream.
+    Yield the medical AI response in pieces as Gemini generates them.
     """
-    url = "https://api.deepgram.com/v1/speak?model=aura-asteria-en&encoding=mp3"
-
-    headers = {
-        "Authorization": f"Token {DEEPGRAM_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    try:
+        yield from stream_text([MEDICAL_PROMPT, user_question], SERVICE)
+    except UpstreamRateLimited:
+        raise
+    except Exception as e:
+        raise Exception(f"Failed to generate medical response: {str(e)}")
 
-    payload = {
-        "text": text
-    }
+def deepgram_text_to_speech(text, audio_format=MP3):
+    """
+    Convert text to speech, sharing in-flight calls and cached audio for
+    identical text.
+    """
+    return voice.text_to_speech(text, audio_format)
 
-    try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        
-        # Verify we got audio content
-        if len(response.content) == 0:
-            raise Exception("Received empty audio response from Deepgram TTS")
-        
-        print(f"🔊 Generated audio: {len(response.content)} bytes")
-        return response.content
-        
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Deepgram TTS failed: {str(e)}")
+def deepgram_text_to_speech_multi(text, audio_format=MP3):
+    """
+    Convert text of any length to speech in chunks sized to the voice's
+    learned payload limit. Returns the format's assembly of the chunk audio
+    (an Mp3Assembly for MP3).
+    """
+    return voice.text_to_speech_chunked(text, audio_format)
 
-@app.route('/health', methods=['GET'])
+@bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
     return jsonify({"status": "healthy", "service": "Medical Chatbot"}), 200
 
-@app.route('/medical_bot', methods=['POST'])
+@bp.route('/medical_bot', methods=['POST'])
 def medical_bot():
     """
     Accepts medical question (text or audio) and returns response with audio.
     """
     try:
         question = None
+        audio_input = None
         
+        # Parsing the multipart body reads the whole upload
+        with span("upload"):
+            has_audio = 'audio' in request.files
+
         # Check if audio file is uploaded
-        if 'audio' in request.files:
+        if has_audio:
             audio_file = request.files['audio']
             
             if audio_file.filename == '':
@@ -149,16 +147,12 @@ def medical_bot():
             if not allowed_file(audio_file.filename):
                 return jsonify({"error": f"Unsupported audio format. Allowed: {', '.join(ALLOWED_AUDIO_EXTENSIONS)}"}), 400
             
-            # Check file size
-            audio_file.seek(0, os.SEEK_END)
-            file_size = audio_file.tell()
-            audio_file.seek(0)
-            
-            if file_size > MAX_FILE_SIZE:
+            # The request body is capped while reading; this checks the file itself
+            if upload_size(audio_file) > MAX_FILE_SIZE:
                 return jsonify({"error": "Audio file too large. Maximum size: 10MB"}), 400
             
-            print("📤 Converting speech to text...")
-            question = deepgram_speech_to_text(audio_file)
+            logger.info("📤 Converting speech to text...")
+            question, audio_input = deepgram_speech_to_text(audio_file)
             
             if not question.strip():
                 return jsonify({"error": "Could not extract text from audio. Please try again with clearer audio."}), 400
@@ -166,124 +160,174 @@ def medical_bot():
         # Check for text question
         elif request.form.get("question"):
             question = request.form.get("question").strip()
-        elif request.json and request.json.get("question"):
-            question = request.json.get("question").strip()
+        elif (request.get_json(silent=True) or {}).get("question"):
+            question = request.get_json(silent=True).get("question").strip()
         
         if not question:
             return jsonify({"error": "Please provide a medical question (text or audio)"}), 400
 
-        print(f"📝 Processing question: {question[:100]}...")
+        logger.debug("📝 Processing question: %s...", question[:100])
+        
+        # Audio is synthesized in the format asked for (MP3 by default)
+        audio_format = requested_format(request.get_json(silent=True))
         
         # Generate medical response
-        print("📤 Generating medical response...")
+        logger.info("📤 Generating medical response...")
         response_text = get_medical_response(question)
 
         # Generate audio response
-        print("🔊 Generating audio response...")
-        audio_content = deepgram_text_to_speech(response_text)
+        logger.info("🔊 Generating audio response...")
+        with time_stage(SERVICE, "tts"):
+            audio_content = deepgram_text_to_speech_multi(response_text, audio_format)
         
         # Create unique session ID for this interaction
         session_id = str(uuid.uuid4())
         
-        # Store audio in cache
-        audio_cache[session_id] = {
-            'audio_content': audio_content,
-            'response_text': response_text,
-            'question': question
-        }
+        # Store audio by content, and the session pointing at it
+        audio_entry = audio_fields(audio_content, audio_format)
+        audio_cache[session_id] = dict(audio_entry, response_text=response_text, question=question)
 
-        print("✅ Response ready")
-        return jsonify({
-            "session_id": session_id,
-            "question": question,
-            "response_text": response_text,
-            "audio_url": f"{request.host_url}get_audio/{session_id}",
-            "audio_size": len(audio_content)
-        })
+        logger.info("✅ Response ready", extra={"session_id": session_id})
+        with span("serialize"):
+            return jsonify({
+                "session_id": session_id,
+                "question": question,
+                "response_text": response_text,
+                "audio_url": url_for('.get_audio', session_id=session_id, _external=True),
+                "audio_content_url": url_for('.content_audio', digest=audio_entry['audio_sha256'],
+                                             extension=audio_format.extension, _external=True),
+                "audio_format": audio_format.name,
+                "audio_size": len(audio_content),
+                "audio_input": audio_input
+            })
 
+    except HTTPException:
+        # e.g. 413 from the upload size cap
+        raise
     except Exception as e:
-        print(f"❌ Error: {e}")
+        logger.exception("❌ Error: %s", e)
         return jsonify({"error": str(e)}), 500
 from flask_cors import cross_origin
-@app.route('/get_audio/<session_id>', methods=['GET'])
+@bp.route('/get_audio/<session_id>', methods=['GET'])
 @cross_origin()
 def get_audio(session_id):
     """
-    Stream the cached audio response.
+    Stream the cached audio response in the format asked for by ?format= or
+    the Accept header; other formats are synthesized on first request and
+    kept alongside. Replays are revalidated against the ETag (the audio's
+    content digest) and answered with 304.
     """
     try:
-        if session_id not in audio_cache:
+        cached_data = audio_cache.get(session_id)
+        record_cache_lookup("medical_audio_cache", cached_data is not None)
+        if cached_data is None:
             return jsonify({"error": "Audio not found or expired"}), 404
         
-        cached_data = audio_cache[session_id]
-        audio_content = cached_data['audio_content']
+        audio_format = requested_format()
+        with time_stage(SERVICE, "tts"):
+            audio_content, audio_digest, changed = session_audio(
+                cached_data, audio_format, deepgram_text_to_speech_multi)
+        if audio_content is None:
+            return jsonify({"error": "Audio not found or expired"}), 404
+        if changed:
+            audio_cache[session_id] = cached_data
         
         # Clean up cache after serving (optional - you might want to keep it longer)
         # del audio_cache[session_id]
         
-        return Response(
-            audio_content,
-            mimetype="audio/mpeg",
-            headers={
-                "Content-Disposition": f"inline; filename=medical_response_{session_id}.mp3",
-                "Content-Length": str(len(audio_content)),
-                "Cache-Control": "no-cache",
-                "Accept-Ranges": "bytes"
-            }
-        )
+        response = audio_response(audio_content, audio_digest,
+                                  f"medical_response_{session_id}.{audio_format.extension}",
+                                  mimetype=audio_format.mimetype)
+        response.vary.add("Accept")
+        return response
         
+    except HTTPException:
+        # e.g. 400 for an unknown format
+        raise
     except Exception as e:
-        print(f"❌ Audio streaming error: {e}")
+        logger.exception("❌ Audio streaming error: %s", e)
         return jsonify({"error": "Failed to serve audio response"}), 500
 
-@app.route('/medical_bot_stream', methods=['POST'])
+@bp.route('/audio/<digest>.<extension>', methods=['GET'])
+@cross_origin()
+def content_audio(digest, extension):
+    """
+    Serve audio by content digest. The URL always names the same bytes, so
+    it may be cached forever.
+    """
+    audio_format = format_for_extension(extension)
+    audio_content = AUDIO_STORE.get_as(digest, audio_format) if audio_format and is_audio_digest(digest) else None
+    if audio_content is None:
+        return jsonify({"error": "Audio not found or expired"}), 404
+    return audio_response(audio_content, digest, f"{digest}.{extension}", IMMUTABLE,
+                          mimetype=audio_format.mimetype)
+
+@bp.route('/medical_bot_stream', methods=['POST'])
 def medical_bot_stream():
     """
     Alternative endpoint that returns audio directly as a stream.
     """
     try:
         question = None
+        audio_input = None
         
         # Handle audio input
-        if 'audio' in request.files:
+        with span("upload"):
+            has_audio = 'audio' in request.files
+        if has_audio:
             audio_file = request.files['audio']
             if audio_file and allowed_file(audio_file.filename):
-                print("📤 Converting speech to text...")
-                question = deepgram_speech_to_text(audio_file)
+                logger.info("📤 Converting speech to text...")
+                question, audio_input = deepgram_speech_to_text(audio_file)
         
         # Handle text input
         if not question:
-            question = request.form.get("question") or (request.json and request.json.get("question"))
+            question = request.form.get("question") or (request.get_json(silent=True) or {}).get("question")
         
         if not question or not question.strip():
             return jsonify({"error": "Please provide a medical question"}), 400
 
-        print(f"📝 Processing question: {question[:100]}...")
+        logger.debug("📝 Processing question: %s...", question[:100])
+        
+        audio_format = requested_format(request.get_json(silent=True))
         
         # Generate response
-        print("📤 Generating medical response...")
+        logger.info("📤 Generating medical response...")
         response_text = get_medical_response(question.strip())
         
-        print("🔊 Generating audio response...")
-        audio_content = deepgram_text_to_speech(response_text)
+        logger.info("🔊 Generating audio response...")
+        with time_stage(SERVICE, "tts"):
+            audio_content = deepgram_text_to_speech_multi(response_text, audio_format)
         
-        return Response(
-            audio_content,
-            mimetype="audio/mpeg",
-            headers={
-                "X-Response-Text": response_text.replace('\n', ' ')[:500],  # Truncated for header
-                "X-Question": question[:200],
-                "Content-Disposition": "inline; filename=medical_response.mp3",
-                "Content-Length": str(len(audio_content)),
-                "Cache-Control": "no-cache"
-            }
-        )
+        headers = {
+            "X-Response-Text": response_text.replace('\n', ' ')[:500],  # Truncated for header
+            "X-Question": question[:200],
+            "Content-Disposition": f"inline; filename=medical_response.{audio_format.extension}",
+            "Content-Length": str(len(audio_content)),
+            "Cache-Control": "no-cache"
+        }
+        if audio_input:
+            headers["X-Audio-Trimmed-Seconds"] = str(audio_input["trimmed_seconds"])
+        
+        return Response(audio_content.iter_bytes(), mimetype=audio_format.mimetype, headers=headers)
         
+    except HTTPException:
+        # e.g. 413 from the upload size cap
+        raise
     except Exception as e:
-        print(f"❌ Streaming error: {e}")
+        logger.exception("❌ Streaming error: %s", e)
         return jsonify({"error": str(e)}), 500
 
-@app.route('/test_tts', methods=['POST'])
+# Full-duplex voice: streamed audio in, streamed STT, LLM and TTS out
+voice_endpoint = register_voice_endpoint(
+    bp, '/voice_stream',
+    stt_backend=stt_backend_from_env(DEEPGRAM_API_KEY),
+    respond=stream_medical_response,
+    synthesize=deepgram_text_to_speech,
+    sizer=voice.sizer,
+)
+
+@bp.route('/test_tts', methods=['POST'])
 def test_tts():
     """
     Test endpoint for TTS functionality.
@@ -291,32 +335,51 @@ def test_tts():
     try:
         test_text = request.json.get('text', 'Hello, this is a test of the text to speech system.')
         
-        print(f"🧪 Testing TTS with text: {test_text}")
-        audio_content = deepgram_text_to_speech(test_text)
+        audio_format = requested_format(request.json)
+        
+        logger.info("🧪 Testing TTS with text: %s", test_text)
+        audio_content = deepgram_text_to_speech_multi(test_text, audio_format)
         
         return Response(
-            audio_content,
-            mimetype="audio/mpeg",
+            audio_content.iter_bytes(),
+            mimetype=audio_format.mimetype,
             headers={
-                "Content-Disposition": "inline; filename=test_tts.mp3",
+                "Content-Disposition": f"inline; filename=test_tts.{audio_format.extension}",
                 "Content-Length": str(len(audio_content)),
                 "Cache-Control": "no-cache"
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ TTS Test error: {e}")
+        logger.exception("❌ TTS Test error: %s", e)
         return jsonify({"error": str(e)}), 500
 
-@app.errorhandler(404)
-def not_found(error):
-    return jsonify({"error": "Endpoint not found"}), 404
+def warmup():
+    """Load the Gemini SDK and open the Deepgram session before the first request."""
+    gemini_client.warmup()
+    deepgram_client.warmup()
 
-@app.errorhandler(500)
-def internal_error(error):
-    return jsonify({"error": "Internal server error"}), 500
+service = Service(
+    "medical", bp, "/medical",
+    # Gemini/Deepgram endpoints get their own bounded capacity; the rest stays responsive
+    admission_pools={
+        'medical_bot': 'expensive',
+        'medical_bot_stream': 'expensive',
+        'test_tts': 'expensive',
+        # Synthesizes the session again for a format not cached yet
+        'get_audio': 'expensive',
+        'voice_stream': 'voice',
+    },
+    max_upload=MAX_FILE_SIZE,
+    warmup=warmup,
+)
 
 if __name__ == '__main__':
+    # Standalone app serving only this service at the root
+    app = build_app([service], prefixed=False, name=SERVICE, import_name=__name__)
+
     # Validate API keys
     if not GENAI_API_KEY:
         print("❌ ERROR: Gemini_API environment variable not set")
@@ -330,8 +393,11 @@ if __name__ == '__main__':
     print("📋 Available endpoints:")
     print("   POST /medical_bot - Main chatbot endpoint (text/audio input)")
     print("   POST /medical_bot_stream - Stream audio response directly")
+    print("   WS   /voice_stream - Full-duplex voice conversation")
     print("   POST /test_tts - Test TTS functionality")
     print("   GET  /health - Health check")
+    print("   GET  /metrics - Prometheus metrics")
     print("   GET  /get_audio/<session_id> - Get audio response")
+    print("   GET  /audio/<sha256>.<mp3|ogg|wav> - Get audio by content (immutable)")
     
     app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,364 @@
+"""
+Minimal Prometheus-style instrumentation shared by the SymptoCheck services.
+
+Metrics live in a process-wide registry and are rendered in the Prometheus
+text exposition format by the /metrics endpoint that `instrument_app` adds.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+from tracing import record_span
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """
+    A gauge set directly, or computed at scrape time by a callback.
+
+    Callbacks return a number for unlabelled gauges, or a dict mapping label
+    value tuples to numbers.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._callbacks = []
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, callback):
+        self._callbacks.append(callback)
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for callback in self._callbacks:
+            result = callback()
+            if isinstance(result, dict):
+                values.update({tuple(str(v) for v in key): value for key, value in result.items()})
+            else:
+                values[()] = result
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+            yield f"{self.name}_bucket{labels} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered with a different shape")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# --- Shared SymptoCheck metrics -------------------------------------------------
+
+STAGE_LATENCY = histogram(
+    "symptocheck_stage_latency_seconds",
+    "Latency of pipeline stages (stt, llm, tts_chunk, tts).",
+    ("service", "stage"),
+)
+REQUEST_LATENCY = histogram(
+    "symptocheck_request_latency_seconds",
+    "Total request latency by endpoint.",
+    ("service", "endpoint", "status"),
+)
+REQUESTS_IN_FLIGHT = gauge(
+    "symptocheck_requests_in_flight",
+    "Requests currently being handled.",
+    ("service",),
+)
+UPSTREAM_ERRORS = counter(
+    "symptocheck_upstream_errors_total",
+    "Failed calls to upstream APIs by status code.",
+    ("service", "upstream", "status"),
+)
+CACHE_REQUESTS = counter(
+    "symptocheck_cache_requests_total",
+    "Cache lookups by result (hit or miss).",
+    ("cache", "result"),
+)
+CACHE_ENTRIES = gauge(
+    "symptocheck_cache_entries",
+    "Entries currently held in a cache.",
+    ("cache",),
+)
+CACHE_BYTES = gauge(
+    "symptocheck_cache_bytes",
+    "Approximate payload bytes held in a cache.",
+    ("cache",),
+)
+CACHE_HIT_RATIO = gauge(
+    "symptocheck_cache_hit_ratio",
+    "Hits divided by lookups since process start.",
+    ("cache",),
+)
+CACHE_STALE_SERVED = counter(
+    "symptocheck_cache_stale_served_total",
+    "Stale cache entries served while being refreshed in the background.",
+    ("cache",),
+)
+COALESCED_CALLS = counter(
+    "symptocheck_coalesced_calls_total",
+    "Calls that waited for an identical in-flight call instead of repeating it.",
+    ("group",),
+)
+ACTIVE_CONVERSATIONS = gauge(
+    "symptocheck_active_conversations",
+    "Conversations currently held, by stage.",
+    ("stage",),
+)
+
+_tracked_caches = set()
+
+
+def _hit_ratios():
+    ratios = {}
+    for name in sorted(_tracked_caches):
+        hits = CACHE_REQUESTS.value(cache=name, result="hit")
+        misses = CACHE_REQUESTS.value(cache=name, result="miss")
+        ratios[(name,)] = hits / (hits + misses) if hits + misses else 0.0
+    return ratios
+
+
+CACHE_HIT_RATIO.set_function(_hit_ratios)
+
+
+@contextmanager
+def time_stage(service, stage):
+    """
+    Context manager timing one pipeline stage. The timing is also recorded
+    as a span of the current request (see tracing).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_LATENCY.observe(duration, service=service, stage=stage)
+        record_span(stage, duration, start)
+
+
+def upstream_status(error):
+    """Best-effort status label for an upstream failure (HTTP code, timeout, ...)."""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None:
+        code = getattr(error, "code", None)
+        status = code if isinstance(code, int) else None
+    if status is not None:
+        return str(status)
+    name = type(error).__name__.lower()
+    if "timeout" in name:
+        return "timeout"
+    if "connection" in name:
+        return "connection"
+    return "error"
+
+
+def record_upstream_error(service, upstream, status):
+    UPSTREAM_ERRORS.inc(service=service, upstream=upstream, status=status)
+
+
+def record_cache_lookup(cache, hit):
+    _tracked_caches.add(cache)
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def track_cache(cache, mapping, size_of=None):
+    """
+    Report the entry count (and bytes, if `size_of(value)` is given) of a
+    dict-like cache at scrape time.
+    """
+    _tracked_caches.add(cache)
+    CACHE_ENTRIES.set_function(lambda: {(cache,): len(mapping)})
+    if size_of is not None:
+        CACHE_BYTES.set_function(lambda: {(cache,): sum(size_of(v) for v in list(mapping.values()))})
+
+
+def instrument_app(app, service):
+    """
+    Track in-flight requests and total latency for every request of `app`,
+    and serve the registry at /metrics.
+    """
+    REQUESTS_IN_FLIGHT.set(0, service=service)
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc(service=service)
+
+    @app.after_request
+    def _metrics_finish(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _metrics_teardown(error=None):
+        start = g.pop("_metrics_start", None)
+        if start is None:
+            return
+        REQUESTS_IN_FLIGHT.dec(service=service)
+        status = g.pop("_metrics_status", 500 if error else 200)
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - start,
+            service=service,
+            endpoint=request.endpoint or "unknown",
+            status=status,
+        )
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(REGISTRY.render(), mimetype=CONTENT_TYPE)
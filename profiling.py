@@ -0,0 +1,331 @@
+"""
+Opt-in sampling profiler for the SymptoCheck services.
+
+While a profiling window is open, a fraction of requests is selected and a
+background thread samples the stacks of the threads handling them. Samples
+are aggregated across requests and can be exported as collapsed stacks
+(for flamegraph.pl / inferno) or as a speedscope JSON file.
+
+When no window is open, the per-request cost is a single attribute check.
+
+Environment variables:
+    PROFILE_SAMPLE_RATE   open a window at startup, profiling this fraction of requests
+    PROFILE_INTERVAL_MS   stack sampling interval (5)
+    PROFILE_DURATION      close the startup window after this many seconds (unbounded)
+    PROFILE_DIR           write both formats here when a window closes (disabled)
+    ADMIN_TOKEN           enables the /admin/profiler endpoints (X-Admin-Token header)
+"""
+import hmac
+import json
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import Response, g, jsonify, request
+
+
+logger = logging.getLogger(__name__)
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+class Profile:
+    """Aggregated stack samples of one profiling window."""
+
+    def __init__(self, samples, interval, started, finished, requests):
+        self.samples = samples  # Counter of stacks (outermost frame first)
+        self.interval = interval
+        self.started = started
+        self.finished = finished
+        self.requests = requests
+
+    @staticmethod
+    def _frame_name(frame):
+        filename, name, line = frame
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    def collapsed(self):
+        lines = []
+        for stack, count in self.samples.most_common():
+            lines.append(";".join(self._frame_name(frame) for frame in stack) + f" {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name="symptocheck"):
+        frames = []
+        index = {}
+        samples = []
+        weights = []
+        for stack, count in self.samples.most_common():
+            sample = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    filename, func, line = frame
+                    frames.append({"name": func, "file": filename, "line": line})
+                sample.append(index[frame])
+            samples.append(sample)
+            weights.append(count * self.interval * 1000)
+        total = sum(weights)
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "symptocheck-profiler",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": total,
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def summary(self):
+        return {
+            "started": self.started.isoformat(),
+            "finished": self.finished.isoformat() if self.finished else None,
+            "requests": self.requests,
+            "samples": sum(self.samples.values()),
+            "unique_stacks": len(self.samples),
+            "interval_ms": self.interval * 1000,
+        }
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of registered request threads from a background thread.
+    Only one window is open at a time; the thread exists only while it is.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.interval = 0.005
+        self.output_dir = None
+        self._threads = {}  # thread ident -> number of profiled requests in flight
+        self._samples = Counter()
+        self._requests = 0
+        self._started = None
+        self._deadline = None
+        self._last = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._lock = threading.Lock()
+
+    def start(self, sample_rate=1.0, interval=0.005, duration=None, output_dir=None):
+        """Open a profiling window, closing any window that is already open."""
+        self.stop()
+        with self._lock:
+            self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+            self.interval = max(0.001, float(interval))
+            self.output_dir = output_dir
+            self._samples = Counter()
+            self._requests = 0
+            self._started = datetime.now()
+            self._deadline = time.monotonic() + duration if duration else None
+            self._stop = threading.Event()
+            self._sampler = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+            self.enabled = True
+            self._sampler.start()
+        logger.info("🔬 Profiling window opened", extra={
+            "sample_rate": self.sample_rate, "interval_ms": self.interval * 1000, "duration": duration,
+        })
+
+    def stop(self):
+        """Close the current window and return its Profile, or None."""
+        with self._lock:
+            if not self.enabled:
+                return None
+            self.enabled = False
+            self._stop.set()
+            sampler = self._sampler
+            self._sampler = None
+        if sampler is not threading.current_thread():
+            sampler.join()
+
+        with self._lock:
+            profile = Profile(Counter(self._samples), self.interval, self._started,
+                              datetime.now(), self._requests)
+            self._last = profile
+        logger.info("🔬 Profiling window closed", extra=profile.summary())
+        if self.output_dir:
+            self._write(profile)
+        return profile
+
+    def snapshot(self):
+        """Profile of the current window so far, or of the last closed window."""
+        with self._lock:
+            if not self.enabled and self._last is not None:
+                return self._last
+            samples = Counter(self._samples)
+        return Profile(samples, self.interval, self._started or datetime.now(), None, self._requests)
+
+    def _write(self, profile):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stem = os.path.join(self.output_dir, profile.started.strftime("profile-%Y%m%d-%H%M%S"))
+            with open(stem + ".collapsed.txt", "w", encoding="utf-8") as f:
+                f.write(profile.collapsed())
+            with open(stem + ".speedscope.json", "w", encoding="utf-8") as f:
+                json.dump(profile.speedscope(), f)
+            logger.info("🔬 Profile written to %s.*", stem)
+        except OSError as e:
+            logger.error("❌ Could not write profile: %s", e)
+
+    def begin_request(self):
+        """Select the current request for sampling; returns True if selected."""
+        if random.random() >= self.sample_rate:
+            return False
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+            self._requests += 1
+        return True
+
+    def end_request(self):
+        ident = threading.get_ident()
+        with self._lock:
+            remaining = self._threads.get(ident, 0) - 1
+            if remaining > 0:
+                self._threads[ident] = remaining
+            else:
+                self._threads.pop(ident, None)
+
+    def _run(self):
+        stop = self._stop
+        while not stop.wait(self.interval):
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                threading.Thread(target=self.stop, name="profiler-stop", daemon=True).start()
+                return
+            with self._lock:
+                threads = list(self._threads)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            stacks = []
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_name, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.reverse()
+                stacks.append(tuple(stack))
+            del frames
+            with self._lock:
+                self._samples.update(stacks)
+
+
+PROFILER = SamplingProfiler()
+
+
+def _authorized():
+    token = os.getenv("ADMIN_TOKEN")
+    supplied = request.headers.get("X-Admin-Token", "")
+    return bool(token) and hmac.compare_digest(token, supplied)
+
+
+def _setting(data, key, default):
+    """A finite, non-negative number from the request body; raises ValueError."""
+    value = data.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        raise ValueError(f"{key} must be a number")
+    number = float(value)
+    if not math.isfinite(number) or number < 0:
+        raise ValueError(f"{key} must be a non-negative number")
+    return number
+
+
+def instrument_profiling(app, service):
+    """
+    Register the profiler hooks and the /admin/profiler endpoints on `app`.
+    All apps in a process share one profiler.
+    """
+    rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    if rate > 0 and not PROFILER.enabled:
+        duration = os.getenv("PROFILE_DURATION")
+        PROFILER.start(
+            sample_rate=rate,
+            interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+            duration=float(duration) if duration else None,
+            output_dir=os.getenv("PROFILE_DIR") or None,
+        )
+
+    @app.before_request
+    def _profile_start():
+        if PROFILER.enabled and PROFILER.begin_request():
+            g._profiled = True
+
+    @app.teardown_request
+    def _profile_finish(error=None):
+        if g.pop("_profiled", False):
+            PROFILER.end_request()
+
+    @app.route("/admin/profiler", methods=["GET"])
+    def profiler_status():
+        if not _authorized():
+            return jsonify({"error": "Endpoint not found"}), 404
+        return jsonify({"service": service, "enabled": PROFILER.enabled,
+                        "sample_rate": PROFILER.sample_rate, **PROFILER.snapshot().summary()})
+
+    @app.route("/admin/profiler/start", methods=["POST"])
+    def profiler_start():
+        if not _authorized():
+            return jsonify({"error": "Endpoint not found"}), 404
+        data = request.get_json(silent=True) or {}
+        if "output_dir" in data:
+            # Profiles are only ever written where the deployment says
+            return jsonify({"error": "Invalid profiler settings: output_dir is set by PROFILE_DIR"}), 400
+        try:
+            sample_rate = _setting(data, "sample_rate", 1.0)
+            interval = _setting(data, "interval_ms", 5) / 1000
+            duration = _setting(data, "duration", None)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid profiler settings: {e}"}), 400
+        PROFILER.start(
+            sample_rate=sample_rate,
+            interval=interval,
+            duration=duration,
+            output_dir=os.getenv("PROFILE_DIR") or None,
+        )
+        return jsonify({"enabled": True, "sample_rate": PROFILER.sample_rate})
+
+    @app.route("/admin/profiler/stop", methods=["POST"])
+    def profiler_stop():
+        if not _authorized():
+            return jsonify({"error": "Endpoint not found"}), 404
+        profile = PROFILER.stop()
+        if profile is None:
+            return jsonify({"error": "Profiler is not running"}), 409
+        return jsonify(profile.summary())
+
+    @app.route("/admin/profiler/profile", methods=["GET"])
+    def profiler_profile():
+        """Download the current or last window as collapsed stacks or speedscope JSON."""
+        if not _authorized():
+            return jsonify({"error": "Endpoint not found"}), 404
+        profile = PROFILER.snapshot()
+        if request.args.get("format", "collapsed") == "speedscope":
+            return Response(
+                json.dumps(profile.speedscope(name=service)),
+                mimetype="application/json",
+                headers={"Content-Disposition": f"attachment; filename={service}.speedscope.json"},
+            )
+        return Response(
+            profile.collapsed(),
+            mimetype="text/plain",
+            headers={"Content-Disposition": f"attachment; filename={service}.collapsed.txt"},
+        )
@@ -0,0 +1,246 @@
+"""
+Queryable index of session metadata, kept apart from session audio.
+
+Session caches are key-value stores holding whole entries, audio digests
+and response text included, so the only cheap lookup is by session id. A
+SessionIndex keeps one small row per session in SQLite instead: its
+service, type, session_type and creation time, plus the entry's scalar
+fields as JSON (long strings cut short, no response text or audio).
+Indexes on (service, type, created_at), (service, session_type,
+created_at) and (service, created_at) turn listings such as "yoga
+sessions in the last hour" into index range scans.
+
+Listings are newest first and paginated by keyset: each page ends with a
+cursor naming its last row, and the next page starts after it, so paging
+stays as fast on page 100 as on page 1 and is not thrown off by sessions
+created meanwhile.
+
+With SHARED_STORE_DIR set the database is a file there, shared by every
+worker (SQLite serializes the writers); otherwise it lives in process
+memory.
+
+Environment variables:
+    SESSION_INDEX_DB    SQLite file for the index (sessions.sqlite3 in
+                        SHARED_STORE_DIR, else in memory)
+    SESSION_INDEX_TTL   seconds a session's row is kept (604800)
+"""
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from werkzeug.exceptions import BadRequest
+
+from metrics import track_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+# Longer string fields are cut to this length in the stored metadata
+MAX_FIELD_CHARS = 200
+# Expired rows are deleted every this many writes
+PRUNE_EVERY = 500
+
+# Entry fields never copied into the metadata
+_EXCLUDED_FIELDS = frozenset(('response_text', 'audio_content'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    service TEXT NOT NULL,
+    type TEXT NOT NULL,
+    session_type TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_type ON sessions (service, type, created_at, session_id);
+CREATE INDEX IF NOT EXISTS sessions_by_session_type ON sessions (service, session_type, created_at, session_id);
+CREATE INDEX IF NOT EXISTS sessions_by_time ON sessions (service, created_at, session_id);
+"""
+
+
+def entry_metadata(entry):
+    """The scalar fields of a session entry, with long strings cut short."""
+    metadata = {}
+    for key, value in entry.items():
+        if key in _EXCLUDED_FIELDS or not isinstance(value, (str, int, float, bool, type(None))):
+            continue
+        if isinstance(value, str) and len(value) > MAX_FIELD_CHARS:
+            value = value[:MAX_FIELD_CHARS]
+        metadata[key] = value
+    return metadata
+
+
+def parse_time(value):
+    """Epoch seconds from epoch seconds or an ISO 8601 timestamp; raises BadRequest."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise BadRequest(description=f"Invalid time '{value}' (use ISO 8601 or epoch seconds)")
+
+
+def _encode_cursor(created_at, session_id):
+    return base64.urlsafe_b64encode(json.dumps([created_at, session_id]).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor):
+    try:
+        created_at, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(created_at), str(session_id)
+    except (ValueError, TypeError):
+        raise BadRequest(description="Invalid cursor")
+
+
+class SessionIndex:
+    """Session metadata rows in SQLite; see the module docstring."""
+
+    def __init__(self, name, path=":memory:", ttl=604800.0):
+        self.name = name
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self._writes = 0
+
+    def _connect(self):
+        # Opened on first use, and again in a forked worker, which must not
+        # share its parent's connection
+        if self._connection is None or self._pid != os.getpid():
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False,
+                                         isolation_level=None)
+            if self.path != ":memory:":
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def record(self, service, session_id, entry):
+        """
+        Insert or update a session's row from its entry. The creation time
+        is set by the first record and kept by later ones.
+        """
+        now = time.time()
+        session_type = entry.get('session_type') or entry.get('meditation_type')
+        row = (session_id, service, entry.get('type', 'wellness_chat'), session_type, now, now,
+               json.dumps(entry_metadata(entry), separators=(",", ":")))
+        with self._lock:
+            self._connect().execute(
+                "INSERT INTO sessions (session_id, service, type, session_type, created_at, updated_at, metadata)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (session_id) DO UPDATE SET type = excluded.type,"
+                " session_type = excluded.session_type, updated_at = excluded.updated_at,"
+                " metadata = excluded.metadata",
+                row,
+            )
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._prune(now)
+
+    def _prune(self, now):
+        deleted = self._connect().execute("DELETE FROM sessions WHERE created_at < ?", (now - self.ttl,)).rowcount
+        if deleted:
+            logger.info("🧹 Pruned %d expired rows from %s", deleted, self.name)
+
+    def query(self, service, type=None, session_type=None, since=None, until=None,
+              limit=DEFAULT_LIMIT, cursor=None):
+        """
+        One page of `service`'s sessions, newest first, filtered by type,
+        session_type and creation time (since inclusive, until exclusive,
+        epoch seconds). Returns (rows, next cursor or None); each row is
+        the metadata plus session_id, type, session_type, created_at and
+        updated_at.
+        """
+        limit = max(1, min(MAX_LIMIT, int(limit)))
+        clauses = ["service = ?"]
+        params = [service]
+        if type is not None:
+            clauses.append("type = ?")
+            params.append(type)
+        if session_type is not None:
+            clauses.append("session_type = ?")
+            params.append(session_type)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        if cursor is not None:
+            created_at, session_id = _decode_cursor(cursor)
+            clauses.append("(created_at < ? OR (created_at = ? AND session_id < ?))")
+            params.extend((created_at, created_at, session_id))
+        if self.ttl:
+            clauses.append("created_at >= ?")
+            params.append(time.time() - self.ttl)
+        sql = (
+            "SELECT session_id, type, session_type, created_at, updated_at, metadata FROM sessions"
+            f" WHERE {' AND '.join(clauses)} ORDER BY created_at DESC, session_id DESC LIMIT ?"
+        )
+        params.append(limit + 1)
+        with self._lock:
+            found = self._connect().execute(sql, params).fetchall()
+
+        rows = []
+        for session_id, type_, session_type_, created_at, updated_at, metadata in found[:limit]:
+            row = json.loads(metadata)
+            row.update(
+                session_id=session_id,
+                type=type_,
+                session_type=session_type_,
+                created_at=datetime.fromtimestamp(created_at).isoformat(),
+                updated_at=datetime.fromtimestamp(updated_at).isoformat(),
+            )
+            rows.append(row)
+        next_cursor = None
+        if len(found) > limit:
+            last = found[limit - 1]
+            next_cursor = _encode_cursor(last[3], last[0])
+        return rows, next_cursor
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def delete(self, session_id):
+        with self._lock:
+            self._connect().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def clear(self, service=None):
+        """
+        Delete the rows of `service` (or all rows); returns how many of them
+        were still listed, i.e. not yet expired.
+        """
+        with self._lock:
+            self._prune(time.time())
+            if service is None:
+                return self._connect().execute("DELETE FROM sessions").rowcount
+            return self._connect().execute("DELETE FROM sessions WHERE service = ?", (service,)).rowcount
+
+
+def session_index_from_env(name="session_index"):
+    """The SessionIndex configured by SESSION_INDEX_DB, SHARED_STORE_DIR and SESSION_INDEX_TTL."""
+    path = os.getenv("SESSION_INDEX_DB")
+    if not path:
+        directory = os.getenv("SHARED_STORE_DIR")
+        path = os.path.join(directory, "sessions.sqlite3") if directory else ":memory:"
+    index = SessionIndex(name, path=path, ttl=float(os.getenv("SESSION_INDEX_TTL", 604800)))
+    track_cache(name, index)
+    return index
+
+
+SESSION_INDEX = session_index_from_env()
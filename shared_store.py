@@ -0,0 +1,359 @@
+"""
+Process-shared store for audio responses and session metadata.
+
+Each Flask app keeps its sessions in `audio_cache`. In one process that is
+a dict, but behind several server workers a /get_audio request only finds
+the session if it reaches the worker that served the POST. With
+SHARED_STORE_DIR set, the cache is a SharedAudioCache instead: a single
+memory-mapped file per cache (put it on tmpfs, e.g. /dev/shm) that every
+worker maps.
+
+File layout:
+    header   magic, slot count, data capacity, write head, sequence number,
+             eviction tail, end of the previous pass, entry and byte counts
+    index    fixed array of slots (key digest, offset, length, expiry, seq),
+             open-addressed with a short probe sequence, so lookups are O(1)
+    data     ring buffer of records (key digest, seq, length, payload)
+
+Writers append the record at the ring's head, wrapping to the start when it
+does not fit, and then point the key's slot at it. The oldest records are
+overwritten as the ring goes round, which bounds the file size: before a
+record is written, the records it overwrites are walked from the eviction
+tail and their slots freed. The header keeps running counts of the occupied
+slots and their payload bytes, so sizes are read without scanning the
+index. Access is serialized with flock() across processes (and a lock
+within each), so readers never see a half-written entry.
+
+Environment variables:
+    SHARED_STORE_DIR     directory for the store files; unset keeps sessions
+                         in process memory
+    SHARED_STORE_MB      data capacity of each store in MiB (64)
+    SHARED_STORE_SLOTS   index slots, i.e. maximum entries, per store (4096)
+    SHARED_STORE_TTL     seconds an entry is kept (86400)
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import CACHE_BYTES, track_cache
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SCSTORE1"
+# magic, version, slots, capacity, head, seq, tail, end, entries, payload bytes
+_HEADER = struct.Struct("<8sIIQQQQQQQ")
+_HEADER_SIZE = 128
+_SLOT = struct.Struct("<16sQQdQ")    # key digest, offset, length, expires_at, seq
+_RECORD = struct.Struct("<16sQQ")    # key digest, seq, payload length
+_VERSION = 2
+_EMPTY_DIGEST = bytes(16)
+_EMPTY_SLOT = (_EMPTY_DIGEST, 0, 0, 0.0, 0)
+
+DEFAULT_CAPACITY = 64 * 1024 * 1024
+
+# Slots tried for a key before the oldest of them is replaced
+PROBES = 8
+
+
+def _digest(key):
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+class SharedStore:
+    """
+    Bounded bytes-valued key/value store in a memory-mapped file, safe to use
+    from several threads and processes at once.
+    """
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, slots=4096, ttl=86400.0):
+        self.path = path
+        self.capacity = capacity
+        self.slots = slots
+        self.ttl = ttl
+        self._data_start = _HEADER_SIZE + slots * _SLOT.size
+        self._size = self._data_start + capacity
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def _open(self):
+        # flock() does not exclude processes sharing a descriptor, so each
+        # process (e.g. a forked server worker) maps the file itself
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(fd, _HEADER.size, 0)
+            if (os.fstat(fd).st_size != self._size or len(header) != _HEADER.size
+                    or _HEADER.unpack(header)[:4] != (MAGIC, _VERSION, self.slots, self.capacity)):
+                # New file, or one laid out for other settings: start empty
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self._size)
+                os.pwrite(fd, _HEADER.pack(MAGIC, _VERSION, self.slots, self.capacity, 0, 0, 0, 0, 0, 0), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._map = mmap.mmap(fd, self._size)
+        self._pid = os.getpid()
+
+    @contextmanager
+    def _locked(self, operation):
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, operation)
+            try:
+                yield self._map
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _slot_offset(self, index):
+        return _HEADER_SIZE + index * _SLOT.size
+
+    def _probe(self, digest):
+        start = int.from_bytes(digest[:8], "little") % self.slots
+        return [(start + i) % self.slots for i in range(min(PROBES, self.slots))]
+
+    def _valid(self, mm, slot, now):
+        digest, offset, length, expires_at, seq = slot
+        if seq == 0 or expires_at <= now:
+            return False
+        # The ring may have overwritten the record since the slot was written
+        return _RECORD.unpack_from(mm, self._data_start + offset) == (digest, seq, length)
+
+    def _find(self, mm, digest, now):
+        for index in self._probe(digest):
+            slot = _SLOT.unpack_from(mm, self._slot_offset(index))
+            if slot[0] == digest and self._valid(mm, slot, now):
+                return slot
+        return None
+
+    def get(self, key):
+        """The bytes stored for `key`, or None."""
+        digest = _digest(key)
+        with self._locked(fcntl.LOCK_SH) as mm:
+            slot = self._find(mm, digest, time.time())
+            if slot is None:
+                return None
+            start = self._data_start + slot[1] + _RECORD.size
+            return bytes(mm[start:start + slot[2]])
+
+    def __contains__(self, key):
+        digest = _digest(key)
+        with self._locked(fcntl.LOCK_SH) as mm:
+            return self._find(mm, digest, time.time()) is not None
+
+    def put(self, key, value, ttl=None):
+        """
+        Store `value` (bytes) for `key`, replacing any previous value. A
+        value too large for the store is logged and not stored.
+        """
+        need = _RECORD.size + len(value)
+        if need > self.capacity:
+            logger.warning("⚠️ Not storing %d bytes in %s, which holds %d",
+                           len(value), os.path.basename(self.path), self.capacity)
+            return
+        digest = _digest(key)
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+
+        with self._locked(fcntl.LOCK_EX) as mm:
+            header = list(_HEADER.unpack_from(mm, 0))
+            seq, head = header[5] + 1, header[4]
+            if head + need > self.capacity:
+                # Wrap: what is left of the previous pass is overwritten
+                # first, then this pass's records from the start
+                self._evict(mm, header, header[7])
+                header[6], header[7] = 0, head
+                head = 0
+            self._evict(mm, header, head + need)
+
+            record_at = self._data_start + head
+            _RECORD.pack_into(mm, record_at, digest, seq, len(value))
+            mm[record_at + _RECORD.size:record_at + need] = value
+
+            # Reuse the key's slot, else a free or dead one, else the oldest
+            target = None
+            oldest = None
+            for index in self._probe(digest):
+                slot = _SLOT.unpack_from(mm, self._slot_offset(index))
+                if slot[0] == digest:
+                    target = index
+                    break
+                if target is None and not self._valid(mm, slot, now):
+                    target = index
+                if oldest is None or slot[4] < oldest[1]:
+                    oldest = (index, slot[4])
+            if target is None:
+                target = oldest[0]
+            self._set_slot(mm, header, target, (digest, head, len(value), expires_at, seq))
+            header[4], header[5] = head + need, seq
+            _HEADER.pack_into(mm, 0, *header)
+
+    def _set_slot(self, mm, header, index, slot):
+        """Write slot `index`, keeping the header's entry and byte counts."""
+        offset = self._slot_offset(index)
+        old = _SLOT.unpack_from(mm, offset)
+        if old[4]:
+            header[8] -= 1
+            header[9] -= old[2]
+        if slot[4]:
+            header[8] += 1
+            header[9] += slot[2]
+        _SLOT.pack_into(mm, offset, *slot)
+
+    def _evict(self, mm, header, until):
+        """
+        Free the slots of the previous pass's records that start before
+        `until`, oldest first, moving the tail past them.
+        """
+        tail, end = header[6], header[7]
+        while tail < min(until, end):
+            digest, seq, length = _RECORD.unpack_from(mm, self._data_start + tail)
+            for index in self._probe(digest):
+                slot = _SLOT.unpack_from(mm, self._slot_offset(index))
+                if slot[0] == digest and slot[4] == seq and slot[1] == tail:
+                    self._set_slot(mm, header, index, _EMPTY_SLOT)
+                    break
+            tail += _RECORD.size + length
+        header[6] = tail
+
+    def delete(self, key):
+        digest = _digest(key)
+        with self._locked(fcntl.LOCK_EX) as mm:
+            header = list(_HEADER.unpack_from(mm, 0))
+            for index in self._probe(digest):
+                if _SLOT.unpack_from(mm, self._slot_offset(index))[0] == digest:
+                    self._set_slot(mm, header, index, _EMPTY_SLOT)
+            _HEADER.pack_into(mm, 0, *header)
+
+    def clear(self):
+        with self._locked(fcntl.LOCK_EX) as mm:
+            mm[_HEADER_SIZE:self._data_start] = bytes(self._data_start - _HEADER_SIZE)
+            magic, version, slots, capacity, _, seq = _HEADER.unpack_from(mm, 0)[:6]
+            _HEADER.pack_into(mm, 0, magic, version, slots, capacity, 0, seq, 0, 0, 0, 0)
+
+    def stats(self):
+        """
+        Entries and the payload bytes they hold, from the header's running
+        counts. Expired entries count until they are overwritten or replaced.
+        """
+        with self._locked(fcntl.LOCK_SH) as mm:
+            entries, payload = _HEADER.unpack_from(mm, 0)[8:10]
+        return {"entries": entries, "bytes": payload, "capacity": self.capacity, "slots": self.slots}
+
+
+class StoredAudio(bytes):
+    """MP3 bytes read back from a SharedStore; stands in for an Mp3Assembly."""
+
+    def __new__(cls, data, duration_seconds=0.0):
+        audio = super().__new__(cls, data)
+        audio.duration_seconds = duration_seconds
+        return audio
+
+    def iter_bytes(self, include_header=True):
+        yield bytes(self)
+
+    def to_bytes(self):
+        return bytes(self)
+
+
+class SharedAudioCache:
+    """
+    Dict-like session cache backed by a SharedStore.
+
+    Entries are dicts of JSON-serializable metadata plus an optional
+    'audio_content' (an Mp3Assembly or bytes), which comes back as
+    StoredAudio. Entries are copies: changing one after storing it has no
+    effect until it is stored again.
+    """
+
+    def __init__(self, name, store):
+        self.name = name
+        self.store = store
+        track_cache(name, self)
+        CACHE_BYTES.set_function(lambda: {(name,): self.store.stats()["bytes"]})
+
+    @staticmethod
+    def _encode(entry):
+        meta = {key: value for key, value in entry.items() if key != 'audio_content'}
+        audio = entry.get('audio_content')
+        if audio is not None:
+            meta['_audio_duration'] = getattr(audio, 'duration_seconds', 0.0)
+            audio = b"".join(audio.iter_bytes()) if hasattr(audio, 'iter_bytes') else bytes(audio)
+        encoded = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        return struct.pack("<I", len(encoded)) + encoded + (audio or b"")
+
+    @staticmethod
+    def _decode(data):
+        (meta_length,) = struct.unpack_from("<I", data)
+        entry = json.loads(data[4:4 + meta_length])
+        if '_audio_duration' in entry:
+            duration = entry.pop('_audio_duration')
+            entry['audio_content'] = StoredAudio(memoryview(data)[4 + meta_length:], duration)
+        return entry
+
+    def get(self, key, default=None):
+        data = self.store.get(key)
+        return default if data is None else self._decode(data)
+
+    def __getitem__(self, key):
+        entry = self.get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    def __setitem__(self, key, entry):
+        self.store.put(key, self._encode(entry))
+
+    def __delitem__(self, key):
+        self.store.delete(key)
+
+    def __contains__(self, key):
+        return key in self.store
+
+    def __len__(self):
+        return self.store.stats()["entries"]
+
+    def pop(self, key, default=None):
+        entry = self.get(key, default)
+        self.store.delete(key)
+        return entry
+
+    def clear(self):
+        self.store.clear()
+
+
+def store_from_env(name):
+    """The SharedStore `name` in SHARED_STORE_DIR, or None when that is unset."""
+    directory = os.getenv("SHARED_STORE_DIR")
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    return SharedStore(
+        os.path.join(directory, f"{name}.store"),
+        capacity=int(float(os.getenv("SHARED_STORE_MB", 64)) * 1024 * 1024),
+        slots=int(os.getenv("SHARED_STORE_SLOTS", 4096)),
+        ttl=float(os.getenv("SHARED_STORE_TTL", 86400)),
+    )
+
+
+def session_cache(name, size_of=None):
+    """
+    The session cache called `name`: a SharedAudioCache in SHARED_STORE_DIR
+    when that is set, else a dict. Either is reported at /metrics.
+    """
+    store = store_from_env(name)
+    if store is None:
+        cache = {}
+        track_cache(name, cache, size_of=size_of)
+        return cache
+    return SharedAudioCache(name, store)
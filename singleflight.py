@@ -0,0 +1,73 @@
+"""
+Coalescing of identical concurrent calls.
+
+While a call for a key is in flight, other callers with the same key wait
+for its result instead of repeating it, so a burst of identical requests
+costs one upstream call.
+"""
+import hashlib
+import threading
+
+from metrics import COALESCED_CALLS
+
+
+def request_key(*parts):
+    """
+    Stable key for a normalized request: whitespace is collapsed in every
+    part, so prompts that differ only in layout share a key.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(" ".join(str(part).split()).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; reported to /metrics as `name`."""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Return fn(*args, **kwargs), or the result of the identical call that
+        is already in flight. Waiters see the same exception if it fails.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            COALESCED_CALLS.inc(group=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self, key):
+        return key in self._calls
@@ -0,0 +1,29 @@
+"""
+Transcript cache shared by the speech-to-text paths of all services.
+
+Clients retry voice messages on flaky networks, so identical audio is often
+uploaded more than once. Transcripts are keyed by the SHA-256 of the audio
+and the STT request URL (model and options), so a retry only costs a hash.
+Entries are (transcript, audio_input) pairs, where audio_input describes any
+preprocessing applied to the upload.
+
+Environment variables:
+    STT_CACHE_SIZE   transcripts to keep (512)
+    STT_CACHE_TTL    seconds to keep a transcript (3600)
+"""
+import os
+
+from ttl_cache import TTLCache
+from uploads import upload_digest
+
+TRANSCRIPT_CACHE = TTLCache(
+    "stt_transcripts",
+    max_entries=int(os.getenv("STT_CACHE_SIZE", 512)),
+    ttl=float(os.getenv("STT_CACHE_TTL", 3600)),
+    size_of=lambda entry: len(entry[0]),
+)
+
+
+def transcript_key(audio_file, stt_url):
+    """Cache key for transcribing this upload with the given model and options."""
+    return f"{upload_digest(audio_file)}:{stt_url}"
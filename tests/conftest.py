@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# Keep test runs from writing log files or flooding the output
+os.environ.setdefault("LOG_FILE", "")
+os.environ.setdefault("LOG_STDERR", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_assembly import Mp3FrameHeader  # noqa: E402
+
+# MPEG-2 layer III, 48 kbps, 24 kHz, mono: 144-byte frames of 576 samples (24ms)
+MP3_FRAME_HEADER = Mp3FrameHeader.parse(bytes((0xFF, 0xF3, 0x64, 0xC4)))
+
+
+@pytest.fixture
+def mp3():
+    """Builds MP3 files of `frames` audio frames, with an ID3v2 tag and a Xing frame like Deepgram's."""
+    header = MP3_FRAME_HEADER
+
+    def build(frames, fill=0):
+        xing = bytearray(header.frame_length)
+        xing[:4] = header.raw
+        xing[header.side_info_end:header.side_info_end + 4] = b"Xing"
+        frame = header.raw + bytes([fill]) * (header.frame_length - 4)
+        return b"ID3\x04\x00\x00\x00\x00\x00\x00" + bytes(xing) + frame * frames
+
+    return build
@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+from flask import Flask
+
+from admission import AdmissionPool, PoolFull, UpstreamRateLimited, instrument_admission
+
+TIMEOUT = 5.0
+
+
+def test_full_pool_rejects_with_a_retry_after_from_its_service_times():
+    pool = AdmissionPool("test", max_in_flight=2, max_queue=0, queue_timeout=0.1)
+    pool.acquire()
+    # Service time moves a fifth of the way towards each sample: 1.0 -> 3.0
+    pool.release(11.0)
+    pool.acquire()
+    pool.acquire()
+
+    with pytest.raises(PoolFull) as rejected:
+        pool.acquire()
+    assert rejected.value.code == 503
+    assert rejected.value.retry_after == 2  # ceil(3.0 s * 1 waiting / 2 slots)
+
+
+def test_queued_request_times_out():
+    pool = AdmissionPool("test", max_in_flight=1, max_queue=1, queue_timeout=0.05)
+    pool.acquire()
+    with pytest.raises(PoolFull):
+        pool.acquire()
+    assert pool.queued == 0 and pool.in_flight == 1
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setenv("ADMISSION_EXPENSIVE_MAX", "1")
+    monkeypatch.setenv("ADMISSION_EXPENSIVE_QUEUE", "0")
+    app = Flask(__name__)
+    app.started = threading.Event()
+    app.release = threading.Event()
+
+    @app.route("/expensive")
+    def expensive():
+        app.started.set()
+        assert app.release.wait(TIMEOUT)
+        return "done"
+
+    @app.route("/health")
+    def health():
+        return "ok"
+
+    @app.route("/limited")
+    def limited():
+        raise UpstreamRateLimited("Gemini", retry_after=7)
+
+    instrument_admission(app, "test", {"expensive": "expensive", "limited": "expensive"})
+    return app
+
+
+def test_cheap_endpoints_get_through_while_the_expensive_pool_is_full(app):
+    responses = []
+    worker = threading.Thread(target=lambda: responses.append(app.test_client().get("/expensive")))
+    worker.start()
+    try:
+        assert app.started.wait(TIMEOUT)
+        client = app.test_client()
+
+        busy = client.get("/expensive")
+        assert busy.status_code == 503
+        assert busy.headers["Retry-After"] == "1"
+        assert busy.json["retry_after"] == 1
+
+        assert client.get("/health").data == b"ok"
+    finally:
+        app.release.set()
+        worker.join(TIMEOUT)
+    assert responses[0].data == b"done"
+
+
+def test_upstream_rate_limit_is_a_429_with_its_retry_after(app):
+    response = app.test_client().get("/limited")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+    assert response.json == {"error": "Gemini rate limit exceeded", "retry_after": 7}
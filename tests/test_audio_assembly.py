@@ -0,0 +1,59 @@
+import struct
+
+import pytest
+
+from audio_assembly import Mp3Assembly, Mp3FrameHeader, silent_frame
+
+FRAME_SECONDS = 576 / 24000
+
+
+def test_concatenation_drops_tags_and_per_file_header_frames(mp3):
+    assembly = Mp3Assembly()
+    assert assembly.append(mp3(10, fill=1)) == pytest.approx(10 * FRAME_SECONDS)
+    assembly.append(mp3(5, fill=2))
+
+    assert assembly.frame_count == 15
+    assert assembly.duration_seconds == pytest.approx(15 * FRAME_SECONDS)
+
+    audio = b"".join(assembly.iter_bytes(include_header=False))
+    assert b"ID3" not in audio and b"Xing" not in audio
+    assert len(audio) == 15 * 144
+    assert audio[4:8] == b"\x01" * 4 and audio[-4:] == b"\x02" * 4
+
+
+def test_header_frame_describes_the_whole_stream(mp3):
+    assembly = Mp3Assembly()
+    assembly.append(mp3(3))
+    assembly.append(mp3(4))
+
+    data = assembly.to_bytes()
+    assert len(data) == len(assembly)
+    header = Mp3FrameHeader.parse(data)
+    tag, flags, frames, total_bytes = struct.unpack_from(">4sIII", data, header.side_info_end)
+    # One bitrate throughout, so a CBR Info frame
+    assert (tag, flags, frames, total_bytes) == (b"Info", 3, 7, len(data))
+
+
+def test_silence_is_whole_frames_in_the_stream_format(mp3):
+    assembly = Mp3Assembly()
+    with pytest.raises(ValueError):
+        assembly.append_silence(1.0)
+
+    assembly.append(mp3(2))
+    added = assembly.append_silence(1.0)
+    assert added == pytest.approx(round(1.0 / FRAME_SECONDS) * FRAME_SECONDS)
+    assert assembly.duration_seconds == pytest.approx(2 * FRAME_SECONDS + added)
+
+    silent = Mp3FrameHeader.parse(silent_frame(Mp3FrameHeader.parse(mp3(1), 10)))
+    assert silent.same_stream(Mp3FrameHeader.parse(mp3(1), 10))
+    assert silent.sample_rate == 24000 and silent.mono
+    # Mixed bitrates make the stream VBR, so it gets a Xing frame
+    data = assembly.to_bytes()
+    assert data[Mp3FrameHeader.parse(data).side_info_end:][:4] == b"Xing"
+
+
+def test_unrecognised_data_is_kept_without_a_header_frame():
+    assembly = Mp3Assembly()
+    assert assembly.append(b"not audio at all") == 0.0
+    assert assembly.to_bytes() == b"not audio at all"
+    assert assembly.duration_seconds == 0.0
@@ -0,0 +1,72 @@
+import pytest
+from flask import Flask
+
+import healty_lifestyle
+from app_factory import build_app
+from audio_assembly import Mp3Assembly
+from audio_formats import LINEAR16, MP3, OPUS, requested_format
+from audio_store import audio_fields
+
+SESSION_ID = "audio-formats"
+
+
+@pytest.mark.parametrize("query, body, accept, expected", [
+    ("", None, "", MP3),
+    ("", None, "audio/ogg", OPUS),
+    ("", None, "audio/ogg;q=0.5, audio/wav", LINEAR16),
+    # The body's field beats the Accept header...
+    ("", {"audio_format": "wav"}, "audio/ogg", LINEAR16),
+    # ...and ?format= beats both
+    ("?format=ogg", {"audio_format": "wav"}, "audio/mpeg", OPUS),
+])
+def test_requested_format_priority(query, body, accept, expected):
+    with Flask(__name__).test_request_context(f"/audio{query}", headers={"Accept": accept}):
+        assert requested_format(body) is expected
+
+
+@pytest.fixture
+def synthesized(monkeypatch, mp3):
+    """The formats synthesized by get_audio, in order."""
+    formats = []
+
+    def synthesize(text, audio_format, progress=None):
+        formats.append(audio_format.name)
+        assembly = audio_format.assembly()
+        assembly.append(mp3(10) if audio_format is MP3 else b"\x00\x01" * 240)
+        return assembly
+
+    monkeypatch.setattr(healty_lifestyle, "deepgram_text_to_speech_multi", synthesize)
+    audio = Mp3Assembly()
+    audio.append(mp3(10))
+    healty_lifestyle.store_session(SESSION_ID, dict(audio_fields(audio, MP3), response_text="Breathe slowly."))
+    yield formats
+    healty_lifestyle.audio_cache.pop(SESSION_ID, None)
+
+
+@pytest.fixture
+def client():
+    return build_app([healty_lifestyle.service], prefixed=False).test_client()
+
+
+def test_audio_varies_on_accept(client, synthesized):
+    response = client.get(f"/get_audio/{SESSION_ID}")
+    assert response.status_code == 200
+    assert response.mimetype == "audio/mpeg"
+    assert "Accept" in response.headers["Vary"]
+
+
+def test_each_format_is_cached_under_the_session(client, synthesized):
+    mp3_response = client.get(f"/get_audio/{SESSION_ID}")
+    wav_response = client.get(f"/get_audio/{SESSION_ID}", headers={"Accept": "audio/wav"})
+    assert wav_response.mimetype == "audio/wav"
+    assert wav_response.data[:4] == b"RIFF"
+    assert wav_response.headers["ETag"] != mp3_response.headers["ETag"]
+
+    # Both formats are now kept; neither is synthesized again
+    assert client.get(f"/get_audio/{SESSION_ID}?format=wav").data == wav_response.data
+    assert client.get(f"/get_audio/{SESSION_ID}").data == mp3_response.data
+    assert synthesized == ["linear16"]
+
+    variants = healty_lifestyle.audio_cache.get(SESSION_ID)["audio_variants"]
+    assert set(variants) == {"mp3", "linear16"}
+    assert variants["linear16"] == wav_response.headers["ETag"].strip('"')
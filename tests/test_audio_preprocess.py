@@ -0,0 +1,23 @@
+import struct
+
+import pytest
+
+from audio_preprocess import decode_wav
+
+
+def wav(samples=b"\x00\x00" * 8, format_tag=1, channels=1, sample_rate=16000, block_align=2, bits=16):
+    fmt = struct.pack("<HHIIHH", format_tag, channels, sample_rate, sample_rate * block_align, block_align, bits)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(samples)) + samples
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def test_decodes_16_bit_pcm():
+    audio = decode_wav(wav(struct.pack("<4h", 0, 16384, -32768, 32767)))
+    assert audio.sample_rate == 16000
+    assert audio.samples.shape == (4, 1)
+    assert audio.samples[1, 0] == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize("block_align, bits", [(0, 0), (0, 4), (2, 0), (3, 16)])
+def test_malformed_headers_are_rejected(block_align, bits):
+    assert decode_wav(wav(block_align=block_align, bits=bits)) is None
@@ -0,0 +1,81 @@
+import pytest
+from flask import Flask
+
+from audio_assembly import Mp3Assembly, WavAssembly
+from audio_formats import LINEAR16, MP3, OPUS, format_of
+from audio_store import AudioStore, audio_response
+
+
+@pytest.fixture
+def audio(mp3):
+    assembly = Mp3Assembly()
+    assembly.append(mp3(10, fill=7))
+    return assembly
+
+
+@pytest.fixture
+def client(audio):
+    app = Flask(__name__)
+
+    @app.route("/audio")
+    def serve():
+        return audio_response(audio, "digest", "audio.mp3")
+
+    return app.test_client()
+
+
+def test_full_response_advertises_ranges(client, audio):
+    response = client.get("/audio")
+    assert response.status_code == 200
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["ETag"] == '"digest"'
+    assert response.data == audio.to_bytes()
+
+
+def test_byte_range_is_served_as_partial_content(client, audio):
+    data = audio.to_bytes()
+    response = client.get("/audio", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 100-199/{len(data)}"
+    assert response.data == data[100:200]
+
+    response = client.get("/audio", headers={"Range": "bytes=-50"})
+    assert response.status_code == 206
+    assert response.data == data[-50:]
+
+
+def test_range_is_ignored_for_a_different_representation(client, audio):
+    response = client.get("/audio", headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert response.status_code == 200
+    assert response.data == audio.to_bytes()
+
+
+def test_unsatisfiable_range_and_not_modified(client, audio):
+    response = client.get("/audio", headers={"Range": f"bytes={len(audio) + 10}-"})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{len(audio)}"
+
+    response = client.get("/audio", headers={"If-None-Match": '"digest"'})
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_audio_is_only_served_as_its_own_format(audio):
+    store = AudioStore("test_audio_store")
+    mp3_digest = store.put(audio)
+    wav = WavAssembly(24000)
+    wav.append(b"\x00\x01" * 100)
+    wav_digest = store.put(wav)
+
+    assert store.get_as(mp3_digest, MP3) is not None
+    assert store.get_as(mp3_digest, LINEAR16) is None
+    assert store.get_as(wav_digest, LINEAR16) is not None
+    assert store.get_as(wav_digest, OPUS) is None
+    assert store.get_as("0" * 64, MP3) is None
+
+
+def test_format_of_recognises_each_container():
+    assert format_of(b"OggS\x00\x02") is OPUS
+    assert format_of(b"RIFF\x24\x00\x00\x00WAVEfmt ") is LINEAR16
+    assert format_of(b"\xff\xf3\x64\xc4") is MP3
+    assert format_of(b"{\"error\": 1}") is None
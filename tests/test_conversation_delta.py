@@ -0,0 +1,89 @@
+from datetime import datetime
+
+import pytest
+
+import ai_assistance
+from ai_assistance import CONVERSATIONS, ConversationStage, ConversationState, PatientProfile
+from app_factory import build_app
+
+
+def new_conversation(session_id):
+    now = datetime.now()
+    conversation = ConversationState(
+        session_id=session_id,
+        stage=ConversationStage.GREETING,
+        symptoms=[],
+        patient_profile=PatientProfile(),
+        conversation_history=[],
+        extracted_info={},
+        diagnosis_results=[],
+        follow_up_questions=[],
+        created_at=now,
+        last_updated=now,
+    )
+    CONVERSATIONS[session_id] = conversation
+    return conversation
+
+
+@pytest.fixture
+def client():
+    yield build_app([ai_assistance.service], prefixed=False).test_client()
+    CONVERSATIONS.clear()
+
+
+def test_delta_returns_only_changes_after_cursor(client):
+    conversation = new_conversation("delta")
+    conversation.add_message("user", "I have a headache")
+    since = conversation.revision
+    conversation.add_message("assistant", "How long have you had it?")
+    conversation.stage = ConversationStage.SYMPTOM_COLLECTION
+    conversation.mark_changed("stage")
+
+    data = client.get(f"/conversation/delta?since={since}&epoch={conversation.epoch}").json
+
+    assert data["full"] is False
+    assert data["history_offset"] == 1
+    assert [m["content"] for m in data["conversation_history"]] == ["How long have you had it?"]
+    assert data["stage"] == "symptom_collection"
+    assert "symptoms" not in data
+    assert data["revision"] == conversation.revision
+
+
+def test_cursor_without_epoch_gets_full_state(client):
+    conversation = new_conversation("no-epoch")
+    conversation.add_message("user", "hello")
+
+    data = client.get(f"/conversation/no-epoch?since={conversation.revision}").json
+
+    assert data["full"] is True
+    assert data["epoch"] == conversation.epoch
+
+
+def test_reset_then_since_returns_full_state(client):
+    old = new_conversation("reset")
+    for i in range(5):
+        old.add_message("user", f"old message {i}")
+    old_epoch = old.epoch
+
+    assert client.post("/conversation/reset/reset").status_code == 200
+    # The next message starts a new conversation under the same session id
+    new = new_conversation("reset")
+    new.add_message("user", "new message")
+    new.add_message("assistant", "new reply")
+    # The old cursor is not ahead of the new conversation's revision
+    assert 1 <= new.revision
+
+    data = client.get(f"/conversation/reset?since=1&epoch={old_epoch}").json
+
+    assert data["full"] is True
+    assert data["epoch"] == new.epoch != old_epoch
+    assert [m["content"] for m in data["conversation_history"]] == ["new message", "new reply"]
+
+
+def test_cursor_ahead_of_conversation_gets_full_state(client):
+    conversation = new_conversation("ahead")
+    conversation.add_message("user", "hello")
+
+    data = client.get(f"/conversation/ahead?since=99&epoch={conversation.epoch}").json
+
+    assert data["full"] is True
@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_assembly import Mp3Assembly
+from cue_clips import CueLibrary, CueTrack
+
+TIMEOUT = 5.0
+
+
+class FakeVoice:
+    """Renders each cue as MP3 frames; renders of `slow` wait for `release`."""
+
+    model = "test-voice"
+
+    def __init__(self, mp3, slow=None):
+        self.mp3 = mp3
+        self.slow = slow
+        self.release = threading.Event()
+        self.rendered = []
+        self._lock = threading.Lock()
+
+    def text_to_speech_chunked(self, text, audio_format):
+        with self._lock:
+            self.rendered.append(text)
+        if text == self.slow:
+            assert self.release.wait(TIMEOUT)
+        assembly = Mp3Assembly()
+        assembly.append(self.mp3(len(text)))
+        return assembly
+
+
+def test_clips_render_once_and_are_reloaded_from_disk(mp3, tmp_path):
+    voice = FakeVoice(mp3)
+    library = CueLibrary(voice, directory=str(tmp_path))
+    audio = library.clip("Breathe in")
+    assert library.clip("Breathe in") is audio
+    assert voice.rendered == ["Breathe in"]
+
+    restarted = CueLibrary(FakeVoice(mp3), directory=str(tmp_path))
+    assert restarted.clip("Breathe in") == audio
+    assert restarted.voice.rendered == []
+
+
+def test_a_slow_render_blocks_only_its_own_cue(mp3):
+    voice = FakeVoice(mp3, slow="Hold")
+    library = CueLibrary(voice, directory="")
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        holds = [pool.submit(library.clip, "Hold") for _ in range(2)]
+        # Another cue renders while "Hold" is still in flight
+        assert pool.submit(library.clip, "Breathe out").result(TIMEOUT)
+        voice.release.set()
+        assert holds[0].result(TIMEOUT) == holds[1].result(TIMEOUT)
+
+    assert sorted(voice.rendered) == ["Breathe out", "Hold"]
+
+
+def test_track_places_cues_on_the_timeline(mp3):
+    track = CueTrack(CueLibrary(FakeVoice(mp3), directory=""))
+    track.cue("In")
+    track.cue("Out", at=3.0)
+    assert abs(track.position - (3.0 + len("Out") * 576 / 24000)) < 0.03
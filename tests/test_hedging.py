@@ -0,0 +1,48 @@
+import threading
+import time
+
+from flask import Flask
+
+from hedging import MIN_SAMPLES, HedgedCall
+from tracing import instrument_tracing, span
+
+
+def synthesize(text):
+    with span("tts_chunk"):
+        return text.upper()
+
+
+def test_hedged_attempts_record_spans_on_the_request():
+    hedge = HedgedCall("test_hedge", enabled=True)
+    app = Flask(__name__)
+    instrument_tracing(app, "test")
+
+    @app.route("/speak")
+    def speak():
+        return hedge.call(synthesize, "hello")
+
+    response = app.test_client().get("/speak")
+    assert response.data == b"HELLO"
+    assert "tts_chunk;dur=" in response.headers["Server-Timing"]
+
+
+def test_backup_attempt_wins_over_a_straggler():
+    hedge = HedgedCall("test_hedge_backup", enabled=True, min_delay=0.01)
+    for _ in range(MIN_SAMPLES):
+        hedge.call(lambda: None)
+
+    calls = []
+    release = threading.Event()
+
+    def upstream():
+        calls.append(threading.current_thread().name)
+        if len(calls) == 1:
+            release.wait(5.0)
+            return "slow"
+        return "fast"
+
+    start = time.perf_counter()
+    assert hedge.call(upstream) == "fast"
+    release.set()
+    assert len(calls) == 2
+    assert time.perf_counter() - start < 5.0
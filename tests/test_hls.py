@@ -0,0 +1,56 @@
+import struct
+
+from audio_assembly import Mp3Assembly
+from hls import MIN_TARGET_DURATION, TIMESTAMP_OWNER, render_playlist, target_duration_for, timestamp_tag
+
+
+def test_open_playlist_lists_segments_in_order():
+    text = render_playlist([(29.5, "seg/0.mp3"), (30.25, "seg/1.mp3")], ended=False, target_duration=30)
+
+    assert text.splitlines() == [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        "#EXT-X-TARGETDURATION:30",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:EVENT",
+        "#EXTINF:29.500,",
+        "seg/0.mp3",
+        "#EXTINF:30.250,",
+        "seg/1.mp3",
+    ]
+
+
+def test_ended_playlist_is_closed():
+    text = render_playlist([(10.0, "seg/0.mp3")], ended=True, target_duration=10)
+    assert text.endswith("seg/0.mp3\n#EXT-X-ENDLIST\n")
+
+
+def test_empty_playlist_keeps_its_target_duration():
+    text = render_playlist([], ended=False, target_duration=120)
+    assert "#EXT-X-TARGETDURATION:120" in text.splitlines()
+    assert "#EXTINF" not in text
+
+
+def test_target_duration_is_written_as_given():
+    # Raising it for a long segment would change it between polls
+    text = render_playlist([(31.0, "seg/0.mp3")], ended=False, target_duration=target_duration_for(29.2))
+    assert "#EXT-X-TARGETDURATION:30" in text.splitlines()
+    assert target_duration_for(0) == MIN_TARGET_DURATION
+
+
+def test_timestamp_tag_carries_the_start_time_at_90khz():
+    tag = timestamp_tag(12.5)
+    assert tag[:5] == b"ID3\x04\x00"
+    assert int.from_bytes(tag[6:10], "big") == len(tag) - 10
+    assert tag[10:14] == b"PRIV"
+    owner_end = 20 + len(TIMESTAMP_OWNER)
+    assert tag[20:owner_end] == TIMESTAMP_OWNER and tag[owner_end] == 0
+    assert struct.unpack(">Q", tag[owner_end + 1:]) == (12.5 * 90000,)
+    # The timestamp wraps at 33 bits
+    assert struct.unpack(">Q", timestamp_tag(2 ** 33 / 90000 + 1)[-8:]) == (90000,)
+
+
+def test_tagged_segments_are_still_plain_mp3(mp3):
+    assembly = Mp3Assembly()
+    assembly.append(timestamp_tag(3.0) + mp3(10))
+    assert assembly.frame_count == 10
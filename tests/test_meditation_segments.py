@@ -0,0 +1,156 @@
+import threading
+import time
+
+import pytest
+
+import healty_lifestyle
+from app_factory import build_app
+from audio_assembly import Mp3Assembly
+from hls import timestamp_tag
+
+# The real scheduler, before the client fixture replaces it
+schedule_meditation_segments = healty_lifestyle.schedule_meditation_segments
+
+@pytest.fixture
+def client(monkeypatch, mp3):
+    # About 160 words spoken at Aura's pace: a minute or so, well short of the plan
+    frames = iter([2670, 3300, 2100, 2900])
+
+    def synthesize(text, audio_format, progress=None):
+        assembly = Mp3Assembly()
+        assembly.append(mp3(next(frames)))
+        return assembly
+
+    monkeypatch.setattr(healty_lifestyle, "generate_gemini_text", lambda prompt, cacheable=False: "Breathe slowly. ")
+    monkeypatch.setattr(healty_lifestyle, "deepgram_text_to_speech_multi", synthesize)
+    # Segments are produced by the test, not by background jobs
+    monkeypatch.setattr(healty_lifestyle, "schedule_meditation_segments", lambda session_id, entry: None)
+    return build_app([healty_lifestyle.service], prefixed=False).test_client()
+
+
+def playlist(client, session_id):
+    """(target duration, segment durations) advertised by the playlist."""
+    lines = client.get(f"/guided_meditation/{session_id}/playlist.m3u8").data.decode().splitlines()
+    (target,) = [int(line.split(":")[1]) for line in lines if line.startswith("#EXT-X-TARGETDURATION:")]
+    durations = [float(line.split(":")[1].rstrip(",")) for line in lines if line.startswith("#EXTINF:")]
+    return target, durations
+
+
+def start_meditation(client):
+    started = client.post("/guided_meditation", json={"duration": 10, "delivery": "segmented"}).json
+    assert started["segments_ready"] == 1
+    client.get(f"/guided_meditation/{started['session_id']}/segments/0.mp3")
+    return started["session_id"]
+
+
+def test_segments_fill_the_advertised_target_duration(client):
+    session_id = start_meditation(client)
+    first_target, _ = playlist(client, session_id)
+    healty_lifestyle.produce_meditation_segments(session_id, limit=2)
+    target, durations = playlist(client, session_id)
+
+    assert target == first_target == healty_lifestyle.MEDITATION_SEGMENT_MINUTES * 60
+    assert len(durations) == 3
+    # Players reload about once per target duration, so segments much
+    # shorter than it leave gaps; longer ones break the playlist
+    for duration in durations:
+        assert target - 1 <= duration and round(duration) <= target
+    # Ten minutes asked for, five planned segments of two minutes each
+    assert len(healty_lifestyle.audio_cache[session_id]['segment_plan']) * target == 10 * 60
+
+
+def test_segments_start_with_their_timestamp(client):
+    session_id = start_meditation(client)
+    healty_lifestyle.produce_meditation_segments(session_id, limit=1)
+    _, durations = playlist(client, session_id)
+
+    first = client.get(f"/guided_meditation/{session_id}/segments/0.mp3").data
+    second = client.get(f"/guided_meditation/{session_id}/segments/1.mp3").data
+    assert first.startswith(timestamp_tag(0.0))
+    assert second.startswith(timestamp_tag(durations[0]))
+
+
+def segmented_rows():
+    rows, _ = healty_lifestyle.SESSION_INDEX.query(healty_lifestyle.SERVICE, type="guided_meditation", limit=200)
+    return [row for row in rows if row.get("delivery") == "segmented"]
+
+
+def test_first_segment_failure_falls_back_to_a_single_file(client, monkeypatch):
+    def fail(*args, **kwargs):
+        raise Exception("TTS unavailable")
+
+    monkeypatch.setattr(healty_lifestyle, "deepgram_text_to_speech_multi", fail)
+    before = segmented_rows()
+    response = client.post("/guided_meditation", json={"duration": 10, "delivery": "segmented"})
+
+    assert response.status_code == 200
+    assert response.json["meditation_script"] == "Breathe slowly. "
+    assert response.json["audio_status"] == "failed"
+    assert "playlist_url" not in response.json
+    # The abandoned segmented session is not left behind
+    assert segmented_rows() == before
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_concurrent_schedules_produce_each_segment_once(client, monkeypatch, mp3):
+    session_id = start_meditation(client)
+    synthesizing = threading.Event()
+    release = threading.Event()
+    parts = []
+
+    def generate(prompt, cacheable=False):
+        parts.append(prompt.split("You are writing part ")[1].split(" ")[0])
+        return "Breathe slowly. "
+
+    def synthesize(text, audio_format, progress=None):
+        synthesizing.set()
+        assert release.wait(5.0)
+        assembly = Mp3Assembly()
+        assembly.append(mp3(2500))
+        return assembly
+
+    monkeypatch.setattr(healty_lifestyle, "generate_gemini_text", generate)
+    monkeypatch.setattr(healty_lifestyle, "deepgram_text_to_speech_multi", synthesize)
+    monkeypatch.setattr(healty_lifestyle, "schedule_meditation_segments", schedule_meditation_segments)
+
+    entry = healty_lifestyle.audio_cache[session_id]
+    schedule_meditation_segments(session_id, entry)
+    assert synthesizing.wait(5.0)
+    # The producer looks stalled, and two requests schedule at once
+    entry['segment_heartbeat'] -= healty_lifestyle.MEDITATION_STALL_SECONDS + 1
+    schedules = [threading.Thread(target=schedule_meditation_segments, args=(session_id, entry)) for _ in range(2)]
+    for thread in schedules:
+        thread.start()
+    for thread in schedules:
+        thread.join()
+    release.set()
+
+    wait_until(lambda: len(healty_lifestyle.audio_cache[session_id]['segments']) == 3
+               and healty_lifestyle.audio_cache[session_id]['segment_status'] == "waiting")
+    assert sorted(parts) == ["2", "3"]
+
+
+def test_a_segment_made_elsewhere_is_not_overwritten(client, monkeypatch, mp3):
+    session_id = start_meditation(client)
+
+    def synthesize(text, audio_format, progress=None):
+        # Another worker stores segment 1 while this one synthesizes it
+        stored = dict(healty_lifestyle.audio_cache[session_id])
+        stored['segments'] = stored['segments'] + [{'text': "elsewhere", 'audio_sha256': "0" * 64,
+                                                    'audio_duration': 120.0}]
+        healty_lifestyle.audio_cache[session_id] = stored
+        assembly = Mp3Assembly()
+        assembly.append(mp3(2500))
+        return assembly
+
+    monkeypatch.setattr(healty_lifestyle, "deepgram_text_to_speech_multi", synthesize)
+    healty_lifestyle.produce_meditation_segments(session_id, limit=1)
+
+    segments = healty_lifestyle.audio_cache[session_id]['segments']
+    assert [segment['text'] for segment in segments[1:]] == ["elsewhere"]
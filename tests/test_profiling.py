@@ -0,0 +1,53 @@
+import pytest
+from flask import Flask
+
+from profiling import PROFILER, instrument_profiling
+
+HEADERS = {"X-Admin-Token": "secret"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    monkeypatch.delenv("PROFILE_DIR", raising=False)
+    app = Flask(__name__)
+    instrument_profiling(app, "test")
+    yield app.test_client()
+    PROFILER.stop()
+
+
+def test_window_opens_and_closes(client):
+    response = client.post("/admin/profiler/start", json={"sample_rate": "0.5", "duration": "30"}, headers=HEADERS)
+    assert response.status_code == 200
+    assert response.json == {"enabled": True, "sample_rate": 0.5}
+
+    response = client.post("/admin/profiler/stop", headers=HEADERS)
+    assert response.status_code == 200
+    assert client.post("/admin/profiler/stop", headers=HEADERS).status_code == 409
+
+
+@pytest.mark.parametrize("settings", [
+    {"duration": "soon"},
+    {"duration": -1},
+    {"duration": "nan"},
+    {"interval_ms": [5]},
+    {"sample_rate": True},
+])
+def test_invalid_settings_are_rejected_without_touching_the_open_window(client, settings):
+    client.post("/admin/profiler/start", json={"sample_rate": 0.25}, headers=HEADERS)
+
+    response = client.post("/admin/profiler/start", json=settings, headers=HEADERS)
+    assert response.status_code == 400
+    assert response.json["error"].startswith("Invalid profiler settings")
+    assert PROFILER.enabled and PROFILER.sample_rate == 0.25
+
+
+def test_output_directory_cannot_be_chosen_by_the_request(client, tmp_path):
+    response = client.post("/admin/profiler/start", json={"output_dir": str(tmp_path)}, headers=HEADERS)
+    assert response.status_code == 400
+    assert not PROFILER.enabled
+
+
+def test_endpoints_are_hidden_without_the_token(client):
+    assert client.post("/admin/profiler/start", json={}).status_code == 404
+    assert not PROFILER.enabled
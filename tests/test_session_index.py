@@ -0,0 +1,86 @@
+import time
+
+import pytest
+from werkzeug.exceptions import BadRequest
+
+from session_index import SessionIndex, entry_metadata
+
+
+@pytest.fixture
+def index():
+    return SessionIndex("test_index")
+
+
+def record_all(index, entries, service="wellness"):
+    for session_id, entry in entries:
+        index.record(service, session_id, entry)
+
+
+def test_keyset_pages_cover_every_row_once_newest_first(index, monkeypatch):
+    # Several rows share a creation time, so the cursor must break ties by id
+    clock = iter([100.0, 100.0, 100.0, 101.0, 102.0, 102.0, 103.0])
+    monkeypatch.setattr(time, "time", lambda: next(clock, 200.0))
+    record_all(index, [(f"s{i}", {'type': 'wellness_chat'}) for i in range(7)])
+
+    seen = []
+    cursor = None
+    while True:
+        rows, cursor = index.query("wellness", limit=3, cursor=cursor)
+        seen.extend(row['session_id'] for row in rows)
+        if cursor is None:
+            break
+
+    assert seen == ["s6", "s5", "s4", "s3", "s2", "s1", "s0"]
+
+
+def test_filters_by_type_session_type_and_time(index, monkeypatch):
+    clock = iter([10.0, 20.0, 30.0, 40.0])
+    monkeypatch.setattr(time, "time", lambda: next(clock, 50.0))
+    record_all(index, [
+        ("yoga-old", {'type': 'yoga_sequence'}),
+        ("sleep", {'type': 'guided_meditation', 'meditation_type': 'sleep'}),
+        ("focus", {'type': 'guided_meditation', 'meditation_type': 'focus'}),
+        ("yoga-new", {'type': 'yoga_sequence'}),
+    ])
+
+    assert [r['session_id'] for r in index.query("wellness", type="yoga_sequence")[0]] == ["yoga-new", "yoga-old"]
+    assert [r['session_id'] for r in index.query("wellness", session_type="sleep")[0]] == ["sleep"]
+    assert [r['session_id'] for r in index.query("wellness", since=20.0, until=40.0)[0]] == ["focus", "sleep"]
+    assert index.query("other_service")[0] == []
+
+
+def test_update_keeps_creation_time(index, monkeypatch):
+    clock = iter([10.0, 20.0])
+    monkeypatch.setattr(time, "time", lambda: next(clock, 30.0))
+    index.record("wellness", "s", {'type': 'wellness_chat', 'audio_job_status': 'queued'})
+    index.record("wellness", "s", {'type': 'wellness_chat', 'audio_job_status': 'ready'})
+
+    (row,), _ = index.query("wellness")
+    assert row['audio_job_status'] == "ready"
+    assert row['created_at'] < row['updated_at']
+
+
+def test_metadata_leaves_out_text_and_audio():
+    metadata = entry_metadata({
+        'type': 'wellness_chat',
+        'response_text': 'long answer',
+        'audio_content': b'ID3',
+        'audio_variants': {'mp3': 'digest'},
+        'user_message': 'x' * 1000,
+    })
+    assert set(metadata) == {'type', 'user_message'}
+    assert len(metadata['user_message']) == 200
+
+
+def test_clear_deletes_only_that_service(index):
+    record_all(index, [("a", {}), ("b", {})], service="wellness")
+    record_all(index, [("c", {})], service="medical")
+
+    assert index.clear("wellness") == 2
+    assert index.query("wellness")[0] == []
+    assert len(index.query("medical")[0]) == 1
+
+
+def test_invalid_cursor_is_a_bad_request(index):
+    with pytest.raises(BadRequest):
+        index.query("wellness", cursor="not-a-cursor")
@@ -0,0 +1,111 @@
+import fcntl
+import random
+import time
+
+import pytest
+
+from audio_assembly import Mp3Assembly
+from shared_store import _SLOT, SharedAudioCache, SharedStore, StoredAudio
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SharedStore(str(tmp_path / "test.store"), capacity=4096, slots=64, ttl=60.0)
+
+
+def test_put_get_replace_and_delete(store):
+    assert store.get("a") is None
+    store.put("a", b"first")
+    store.put("a", b"second")
+    store.put("b", b"other")
+
+    assert store.get("a") == b"second"
+    assert "b" in store
+    assert store.stats()["entries"] == 2
+
+    store.delete("a")
+    assert store.get("a") is None and "a" not in store
+    assert store.get("b") == b"other"
+
+
+def test_ring_overwrites_the_oldest_records(store):
+    for i in range(10):
+        store.put(f"key{i}", bytes([i]) * 1000)
+
+    # Only about four 1000-byte records fit in 4096 bytes
+    assert store.get("key0") is None
+    assert store.get("key9") == bytes([9]) * 1000
+    assert store.stats()["entries"] < 10
+
+
+def test_entries_expire(store, monkeypatch):
+    now = time.time()
+    store.put("short", b"x", ttl=1.0)
+    store.put("long", b"y")
+
+    monkeypatch.setattr(time, "time", lambda: now + 5.0)
+    assert store.get("short") is None
+    assert store.get("long") == b"y"
+
+
+def test_clear_empties_the_store(store):
+    store.put("a", b"1")
+    store.clear()
+    assert store.get("a") is None
+    assert store.stats() == {"entries": 0, "bytes": 0, "capacity": 4096, "slots": 64}
+
+
+def test_a_second_store_on_the_file_sees_the_entries(store):
+    store.put("a", b"shared")
+    other = SharedStore(store.path, capacity=4096, slots=64, ttl=60.0)
+    assert other.get("a") == b"shared"
+
+
+def test_audio_cache_round_trips_metadata_and_audio(store, mp3):
+    cache = SharedAudioCache("test_audio_cache", store)
+    audio = Mp3Assembly()
+    audio.append(mp3(4))
+    cache["session"] = {"type": "yoga_sequence", "duration": 10, "audio_content": audio}
+
+    entry = cache["session"]
+    assert entry["type"] == "yoga_sequence" and entry["duration"] == 10
+    assert isinstance(entry["audio_content"], StoredAudio)
+    assert entry["audio_content"].to_bytes() == audio.to_bytes()
+    assert entry["audio_content"].duration_seconds == pytest.approx(audio.duration_seconds)
+    assert len(cache) == 1
+
+    assert cache.pop("session")["type"] == "yoga_sequence"
+    assert "session" not in cache
+    with pytest.raises(KeyError):
+        cache["session"]
+
+
+def scanned_stats(store):
+    """Live entries and bytes found by scanning every slot, to check the header's counts."""
+    entries = payload = 0
+    with store._locked(fcntl.LOCK_SH) as mm:
+        for index in range(store.slots):
+            slot = _SLOT.unpack_from(mm, store._slot_offset(index))
+            if store._valid(mm, slot, time.time()):
+                entries += 1
+                payload += slot[2]
+    return entries, payload
+
+
+def test_header_counts_match_a_full_scan(store):
+    rng = random.Random(42)
+    for _ in range(500):
+        key = f"key{rng.randrange(40)}"
+        if rng.random() < 0.15:
+            store.delete(key)
+        else:
+            store.put(key, bytes(rng.randrange(1, 600)))
+        stats = store.stats()
+        assert (stats["entries"], stats["bytes"]) == scanned_stats(store)
+
+
+def test_oversize_values_are_skipped(store):
+    store.put("small", b"kept")
+    store.put("huge", bytes(store.capacity))
+    assert store.get("huge") is None
+    assert store.get("small") == b"kept"
@@ -0,0 +1,141 @@
+import random
+import re
+
+import pytest
+
+from tts_chunking import iter_tts_chunks
+
+LIMITS = (50, 150, 250, 300)
+FUZZ_CASES = 2000
+
+
+def legacy_split_text_for_tts(text, max_chars=300):
+    """
+    The multi-pass splitter that split_text_for_tts used before iter_tts_chunks,
+    minus its per-chunk prints. One deliberate difference: the pending sentence
+    chunk is flushed before an over-long sentence is split, so chunks come out
+    in text order (the old code emitted the split sentence first).
+    """
+    text = text.strip()
+    if not text:
+        return []
+    text = re.sub(r'\s+', ' ', text)
+    chunks = []
+    for paragraph in text.split('\n\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            chunks.append(paragraph)
+            continue
+        sentences = re.split(r'(?<=[.!?])\s+', paragraph)
+        current_chunk = ""
+        for sentence in sentences:
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if len(sentence) > max_chars:
+                if current_chunk:
+                    chunks.append(current_chunk.strip())
+                    current_chunk = ""
+                for part in re.split(r'[,;:]\s+', sentence):
+                    part = part.strip()
+                    if len(part) > max_chars:
+                        temp_chunk = ""
+                        for word in part.split():
+                            if len(temp_chunk + " " + word) <= max_chars:
+                                temp_chunk = temp_chunk + " " + word if temp_chunk else word
+                            else:
+                                if temp_chunk:
+                                    chunks.append(temp_chunk.strip())
+                                temp_chunk = word
+                        if temp_chunk:
+                            chunks.append(temp_chunk.strip())
+                    else:
+                        chunks.append(part)
+                continue
+            test_chunk = current_chunk + " " + sentence if current_chunk else sentence
+            if len(test_chunk) <= max_chars:
+                current_chunk = test_chunk
+            else:
+                if current_chunk:
+                    chunks.append(current_chunk.strip())
+                current_chunk = sentence
+        if current_chunk:
+            chunks.append(current_chunk.strip())
+
+    validated_chunks = []
+    for chunk in chunks:
+        chunk = chunk.strip()
+        if chunk and len(chunk) <= max_chars:
+            validated_chunks.append(chunk)
+        elif chunk:
+            temp_chunk = ""
+            for word in chunk.split():
+                if len(temp_chunk + " " + word) <= max_chars:
+                    temp_chunk = temp_chunk + " " + word if temp_chunk else word
+                else:
+                    if temp_chunk:
+                        validated_chunks.append(temp_chunk.strip())
+                    temp_chunk = word[:max_chars]
+            if temp_chunk:
+                validated_chunks.append(temp_chunk.strip())
+    return validated_chunks
+
+
+CORPUS = [
+    "",
+    "   \n\n  ",
+    "Hello.",
+    "Short answer that easily fits.",
+    "First paragraph here.\n\nSecond paragraph, with a clause; and another: done.",
+    "One sentence. " * 60,
+    "word " * 400,
+    "x" * 700,
+    "Leading clause, " + "y" * 400 + ", trailing clause.",
+    "A normal opener. " + ("long clause without stops " * 30) + "and a close. Final words!",
+    ", starts with a comma and keeps going " * 20,
+    "Question? Exclamation! Statement.   Tabs\tand\nnewlines\r\neverywhere.",
+    "Ends with punctuation and spaces.   ",
+    "Mixed: colon; semicolon, comma. " * 40,
+]
+
+
+def _random_text(rng):
+    pieces = []
+    for _ in range(rng.randint(0, 80)):
+        roll = rng.random()
+        if roll < 0.65:
+            pieces.append("".join(rng.choice("abcdefghij") for _ in range(rng.randint(1, 12))))
+        elif roll < 0.72:
+            pieces.append("z" * rng.randint(20, 400))
+        else:
+            pieces.append(rng.choice([".", "!", "?", ",", ";", ":", "\n\n", "\t", "  ", ". ", ", "]))
+    return rng.choice(["", " "]).join(pieces)
+
+
+def assert_matches_legacy(text, max_chars):
+    chunks = list(iter_tts_chunks(text, max_chars))
+    assert chunks == legacy_split_text_for_tts(text, max_chars)
+    assert all(len(chunk) <= max_chars for chunk in chunks)
+
+
+@pytest.mark.parametrize("max_chars", LIMITS)
+@pytest.mark.parametrize("text", CORPUS)
+def test_matches_the_legacy_splitter(text, max_chars):
+    assert_matches_legacy(text, max_chars)
+
+
+def test_matches_the_legacy_splitter_on_random_text():
+    rng = random.Random(0)
+    for _ in range(FUZZ_CASES):
+        assert_matches_legacy(_random_text(rng), rng.choice([20, 50, 150, 250]))
+
+
+def test_pending_sentences_are_flushed_before_an_over_long_one():
+    text = "Short one. " + "x" * 30 + " end. Tail."
+    assert list(iter_tts_chunks(text, 20)) == ["Short one.", "x" * 20, "end.", "Tail."]
+
+
+def test_over_long_words_are_cut():
+    assert list(iter_tts_chunks("ab " + "y" * 25 + " cd", 10)) == ["ab", "y" * 10, "cd"]
@@ -0,0 +1,131 @@
+import json
+import queue
+import threading
+
+import pytest
+
+from tts_limits import AdaptiveChunkSizer, TtsPayloadTooLarge
+from voice_stream import ConnectionClosed, ScriptedStt, VoiceEndpoint, VoiceSession
+
+TIMEOUT = 5.0
+
+
+class FakeWebSocket:
+    """The client end of a voice WebSocket: queued messages in, recorded events out."""
+
+    def __init__(self):
+        self.incoming = queue.Queue()
+        self.events = []
+        self.audio = []
+        self._changed = threading.Condition()
+
+    def receive(self):
+        message = self.incoming.get(timeout=TIMEOUT)
+        if message is ConnectionClosed:
+            raise ConnectionClosed()
+        return message
+
+    def send(self, data):
+        with self._changed:
+            if isinstance(data, bytes):
+                self.audio.append(data)
+            else:
+                self.events.append(json.loads(data))
+            self._changed.notify_all()
+
+    def say(self, audio=b"\x00" * 320):
+        """Speak one utterance, push-to-talk style."""
+        self.incoming.put(audio)
+        self.incoming.put(json.dumps({"type": "stop"}))
+
+    def close(self):
+        self.incoming.put(ConnectionClosed)
+
+    def wait_for(self, predicate):
+        with self._changed:
+            assert self._changed.wait_for(lambda: predicate(self.events), timeout=TIMEOUT), self.events
+
+    def of_type(self, kind):
+        return [event for event in self.events if event["type"] == kind]
+
+
+def start_session(ws, endpoint):
+    thread = threading.Thread(target=VoiceSession(ws, endpoint).run, daemon=True)
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def sizer():
+    return AdaptiveChunkSizer("test_voice", path=None)
+
+
+def test_barge_in_cancels_the_playing_reply(mp3, sizer):
+    stt = ScriptedStt(["Tell me about sleep.", "Actually, about headaches."])
+    first_reply_spoken = threading.Event()
+    resume_first_reply = threading.Event()
+
+    def respond(text):
+        if text == "Tell me about sleep.":
+            yield "Sleep matters a great deal for your health. "
+            first_reply_spoken.wait(TIMEOUT)
+            resume_first_reply.wait(TIMEOUT)
+            yield "This part is never spoken. "
+        else:
+            yield "Headaches have many causes. "
+            yield "Drink some water and rest."
+
+    def synthesize(text):
+        if text.startswith("Sleep"):
+            first_reply_spoken.set()
+        return mp3(5)
+
+    ws = FakeWebSocket()
+    session = start_session(ws, VoiceEndpoint(stt, respond, synthesize, sizer))
+    ws.wait_for(lambda events: events and events[0]["type"] == "ready")
+
+    ws.say()
+    ws.wait_for(lambda events: any(e["type"] == "audio" for e in events))
+
+    # Talking over the reply starts the next one and stops the first
+    ws.say()
+    ws.wait_for(lambda events: any(e["type"] == "response_end" for e in events))
+    resume_first_reply.set()
+    ws.close()
+    session.join(TIMEOUT)
+
+    assert [e["text"] for e in ws.of_type("utterance_end")] == ["Tell me about sleep.", "Actually, about headaches."]
+    assert len(ws.of_type("response_start")) == 2
+    (end,) = ws.of_type("response_end")
+    assert end["text"] == "Headaches have many causes. Drink some water and rest."
+    assert end["audio_duration"] > 0
+    assert not any("never spoken" in e.get("text", "") for e in ws.events)
+
+    # Every audio event is followed by exactly the bytes it announced
+    announced = [e["bytes"] for e in ws.of_type("audio")]
+    assert announced == [len(audio) for audio in ws.audio]
+    assert all(b"ID3" not in audio for audio in ws.audio)
+
+
+def test_reply_chunks_back_off_to_the_voice_limit(mp3, sizer):
+    sent = []
+
+    def synthesize(text):
+        if len(text) > 120:
+            raise TtsPayloadTooLarge(len(text))
+        sent.append(text)
+        return mp3(2)
+
+    reply = " ".join(f"Sentence number {i} of a long answer about staying well." for i in range(12))
+    ws = FakeWebSocket()
+    session = start_session(ws, VoiceEndpoint(ScriptedStt(["Question."]), lambda text: iter([reply]), synthesize, sizer))
+
+    ws.say()
+    ws.wait_for(lambda events: any(e["type"] in ("response_end", "error") for e in events))
+    ws.close()
+    session.join(TIMEOUT)
+
+    assert ws.of_type("response_end") and not ws.of_type("error")
+    assert " ".join(sent) == reply
+    assert all(len(text) <= 120 for text in sent)
+    assert sizer.smallest_rejected is not None and sizer.smallest_rejected > 120
@@ -0,0 +1,120 @@
+"""
+Lightweight per-request spans, reported as a Server-Timing header.
+
+Code on the request path wraps interesting work in `span("name")`; pipeline
+stages timed through metrics.time_stage are recorded automatically. After the
+request, `instrument_tracing` turns the collected spans into a Server-Timing
+header and, for a sampled fraction of requests (TRACE_SAMPLE_RATE, default 0),
+a structured "trace" log record.
+"""
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTrace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []  # (name, start offset, duration) in seconds
+
+    def add(self, name, start, duration):
+        self.spans.append((name, start - self.start, duration))
+
+    def server_timing(self, total):
+        counts = {}
+        for name, _, _ in self.spans:
+            counts[name] = counts.get(name, 0) + 1
+
+        seen = {}
+        parts = []
+        for name, _, duration in self.spans:
+            if counts[name] > 1:
+                seen[name] = seen.get(name, 0) + 1
+                name = f"{name}_{seen[name]}"
+            parts.append(f"{name};dur={duration * 1000:.1f}")
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def _current_trace():
+    if not has_request_context():
+        return None
+    return g.get("_trace")
+
+
+def record_span(name, duration, start=None):
+    """Attach a finished span to the current request, if there is one."""
+    trace = _current_trace()
+    if trace is not None:
+        if start is None:
+            start = time.perf_counter() - duration
+        trace.add(name, start, duration)
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as a span of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start, start)
+
+
+def timed_iter(iterable, name):
+    """
+    Yield from `iterable`, recording the total time spent producing items
+    as one span. Useful for lazy producers such as iter_tts_chunks.
+    """
+    iterator = iter(iterable)
+    first_start = time.perf_counter()
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                return
+            elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        record_span(name, elapsed, first_start)
+
+
+def instrument_tracing(app, service):
+    """Collect spans for every request of `app` and emit Server-Timing."""
+    sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+
+    @app.before_request
+    def _trace_start():
+        g._trace = RequestTrace()
+
+    @app.after_request
+    def _trace_finish(response):
+        trace = g.pop("_trace", None)
+        if trace is None:
+            return response
+        total = time.perf_counter() - trace.start
+        response.headers["Server-Timing"] = trace.server_timing(total)
+        response.headers["Timing-Allow-Origin"] = "*"
+
+        if sample_rate and random.random() < sample_rate:
+            logger.info("trace", extra={
+                "service": service,
+                "endpoint": request.endpoint,
+                "status": response.status_code,
+                "total_ms": round(total * 1000, 1),
+                "spans": [
+                    {"name": name, "offset_ms": round(offset * 1000, 1), "duration_ms": round(duration * 1000, 1)}
+                    for name, offset, duration in trace.spans
+                ],
+            })
+        return response
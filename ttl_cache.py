@@ -0,0 +1,129 @@
+"""
+Bounded in-memory caches with per-entry expiry and LRU eviction.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import CACHE_STALE_SERVED, record_cache_lookup, track_cache
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Thread-safe mapping holding at most `max_entries` values for `ttl` seconds.
+
+    Lookups are reported to /metrics under `name`. The least recently used
+    entry is evicted when the cache is full; expired entries are dropped
+    when they are looked up or when room is needed.
+    """
+
+    def __init__(self, name, max_entries=512, ttl=3600.0, size_of=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        track_cache(name, self, size_of=size_of)
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        record_cache_lookup(self.name, entry is not None)
+        return default if entry is None else entry[1]
+
+    def put(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._evict(time.monotonic())
+
+    def _evict(self, now):
+        for key in [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def values(self):
+        with self._lock:
+            return [value for _, value in self._entries.values()]
+
+
+class StaleWhileRevalidateCache(TTLCache):
+    """
+    Cache of computed values that are fresh for `ttl` seconds and may then be
+    served stale for `stale_ttl` more while one background call refreshes
+    them. Misses are computed through a SingleFlight, so concurrent callers
+    of a cold or expired key wait for one call instead of stampeding.
+    """
+
+    def __init__(self, name, max_entries=512, ttl=600.0, stale_ttl=3600.0, size_of=None):
+        super().__init__(
+            name, max_entries=max_entries, ttl=ttl + stale_ttl,
+            size_of=(lambda entry: size_of(entry[1])) if size_of else None,
+        )
+        self.fresh_ttl = ttl
+        self._flight = SingleFlight(name)
+        self._refreshing = set()
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for `key`, calling compute() when there is none."""
+        entry = self.get(key)
+        if entry is None:
+            return self._flight.do(key, self._load, key, compute)
+
+        fresh_until, value = entry
+        if fresh_until <= time.monotonic():
+            CACHE_STALE_SERVED.inc(cache=self.name)
+            self._refresh(key, compute)
+        return value
+
+    def _load(self, key, compute):
+        value = compute()
+        self.put(key, (time.monotonic() + self.fresh_ttl, value))
+        return value
+
+    def _refresh(self, key, compute):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._flight.do(key, self._load, key, compute)
+            except Exception as e:
+                # Keep serving the stale value; the next lookup retries
+                logger.warning("⚠️ Background refresh failed for %s: %s", self.name, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f"{self.name}-refresh", daemon=True).start()
@@ -0,0 +1,101 @@
+import re
+
+# Compiled once at import; split_text_for_tts used to re-interpret these on every call.
+_SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?])\s+')
+_CLAUSE_BOUNDARY_RE = re.compile(r'[,;:]\s+')
+
+
+def _iter_split(pattern, text):
+    """
+    Lazy equivalent of pattern.split(text) for patterns without groups.
+    """
+    start = 0
+    for match in pattern.finditer(text):
+        yield text[start:match.start()]
+        start = match.end()
+    yield text[start:]
+
+
+def _iter_word_chunks(text, max_chars):
+    """
+    Greedily pack words into chunks of at most max_chars.
+    Words longer than max_chars are cut to max_chars.
+    """
+    words = []
+    length = 0
+    for word in text.split():
+        if words and length + 1 + len(word) <= max_chars:
+            words.append(word)
+            length += 1 + len(word)
+            continue
+        if words:
+            yield ' '.join(words)
+        if len(word) > max_chars:
+            yield word[:max_chars]
+            words = []
+            length = 0
+        else:
+            words = [word]
+            length = len(word)
+    if words:
+        yield ' '.join(words)
+
+
+def iter_tts_chunks(text, max_chars=300):
+    """
+    Yield TTS-sized chunks of text in a single pass.
+
+    Boundaries are chosen paragraph first, then sentence, clause and word,
+    so every chunk is at most max_chars long. Chunks are produced lazily,
+    which lets a streaming TTS consumer start synthesizing the first chunk
+    before the rest of the text has been split.
+    """
+    # Whitespace (including paragraph breaks) is normalized to single spaces,
+    # so the whole text is treated as one paragraph. str.split() matches the
+    # same characters as re's \s and is several times faster than re.sub.
+    text = ' '.join(text.split())
+    if not text:
+        return
+
+    if len(text) <= max_chars:
+        yield text
+        return
+
+    # Sentences are accumulated into the pending chunk; the list is joined
+    # once per chunk instead of re-concatenating the string per sentence.
+    pending = []
+    pending_len = 0
+
+    for sentence in _iter_split(_SENTENCE_BOUNDARY_RE, text):
+        if not sentence:
+            continue
+
+        if len(sentence) > max_chars:
+            # Flush first so the audio keeps the original sentence order.
+            if pending:
+                yield ' '.join(pending)
+                pending = []
+                pending_len = 0
+
+            # Over-long sentences are split on clause punctuation, and
+            # over-long clauses on word boundaries.
+            for part in _iter_split(_CLAUSE_BOUNDARY_RE, sentence):
+                part = part.strip()
+                if len(part) > max_chars:
+                    yield from _iter_word_chunks(part, max_chars)
+                elif part:
+                    yield part
+            continue
+
+        added = len(sentence) + 1 if pending else len(sentence)
+        if pending_len + added <= max_chars:
+            pending.append(sentence)
+            pending_len += added
+        else:
+            if pending:
+                yield ' '.join(pending)
+            pending = [sentence]
+            pending_len = len(sentence)
+
+    if pending:
+        yield ' '.join(pending)
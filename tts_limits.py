@@ -0,0 +1,212 @@
+"""
+Adaptive TTS chunk sizing.
+
+Deepgram rejects over-long text with a 413, and the limit is not the same for
+every voice. Rather than guessing a fixed chunk size, each voice gets an
+AdaptiveChunkSizer that remembers the longest text accepted and the shortest
+text rejected. New chunks grow toward the real limit while only acceptances
+have been seen, probe between the two bounds once a rejection is known, and
+back off when a chunk is rejected; the rejected chunk is split again at the
+smaller size, so no text is dropped. What was learned is saved to a JSON file
+and reloaded at startup.
+
+Environment variables:
+    TTS_CHUNK_INITIAL   chunk size before anything is known (250)
+    TTS_CHUNK_MIN       chunks are never split below this size (100)
+    TTS_CHUNK_MAX       chunks never grow past this size (2000)
+    TTS_LIMITS_FILE     JSON file learned limits are kept in (tts_limits.json);
+                        set it empty to keep them in memory only
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from metrics import counter, gauge
+from tts_chunking import iter_tts_chunks
+
+logger = logging.getLogger(__name__)
+
+INITIAL_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_INITIAL", 250))
+MIN_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_MIN", 100))
+MAX_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_MAX", 2000))
+LIMITS_FILE = os.getenv("TTS_LIMITS_FILE", "tts_limits.json")
+
+# Chunks grow by this factor while no rejection has been seen
+GROWTH = 1.5
+# Stop probing once the bounds are this close (fraction of the rejected size)
+TOLERANCE = 0.05
+
+TTS_CHUNK_LIMITS = gauge(
+    "symptocheck_tts_chunk_chars",
+    "Learned TTS payload limits in characters, by voice and bound.",
+    ("voice", "bound"),
+)
+TTS_PAYLOAD_REJECTED = counter(
+    "symptocheck_tts_payload_rejected_total",
+    "TTS chunks rejected as too large and split again.",
+    ("voice",),
+)
+
+_sizers = {}
+_file_lock = threading.Lock()
+
+
+class TtsPayloadTooLarge(Exception):
+    """The TTS API rejected `length` characters of text as too large (413)."""
+
+    def __init__(self, length):
+        self.length = length
+        super().__init__(f"Text payload too large ({length} chars). Deepgram rejected it.")
+
+
+def _load_limits(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning("⚠️ Ignoring unreadable TTS limits file %s: %s", path, e)
+        return {}
+
+
+def _save_limits(path, name, limits):
+    """Merge one voice's limits into the file, replacing it atomically."""
+    with _file_lock:
+        saved = _load_limits(path)
+        saved[name] = limits
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=".tts_limits.", dir=directory)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(saved, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("⚠️ Could not save TTS limits to %s: %s", path, e)
+
+
+class AdaptiveChunkSizer:
+    """
+    Learned payload limit of one TTS voice.
+
+    `largest_accepted` is the longest text synthesized successfully and
+    `smallest_rejected` the shortest rejected with a 413 (None until one is
+    seen); the real limit lies between them.
+    """
+
+    def __init__(self, name, initial=INITIAL_CHUNK_CHARS, minimum=MIN_CHUNK_CHARS,
+                 maximum=MAX_CHUNK_CHARS, path=LIMITS_FILE):
+        self.name = name
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.path = path
+        self.largest_accepted = 0
+        self.smallest_rejected = None
+        self._lock = threading.Lock()
+        if path:
+            saved = _load_limits(path).get(name, {})
+            self.largest_accepted = int(saved.get("largest_accepted") or 0)
+            rejected = saved.get("smallest_rejected")
+            self.smallest_rejected = int(rejected) if rejected else None
+
+    def chunk_size(self):
+        """Largest chunk to send next, in characters."""
+        with self._lock:
+            accepted, rejected = self.largest_accepted, self.smallest_rejected
+        if rejected is None:
+            size = max(self.initial, int(accepted * GROWTH))
+            upper = self.maximum
+        else:
+            upper = min(self.maximum, rejected - 1)
+            if rejected - accepted <= rejected * TOLERANCE:
+                size = accepted
+            else:
+                # Probe halfway, but never grow faster than without a rejection
+                size = (accepted + rejected) // 2
+                if accepted:
+                    size = min(size, int(accepted * GROWTH))
+        return max(self.minimum, min(size, upper))
+
+    def record_accepted(self, length):
+        with self._lock:
+            if length <= self.largest_accepted:
+                return
+            self.largest_accepted = length
+            if self.smallest_rejected is not None and length >= self.smallest_rejected:
+                # The limit was raised upstream; start probing again
+                self.smallest_rejected = None
+            limits = self._limits()
+        self._save(limits)
+
+    def record_rejected(self, length):
+        TTS_PAYLOAD_REJECTED.inc(voice=self.name)
+        with self._lock:
+            if self.smallest_rejected is not None and length >= self.smallest_rejected:
+                return
+            self.smallest_rejected = length
+            if self.largest_accepted >= length:
+                # The limit was lowered upstream; what was accepted no longer holds
+                self.largest_accepted = 0
+            limits = self._limits()
+        logger.info("📏 TTS voice %s rejected %d chars; next chunks at most %d",
+                    self.name, length, self.chunk_size())
+        self._save(limits)
+
+    def _limits(self):
+        return {"largest_accepted": self.largest_accepted, "smallest_rejected": self.smallest_rejected}
+
+    def _save(self, limits):
+        if self.path:
+            _save_limits(self.path, self.name, limits)
+
+
+def chunk_sizer(name):
+    """The shared AdaptiveChunkSizer for voice `name`."""
+    sizer = _sizers.get(name)
+    if sizer is None:
+        sizer = _sizers.setdefault(name, AdaptiveChunkSizer(name))
+    return sizer
+
+
+def _limit_samples():
+    samples = {}
+    for sizer in list(_sizers.values()):
+        samples[(sizer.name, "chunk_size")] = sizer.chunk_size()
+        samples[(sizer.name, "largest_accepted")] = sizer.largest_accepted
+        if sizer.smallest_rejected is not None:
+            samples[(sizer.name, "smallest_rejected")] = sizer.smallest_rejected
+    return samples
+
+
+TTS_CHUNK_LIMITS.set_function(_limit_samples)
+
+
+def synthesize_within_limit(text, synthesize, sizer):
+    """
+    Synthesize one chunk of text, returning a list of audio segments.
+
+    Chunks longer than the sizer's current chunk size (it may have backed off
+    since the text was split) are split again first. A chunk rejected as too
+    large is recorded with the sizer and split at the backed-off size; chunks
+    that fit are recorded as accepted. Raises TtsPayloadTooLarge when even a
+    chunk of the minimum size is rejected.
+    """
+    if len(text) <= sizer.chunk_size():
+        try:
+            audio = synthesize(text)
+        except TtsPayloadTooLarge:
+            sizer.record_rejected(len(text))
+            if len(text) <= sizer.minimum:
+                raise
+        else:
+            sizer.record_accepted(len(text))
+            return [audio]
+
+    size = min(sizer.chunk_size(), len(text) - 1)
+    segments = []
+    for piece in iter_tts_chunks(text, max_chars=size):
+        segments.extend(synthesize_within_limit(piece, synthesize, sizer))
+    return segments
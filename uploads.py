@@ -0,0 +1,117 @@
+"""
+Bounded, disk-spooled audio uploads that are streamed on to Deepgram.
+
+`configure_uploads` sets MAX_CONTENT_LENGTH, so Werkzeug rejects oversized
+bodies with a 413 while reading them (also for chunked requests without a
+Content-Length), and installs a request class whose file parts are spooled
+to disk once they outgrow UPLOAD_SPOOL_BYTES. `UploadBody` then hands the
+spooled file to `requests` as a raw body with a known length, so it is sent
+in small blocks instead of being re-encoded into an in-memory multipart body.
+
+Uploaded files are hashed (SHA-256) while they are spooled, so content-keyed
+caches such as the transcript cache get a digest without a second read.
+"""
+import hashlib
+import mimetypes
+import os
+from tempfile import SpooledTemporaryFile
+
+from flask import Request
+
+# Multipart boundaries, part headers and small form fields on top of the file
+UPLOAD_OVERHEAD = 64 * 1024
+SPOOL_MAX_MEMORY = int(os.getenv("UPLOAD_SPOOL_BYTES", 512 * 1024))
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class HashingSpool:
+    """SpooledTemporaryFile that keeps a SHA-256 of everything written to it."""
+
+    def __init__(self, max_size=SPOOL_MAX_MEMORY):
+        self._file = SpooledTemporaryFile(max_size=max_size, mode="w+b")
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class SpoolingRequest(Request):
+    """Request whose uploaded files stay in memory only while they are small."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpool()
+
+
+def configure_uploads(app, max_file_size):
+    """Enforce the upload cap while reading and spool large files to disk."""
+    app.request_class = SpoolingRequest
+    app.config["MAX_CONTENT_LENGTH"] = max_file_size + UPLOAD_OVERHEAD
+
+
+def upload_size(file_storage):
+    """Size of an uploaded file; seeking a spooled file does not read it."""
+    stream = file_storage.stream
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def upload_digest(file_storage):
+    """SHA-256 hex digest of an uploaded file's content."""
+    stream = file_storage.stream
+    if isinstance(stream, HashingSpool):
+        return stream.hexdigest()
+    # Not spooled by SpoolingRequest: hash it in blocks and rewind
+    digest = hashlib.sha256()
+    position = stream.tell()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(STREAM_BLOCK_SIZE), b""):
+        digest.update(block)
+    stream.seek(position)
+    return digest.hexdigest()
+
+
+def upload_content_type(file_storage):
+    mimetype = file_storage.mimetype
+    if mimetype and mimetype.startswith("audio/"):
+        return mimetype
+    guessed, _ = mimetypes.guess_type(file_storage.filename or "")
+    if guessed and guessed.startswith("video/"):
+        # .webm maps to video/webm; the upload is an audio-only recording
+        guessed = "audio/" + guessed.split("/", 1)[1]
+    return guessed or "audio/*"
+
+
+class UploadBody:
+    """
+    File-like request body for `requests`.
+
+    `requests` sends bodies that have a length and a read() method in blocks,
+    with a Content-Length header. Passing the spooled file directly would make
+    it call fileno(), which forces a SpooledTemporaryFile onto disk.
+    """
+
+    def __init__(self, file_storage):
+        self._stream = file_storage.stream
+        self._stream.seek(0)
+        self._length = upload_size(file_storage)
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=STREAM_BLOCK_SIZE):
+        if size is None or size < 0:
+            size = STREAM_BLOCK_SIZE
+        return self._stream.read(size)
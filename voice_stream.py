@@ -0,0 +1,377 @@
+"""
+Full-duplex voice conversations over a WebSocket.
+
+The client streams audio while the user speaks; the audio is forwarded to a
+streaming STT backend as it arrives. When the backend reports the end of an
+utterance, the reply is generated with a streaming LLM call, and each
+complete sentence is synthesized and sent back on the same socket while the
+rest of the reply is still being generated. Speaking again while a reply is
+playing cancels it (barge-in).
+
+Protocol (text messages are JSON):
+    client -> server
+        {"type": "start", "encoding": "linear16", "sample_rate": 16000, "channels": 1}
+            optional; describes raw audio. Containerized audio (webm, ogg, ...) needs no options.
+        <binary>                 audio data
+        {"type": "stop"}         the user stopped talking (push-to-talk release)
+        {"type": "cancel"}       stop the reply that is playing
+    server -> client
+        {"type": "ready"}
+        {"type": "transcript", "text": ..., "final": bool}
+        {"type": "utterance_end", "text": ...}
+        {"type": "response_start"}
+        {"type": "response_text", "text": ...}     streamed reply text
+        {"type": "audio", "format": "audio/mpeg", "bytes": n} followed by n bytes of MP3 frames
+        {"type": "response_end", "text": ..., "audio_duration": seconds}
+        {"type": "error", "error": ...}
+
+STT backends implement open(on_event, options) and return a session with
+send(audio), end_utterance() and close(). on_event(kind, text) is called
+with kind "partial", "final" or "utterance_end". DeepgramStreamingStt talks
+to Deepgram's live API; ScriptedStt is a local stand-in for tests and demos.
+
+Environment variables:
+    VOICE_STT_BACKEND        "deepgram" (default) or "local"
+    VOICE_LOCAL_TRANSCRIPTS  "|"-separated transcripts for the local backend
+"""
+import json
+import logging
+import os
+import re
+import threading
+from urllib.parse import urlencode
+
+from audio_assembly import Mp3Assembly
+from tts_chunking import iter_tts_chunks
+from tts_limits import synthesize_within_limit
+
+try:
+    from flask_sock import Sock
+    from simple_websocket import Client as WebSocketClient, ConnectionClosed
+except ImportError:  # the voice endpoint is not registered without flask-sock
+    Sock = None
+    WebSocketClient = None
+    ConnectionClosed = Exception
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END_RE = re.compile(r'[.!?](?=\s)')
+
+# Start speaking once this much complete text is available; later pieces are
+# batched up to the voice's learned TTS chunk size.
+FIRST_SPEAK_CHARS = 40
+
+
+class ScriptedStt:
+    """
+    Local stand-in for a streaming STT service.
+
+    Every utterance that ends with audio received (a client "stop" message)
+    is transcribed as the next scripted transcript, cycling through them.
+    """
+
+    def __init__(self, transcripts=("I have had a headache since yesterday.",)):
+        self.transcripts = list(transcripts)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _take(self):
+        with self._lock:
+            transcript = self.transcripts[self._next % len(self.transcripts)]
+            self._next += 1
+        return transcript
+
+    def open(self, on_event, options):
+        return _ScriptedSession(self, on_event)
+
+
+class _ScriptedSession:
+    def __init__(self, backend, on_event):
+        self._backend = backend
+        self._on_event = on_event
+        self._received = 0
+
+    def send(self, audio):
+        self._received += len(audio)
+
+    def end_utterance(self):
+        if not self._received:
+            return
+        self._received = 0
+        transcript = self._backend._take()
+        self._on_event("final", transcript)
+        self._on_event("utterance_end", transcript)
+
+    def close(self):
+        pass
+
+
+class DeepgramStreamingStt:
+    """Deepgram live transcription over its WebSocket API."""
+
+    url = "wss://api.deepgram.com/v1/listen"
+
+    def __init__(self, api_key, model="nova-2", utterance_end_ms=1000):
+        self.api_key = api_key
+        self.model = model
+        self.utterance_end_ms = utterance_end_ms
+
+    def open(self, on_event, options):
+        if WebSocketClient is None:
+            raise RuntimeError("simple-websocket is required for streaming STT")
+        params = {
+            "model": self.model,
+            "smart_format": "true",
+            "punctuate": "true",
+            "interim_results": "true",
+            "vad_events": "true",
+            "utterance_end_ms": self.utterance_end_ms,
+        }
+        for key in ("encoding", "sample_rate", "channels"):
+            if options.get(key):
+                params[key] = options[key]
+        ws = WebSocketClient.connect(
+            f"{self.url}?{urlencode(params)}",
+            headers={"Authorization": f"Token {self.api_key}"},
+        )
+        return _DeepgramSession(ws, on_event)
+
+
+class _DeepgramSession:
+    def __init__(self, ws, on_event):
+        self._ws = ws
+        self._on_event = on_event
+        self._finals = []
+        self._reader = threading.Thread(target=self._read, name="deepgram-stt", daemon=True)
+        self._reader.start()
+
+    def send(self, audio):
+        self._ws.send(audio)
+
+    def end_utterance(self):
+        # Flush: Deepgram answers with final results marked from_finalize
+        self._ws.send(json.dumps({"type": "Finalize"}))
+
+    def close(self):
+        try:
+            self._ws.send(json.dumps({"type": "CloseStream"}))
+            self._ws.close()
+        except ConnectionClosed:
+            pass
+
+    def _flush(self):
+        text = " ".join(self._finals).strip()
+        self._finals = []
+        if text:
+            self._on_event("utterance_end", text)
+
+    def _read(self):
+        try:
+            while True:
+                message = self._ws.receive()
+                if message is None:
+                    continue
+                event = json.loads(message)
+                if event.get("type") == "UtteranceEnd":
+                    self._flush()
+                    continue
+                if event.get("type") != "Results":
+                    continue
+                alternatives = event.get("channel", {}).get("alternatives") or [{}]
+                transcript = alternatives[0].get("transcript", "")
+                if event.get("is_final"):
+                    if transcript:
+                        self._finals.append(transcript)
+                        self._on_event("final", transcript)
+                    if event.get("speech_final") or event.get("from_finalize"):
+                        self._flush()
+                elif transcript:
+                    self._on_event("partial", transcript)
+        except ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.exception("❌ Streaming STT error: %s", e)
+
+
+def stt_backend_from_env(api_key):
+    if os.getenv("VOICE_STT_BACKEND", "deepgram") == "local":
+        transcripts = os.getenv("VOICE_LOCAL_TRANSCRIPTS")
+        return ScriptedStt(transcripts.split("|")) if transcripts else ScriptedStt()
+    return DeepgramStreamingStt(api_key)
+
+
+def _split_speakable(text, minimum):
+    """Split text after its last sentence end, if the head is long enough."""
+    end = None
+    for match in _SENTENCE_END_RE.finditer(text):
+        end = match.end()
+    if end is None or end < minimum:
+        return "", text
+    return text[:end], text[end:]
+
+
+class VoiceSession:
+    """One WebSocket conversation: STT session in, streamed replies out."""
+
+    def __init__(self, ws, endpoint):
+        self.ws = ws
+        self.endpoint = endpoint
+        self.stt = None
+        self._send_lock = threading.Lock()
+        self._reply_lock = threading.Lock()
+        self._reply_cancel = None
+
+    def send_event(self, kind, **fields):
+        self._send(json.dumps({"type": kind, **fields}))
+
+    def _send(self, data):
+        with self._send_lock:
+            self.ws.send(data)
+
+    def run(self):
+        try:
+            self.send_event("ready")
+            while True:
+                message = self.ws.receive()
+                if message is None:
+                    continue
+                if isinstance(message, bytes):
+                    if self.stt is None:
+                        self._open_stt({})
+                    self.stt.send(message)
+                    continue
+
+                try:
+                    command = json.loads(message)
+                except ValueError:
+                    self.send_event("error", error="Expected a JSON message")
+                    continue
+                kind = command.get("type")
+                if kind == "start":
+                    self._open_stt(command)
+                elif kind == "stop" and self.stt is not None:
+                    self.stt.end_utterance()
+                elif kind == "cancel":
+                    self._cancel_reply()
+        except ConnectionClosed:
+            pass
+        finally:
+            self._cancel_reply()
+            if self.stt is not None:
+                self.stt.close()
+
+    def _open_stt(self, options):
+        if self.stt is not None:
+            self.stt.close()
+        self.stt = self.endpoint.stt_backend.open(self._on_stt_event, options)
+
+    def _on_stt_event(self, kind, text):
+        try:
+            if kind == "utterance_end":
+                self.send_event("utterance_end", text=text)
+                self._start_reply(text)
+            else:
+                self.send_event("transcript", text=text, final=kind == "final")
+                if kind == "partial":
+                    # The user is talking over the reply
+                    self._cancel_reply()
+        except ConnectionClosed:
+            pass
+
+    def _cancel_reply(self):
+        with self._reply_lock:
+            if self._reply_cancel is not None:
+                self._reply_cancel.set()
+                self._reply_cancel = None
+
+    def _start_reply(self, text):
+        cancel = threading.Event()
+        with self._reply_lock:
+            if self._reply_cancel is not None:
+                self._reply_cancel.set()
+            self._reply_cancel = cancel
+        threading.Thread(target=self._reply, args=(text, cancel), name="voice-reply", daemon=True).start()
+
+    def _reply(self, text, cancel):
+        duration = 0.0
+        spoken = []
+        pending = ""
+        try:
+            self.send_event("response_start")
+            for piece in self.endpoint.respond(text):
+                if cancel.is_set():
+                    return
+                if not piece:
+                    continue
+                self.send_event("response_text", text=piece)
+                spoken.append(piece)
+                pending += piece
+                minimum = FIRST_SPEAK_CHARS if duration == 0.0 else self.endpoint.sizer.chunk_size()
+                ready, pending = _split_speakable(pending, minimum)
+                if ready:
+                    duration += self._speak(ready, cancel)
+            if pending.strip() and not cancel.is_set():
+                duration += self._speak(pending, cancel)
+            if not cancel.is_set():
+                self.send_event("response_end", text="".join(spoken), audio_duration=round(duration, 2))
+        except ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.exception("❌ Voice reply error: %s", e)
+            try:
+                self.send_event("error", error=str(e))
+            except ConnectionClosed:
+                pass
+
+    def _speak(self, text, cancel):
+        # Chunks are sized and re-split like DeepgramVoice.text_to_speech_chunked,
+        # so a reply never trips the voice's payload limit
+        sizer = self.endpoint.sizer
+        duration = 0.0
+        for chunk in iter_tts_chunks(text, max_chars=sizer.chunk_size()):
+            if cancel.is_set():
+                break
+            assembly = Mp3Assembly()
+            for segment in synthesize_within_limit(chunk, self.endpoint.synthesize, sizer):
+                duration += assembly.append(segment)
+            audio = b"".join(assembly.iter_bytes(include_header=False))
+            if cancel.is_set():
+                break
+            with self._send_lock:
+                self.ws.send(json.dumps({"type": "audio", "format": "audio/mpeg", "bytes": len(audio)}))
+                self.ws.send(audio)
+        return duration
+
+
+class VoiceEndpoint:
+    """
+    Settings of a registered voice endpoint. `respond(text)` yields reply
+    text pieces; `synthesize(text)` returns MP3 bytes and `sizer` is the
+    voice's AdaptiveChunkSizer. Any of them can be replaced at runtime, e.g.
+    with a ScriptedStt in tests.
+    """
+
+    def __init__(self, stt_backend, respond, synthesize, sizer):
+        self.stt_backend = stt_backend
+        self.respond = respond
+        self.synthesize = synthesize
+        self.sizer = sizer
+
+
+def register_voice_endpoint(target, route, stt_backend, respond, synthesize, sizer):
+    """
+    Add a WebSocket voice endpoint to `target`, a Flask app or Blueprint;
+    returns its VoiceEndpoint or None.
+    """
+    if Sock is None:
+        logger.warning("⚠️ flask-sock is not installed; %s is disabled", route)
+        return None
+
+    endpoint = VoiceEndpoint(stt_backend, respond, synthesize, sizer)
+
+    # Routes are added straight to the app or blueprint, which is registered as usual
+    @Sock().route(route, bp=target, endpoint=route.strip("/").replace("/", "_"))
+    def voice_stream(ws):
+        VoiceSession(ws, endpoint).run()
+
+    return endpoint